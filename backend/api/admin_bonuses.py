@@ -7,20 +7,11 @@ from backend.models.pending_bonus import PendingBonus
 from backend.models.admin import Admin
 from backend.api.admin import get_current_admin
 from backend.models.user import User
-import httpx
+from backend.services.notification_service import NotificationService
+from backend.services.token_service import TokenService
 
 router = APIRouter(prefix="/admin/bonuses", tags=["Admin Bonuses"])
 
-BOT_URL = "http://bot:8001/notify"
-
-
-async def notify_user(tg_id: int, message: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(BOT_URL, json={"tg_id": tg_id, "message": message})
-        except Exception as e:
-            print(f"⚠ Ошибка при отправке уведомления: {e}")
-
 
 @router.get("/pending", response_model=List[dict])
 async def list_pending_bonuses(admin: Admin = Depends(get_current_admin)):
@@ -66,8 +57,12 @@ async def approve_bonus(
     
     # Начисляем бонус
     referrer = await bonus.referrer
-    referrer.bonus_balance += bonus.bonus_amount
-    await referrer.save()
+    new_balance = await TokenService.credit(
+        referrer.id,
+        bonus.bonus_amount,
+        reason="referral_bonus",
+        idempotency_key=f"referral_bonus:{bonus.id}",
+    )
     
     # Обновляем статус бонуса
     bonus.status = "approved"
@@ -76,7 +71,7 @@ async def approve_bonus(
     await bonus.save()
     
     # Уведомляем реферера
-    await notify_user(
+    await NotificationService.enqueue(
         referrer.tg_id,
         f"🎉 Ваш реферал @{bonus.referred.username} активировал подписку! "
         f"Вам начислено +{bonus.bonus_amount} бонусов на баланс."
@@ -87,7 +82,7 @@ async def approve_bonus(
         "bonus_id": bonus.id,
         "referrer_id": referrer.id,
         "bonus_amount": bonus.bonus_amount,
-        "new_balance": referrer.bonus_balance
+        "new_balance": new_balance
     }
 
 
@@ -5,6 +5,7 @@ from typing import List, Optional
 from backend.models.subscription import AccessGroup
 from backend.models.admin import Admin
 from backend.api.admin import get_current_admin
+from backend.services.profile_cache import ProfileCache
 
 router = APIRouter(prefix="/admin/groups", tags=["Admin Groups"])
 
@@ -74,6 +75,7 @@ async def update_group(
     
     group.name = data.name
     await group.save()
+    await ProfileCache.invalidate_group(group.id)
     
     return {
         "id": group.id,
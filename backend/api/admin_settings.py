@@ -2,10 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from typing import Optional, Dict
 
-from backend.models.settings import Settings
 from backend.models.admin import Admin
 from backend.api.admin import get_current_admin
 from backend.services.settings_service import SettingsService
+from backend.services.result_cache import ResultCacheService
 
 router = APIRouter(prefix="/admin/settings", tags=["Admin Settings"])
 
@@ -30,12 +30,14 @@ class SettingsUpdate(BaseModel):
 @router.get("/prompts")
 async def get_prompt_settings(_: Admin = Depends(get_current_admin)):
     """Получение настроек промптов"""
-    default_prompt = await Settings.filter(key="default_prompt_template").first()
-    product_analysis_prompt = await Settings.filter(key="product_analysis_prompt").first()
+    values = await SettingsService.get_many(
+        ["default_prompt_template", "product_analysis_prompt"],
+        {"default_prompt_template": "", "product_analysis_prompt": ""}
+    )
 
     return {
-        "default_prompt": default_prompt.value if default_prompt else "",
-        "product_analysis_prompt": product_analysis_prompt.value if product_analysis_prompt else ""
+        "default_prompt": values["default_prompt_template"],
+        "product_analysis_prompt": values["product_analysis_prompt"]
     }
 
 
@@ -45,16 +47,7 @@ async def update_default_prompt(
     _: Admin = Depends(get_current_admin)
 ):
     """Обновление шаблона промпта по умолчанию"""
-    setting = await Settings.filter(key="default_prompt_template").first()
-
-    if setting:
-        setting.value = data.template
-        await setting.save()
-    else:
-        await Settings.create(
-            key="default_prompt_template",
-            value=data.template
-        )
+    await SettingsService.set_setting("default_prompt_template", data.template)
 
     return {"message": "Default prompt template updated successfully"}
 
@@ -65,16 +58,7 @@ async def update_analysis_prompt(
     _: Admin = Depends(get_current_admin)
 ):
     """Обновление промпта для анализа продукта"""
-    setting = await Settings.filter(key="product_analysis_prompt").first()
-
-    if setting:
-        setting.value = data.template
-        await setting.save()
-    else:
-        await Settings.create(
-            key="product_analysis_prompt",
-            value=data.template
-        )
+    await SettingsService.set_setting("product_analysis_prompt", data.template)
 
     return {"message": "Analysis prompt template updated successfully"}
 
@@ -82,10 +66,8 @@ async def update_analysis_prompt(
 @router.get("/welcome")
 async def get_welcome_message(_: Admin = Depends(get_current_admin)):
     """Получение приветственного сообщения"""
-    welcome = await Settings.filter(key="welcome_message").first()
-
     return {
-        "message": welcome.value if welcome else "Добро пожаловать!"
+        "message": await SettingsService.get_setting("welcome_message", "Добро пожаловать!")
     }
 
 
@@ -95,16 +77,7 @@ async def update_welcome_message(
     _: Admin = Depends(get_current_admin)
 ):
     """Обновление приветственного сообщения"""
-    setting = await Settings.filter(key="welcome_message").first()
-
-    if setting:
-        setting.value = data.message
-        await setting.save()
-    else:
-        await Settings.create(
-            key="welcome_message",
-            value=data.message
-        )
+    await SettingsService.set_setting("welcome_message", data.message)
 
     return {"message": "Welcome message updated successfully"}
 
@@ -117,16 +90,13 @@ async def get_all_settings(_: Admin = Depends(get_current_admin)):
         logger = logging.getLogger(__name__)
         logger.info("[GET_ALL_SETTINGS] Запрос всех настроек")
         
-        settings = await Settings.all()
+        settings = await SettingsService.get_all()
         logger.info(f"[GET_ALL_SETTINGS] Найдено настроек: {len(settings)}")
 
         result = {}
-        for setting in settings:
+        for key, value in settings.items():
             try:
                 # Модель Settings не имеет поля description, используем только value
-                key = getattr(setting, 'key', 'unknown')
-                value = getattr(setting, 'value', '')
-                
                 result[key] = {
                     "value": value if value else "",
                     "description": ""  # Поле description отсутствует в модели
@@ -156,18 +126,9 @@ async def create_or_update_setting(
     _: Admin = Depends(get_current_admin)
 ):
     """Создание или обновление настройки"""
-    setting = await Settings.filter(key=data.key).first()
-
-    if setting:
-        setting.value = data.value
-        await setting.save()
-        message = "Setting updated successfully"
-    else:
-        await Settings.create(
-            key=data.key,
-            value=data.value
-        )
-        message = "Setting created successfully"
+    exists = await SettingsService.get_setting(data.key) is not None
+    await SettingsService.set_setting(data.key, data.value)
+    message = "Setting updated successfully" if exists else "Setting created successfully"
 
     return {"message": message}
 
@@ -178,15 +139,12 @@ async def delete_setting(
     _: Admin = Depends(get_current_admin)
 ):
     """Удаление настройки"""
-    setting = await Settings.filter(key=key).first()
-
-    if not setting:
+    if not await SettingsService.delete_setting(key):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Setting not found"
         )
 
-    await setting.delete()
     return {"message": "Setting deleted successfully"}
 
 
@@ -237,6 +195,18 @@ async def update_image_model_cost(
     return {"message": f"Стоимость модели {model_type} обновлена"}
 
 
+@router.get("/result-cache")
+async def get_result_cache_stats(_: Admin = Depends(get_current_admin)):
+    """Попадания в кэш результатов генерации (backend и бот)"""
+    return await ResultCacheService.stats()
+
+
+@router.post("/result-cache/purge")
+async def purge_result_cache(_: Admin = Depends(get_current_admin)):
+    """Сбросить кэш результатов генерации во всех воркерах backend и в боте"""
+    return await ResultCacheService.purge()
+
+
 class ChannelBonusUpdate(BaseModel):
     """Схема обновления бонуса за подписку на канал"""
     bonus: int
@@ -5,6 +5,9 @@ from datetime import datetime, timedelta
 from backend.models.subscription import Subscription
 from backend.models.admin import Admin
 from backend.api.admin import get_current_admin
+from backend.core.lookups import get_status
+from backend.services.notification_service import NotificationService
+from backend.services.profile_cache import ProfileCache
 
 router = APIRouter(prefix="/admin/subscriptions", tags=["Admin Subscriptions"])
 
@@ -33,10 +36,7 @@ async def extend_subscription(
             raise HTTPException(status_code=404, detail="Подписка не найдена")
 
         # Получаем статус ACTIVE
-        from backend.models import Status
-        active_status = await Status.get_or_none(type="subscription", code="ACTIVE")
-        if not active_status:
-            active_status = await Status.create(type="subscription", code="ACTIVE", name="Активна")
+        active_status = await get_status(type="subscription", code="ACTIVE")
 
         # Если подписка уже истекла, продлеваем от текущей даты
         now = datetime.utcnow()
@@ -51,6 +51,7 @@ async def extend_subscription(
 
         subscription.status_id = active_status.id
         await subscription.save()
+        await ProfileCache.invalidate(tg_id=subscription.user.tg_id, user_id=subscription.user_id)
 
         return {
             "status": "success",
@@ -76,7 +77,6 @@ async def revoke_subscription(
     admin: Admin = Depends(get_current_admin)
 ):
     """Отозвать подписку (установить статус EXPIRED и дату окончания на текущую)"""
-    import httpx
     import logging
     
     logger = logging.getLogger(__name__)
@@ -88,27 +88,16 @@ async def revoke_subscription(
         raise HTTPException(status_code=404, detail="Подписка не найдена")
 
     # Получаем статус EXPIRED
-    from backend.models import Status
-    expired_status = await Status.get_or_none(type="subscription", code="EXPIRED")
-    if not expired_status:
-        expired_status = await Status.create(type="subscription", code="EXPIRED", name="Истекла")
+    expired_status = await get_status(type="subscription", code="EXPIRED")
 
     subscription.status_id = expired_status.id
     subscription.end_date = datetime.utcnow()
     await subscription.save()
+    await ProfileCache.invalidate(tg_id=subscription.user.tg_id, user_id=subscription.user_id)
     
     # Уведомляем пользователя об отзыве подписки
     user = await subscription.user
-    BOT_URL = "http://bot:8001/notify"
-    
-    async def notify_user(tg_id: int, message: str):
-        async with httpx.AsyncClient() as client:
-            try:
-                await client.post(BOT_URL, json={"tg_id": tg_id, "message": message}, timeout=5.0)
-            except Exception as e:
-                logger.warning(f"⚠ Ошибка при отправке уведомления: {e}")
-    
-    await notify_user(
+    await NotificationService.enqueue(
         user.tg_id,
         "⚠️ Ваша подписка была отозвана администратором.\n"
         "Ваш профиль переведен в тестовый режим.\n"
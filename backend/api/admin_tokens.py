@@ -7,6 +7,7 @@ from backend.models.token_purchase import TokenPurchaseRequest
 from backend.models.user import User
 from backend.models.admin import Admin
 from backend.api.admin import get_current_admin
+from backend.services.token_service import TokenService
 
 router = APIRouter(prefix="/admin/tokens", tags=["Admin Tokens"])
 
@@ -84,8 +85,12 @@ async def approve_token_purchase(
     
     # Начисляем токены пользователю (используем bonus_balance, так как он используется для списания)
     user = purchase.user
-    user.bonus_balance += purchase.amount
-    await user.save()
+    new_balance = await TokenService.credit(
+        user.id,
+        purchase.amount,
+        reason="token_purchase",
+        idempotency_key=f"token_purchase:{purchase.id}",
+    )
     
     # Обновляем статус заявки
     purchase.status = "APPROVED"
@@ -98,7 +103,7 @@ async def approve_token_purchase(
         "message": "Заявка одобрена",
         "user_id": user.id,
         "tokens_added": purchase.amount,
-        "new_balance": user.bonus_balance
+        "new_balance": new_balance
     }
 
 
@@ -144,12 +149,11 @@ async def update_user_tokens(
             detail="Пользователь не найден"
         )
     
-    user.bonus_balance = tokens
-    await user.save()
+    new_balance = await TokenService.set_balance(user.id, tokens)
     
     return {
         "message": "Баланс токенов обновлен",
         "user_id": user.id,
-        "new_balance": user.bonus_balance
+        "new_balance": new_balance
     }
 
@@ -6,6 +6,8 @@ from backend.models.user import User
 from backend.models.admin import Admin
 from backend.api.admin import get_current_admin
 from backend.schemas.user import UserResponse
+from backend.services.profile_cache import ProfileCache
+from backend.services.token_service import TokenService
 
 
 class BonusUpdate(BaseModel):
@@ -43,7 +45,7 @@ async def get_all_users(
 async def get_users_stats(_: Admin = Depends(get_current_admin)):
     """Получение статистики по пользователям"""
     total_users = await User.all().count()
-    users_with_referrals = await User.filter(referrer__isnull=False).count()
+    users_with_referrals = await User.filter(referrer_id__isnull=False).count()
     total_bonus_balance = await User.all().values_list("bonus_balance", flat=True)
 
     return {
@@ -84,10 +86,9 @@ async def update_user_bonus(
             detail="User not found"
         )
 
-    user.bonus_balance = data.bonus_amount
-    await user.save()
+    new_balance = await TokenService.set_balance(user.id, data.bonus_amount)
 
-    return {"message": "Bonus updated successfully", "new_balance": user.bonus_balance}
+    return {"message": "Bonus updated successfully", "new_balance": new_balance}
 
 
 @router.delete("/{user_id}")
@@ -105,6 +106,7 @@ async def delete_user(
         )
 
     await user.delete()
+    await ProfileCache.invalidate(tg_id=user.tg_id, user_id=user.id)
     return {"message": "User deleted successfully"}
 
 
@@ -123,7 +125,7 @@ async def ban_user(
         )
 
     user.is_banned = True
-    await user.save()
+    await user.save(update_fields=["is_banned"])
     return {"message": "User banned successfully", "user_id": user_id}
 
 
@@ -142,7 +144,7 @@ async def unban_user(
         )
 
     user.is_banned = False
-    await user.save()
+    await user.save(update_fields=["is_banned"])
     return {"message": "User unbanned successfully", "user_id": user_id}
 
 
@@ -162,5 +164,6 @@ async def update_user_token_balance(
         )
 
     user.token_balance = data.tokens
-    await user.save()
+    await user.save(update_fields=["token_balance"])
+    await ProfileCache.invalidate(tg_id=user.tg_id, user_id=user.id)
     return {"message": "Token balance updated", "user_id": user_id, "new_balance": user.token_balance}
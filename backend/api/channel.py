@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from backend.models.user import User
 from backend.services.settings_service import SettingsService
+from backend.services.token_service import TokenService
 import logging
 
 router = APIRouter(prefix="/channel", tags=["Channel"])
@@ -29,10 +30,14 @@ async def check_channel_subscription(tg_id: int):
     # Получаем размер бонуса из настроек
     bonus_amount = await SettingsService.get_channel_bonus()
     
-    # Начисляем бонус
-    user.bonus_balance += bonus_amount
-    user.channel_bonus_given = True
-    await user.save()
+    # Начисляем бонус (ключ идемпотентности защищает от двойного начисления)
+    new_balance = await TokenService.credit(
+        user.id,
+        bonus_amount,
+        reason="channel_bonus",
+        idempotency_key=f"channel_bonus:{user.id}",
+    )
+    await User.filter(id=user.id).update(channel_bonus_given=True)
     
     logger.info(f"Начислен бонус за подписку на канал пользователю {tg_id}: +{bonus_amount} токенов")
     
@@ -40,7 +45,7 @@ async def check_channel_subscription(tg_id: int):
         "subscribed": True,
         "bonus_given": True,
         "bonus_amount": bonus_amount,
-        "new_balance": user.bonus_balance,
+        "new_balance": new_balance,
         "message": f"🎉 Вам начислено {bonus_amount} токенов за подписку на канал!"
     }
 
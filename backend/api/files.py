@@ -9,6 +9,7 @@ from backend.models.admin import Admin
 from backend.api.admin import get_current_admin
 from backend.schemas.file import AccessFileCreate
 from backend.services.file_service import FileService
+from backend.services.profile_cache import ProfileCache
 
 router = APIRouter(prefix="/files", tags=["Files"])
 
@@ -79,6 +80,7 @@ async def add_access_file(data: AccessFileCreate, admin: Admin = Depends(get_cur
         password=data.password,
         path=cookie_file_path
     )
+    await ProfileCache.invalidate_group(group.id)
 
     # Если skip_auth=True, создаем пустой файл без авторизации на внешнем сервисе
     if data.skip_auth:
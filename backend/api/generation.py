@@ -0,0 +1,64 @@
+from typing import List
+
+from fastapi import APIRouter
+
+from backend.schemas.generation import (
+    GenerationJobCreate,
+    GenerationJobOut,
+    GenerationJobUpdate,
+    GenerationJobComplete,
+    GenerationJobFail,
+)
+from backend.services.generation_job_service import GenerationJobService
+from backend.services.result_cache import ResultCacheService
+
+router = APIRouter(prefix="/generation/jobs", tags=["Generation"])
+
+
+@router.post("/", response_model=GenerationJobOut)
+async def create_job(data: GenerationJobCreate):
+    """Поставить задание генерации и зарезервировать под него токены"""
+    job, balance = await GenerationJobService.create(data)
+    return GenerationJobOut.model_validate(job).model_copy(update={"balance": balance})
+
+
+@router.get("/unfinished", response_model=List[GenerationJobOut])
+async def list_unfinished_jobs():
+    """Задания в очереди и в работе - бот продолжает их после перезапуска"""
+    return await GenerationJobService.list_unfinished()
+
+
+@router.patch("/{job_id}", response_model=GenerationJobOut)
+async def update_job(job_id: int, data: GenerationJobUpdate):
+    return await GenerationJobService.update(job_id, data.status_message_id)
+
+
+@router.post("/{job_id}/start", response_model=GenerationJobOut)
+async def start_job(job_id: int):
+    """
+    Начать выполнение. Если задание снято (резерв истёк, попытки исчерпаны),
+    возвращается status=failed и refunded - генерировать не нужно.
+    cache_epoch - текущее поколение кэша результатов: бот строит ключи кэша
+    так же, как backend, и узнаёт о сбросе, даже если сигнал сброса потерялся.
+    """
+    job, refunded = await GenerationJobService.start(job_id)
+    return GenerationJobOut.model_validate(job).model_copy(
+        update={"refunded": refunded, "cache_epoch": await ResultCacheService.epoch()}
+    )
+
+
+@router.post("/{job_id}/complete", response_model=GenerationJobOut)
+async def complete_job(job_id: int, data: GenerationJobComplete):
+    """
+    Результат отправлен пользователю: токены списываются окончательно.
+    Для результата из кэша (cached) резерв возвращается, refunded=true.
+    """
+    job, refunded = await GenerationJobService.complete(job_id, data.result_url, data.prompt, data.cached)
+    return GenerationJobOut.model_validate(job).model_copy(update={"refunded": refunded})
+
+
+@router.post("/{job_id}/fail", response_model=GenerationJobOut)
+async def fail_job(job_id: int, data: GenerationJobFail):
+    """Генерация не удалась: токены возвращаются на баланс"""
+    job, refunded = await GenerationJobService.fail(job_id, data.error)
+    return GenerationJobOut.model_validate(job).model_copy(update={"refunded": refunded})
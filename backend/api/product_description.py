@@ -329,11 +329,16 @@ async def generate_infographic(
                 custom_edits=request.custom_prompt_edits
             )
             
+            # Кэш результатов FAL - только если seed задан в настройках проекта:
+            # без него повторная генерация должна давать новое изображение
+            generation_settings = project.generation_settings or {}
+
             # Генерируем изображение через FAL AI
             try:
                 generation_result = await fal_client.generate_image(
                     prompt=final_prompt,
-                    **project.generation_settings
+                    cache=generation_settings.get("seed") is not None,
+                    **generation_settings
                 )
                 
                 # Обновляем проект
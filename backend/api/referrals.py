@@ -25,12 +25,12 @@ async def bind_referral(referred_tg: int, referrer_tg: int):
     if referred.id == referrer.id:
         raise HTTPException(status_code=400, detail="Self-referral not allowed")
 
-    if referred.referrer_id:
+    # Условный UPDATE только referrer_id: повторный /start не перепривяжет,
+    # а баланс и profile_version, изменённые параллельно, не затираются
+    bound = await User.filter(id=referred.id, referrer_id=None).update(referrer_id=referrer.id)
+    if not bound:
         return {"message": "Already bound"}
 
-    referred.referrer = referrer
-    await referred.save()
-
     await Referral.create(referrer=referrer, referred=referred)
     return {"message": "Referral bound"}
 
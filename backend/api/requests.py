@@ -1,61 +1,58 @@
-from fastapi import APIRouter, Form, HTTPException, BackgroundTasks, Depends
-from backend.models import User, Tariff, Duration, Request, Status, Subscription, Referral
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Form, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from backend.models import User, Request, Subscription, Referral
 from backend.models.file import AccessFile
 from backend.schemas import RequestOut
+from backend.services.notification_service import NotificationService
 from backend.services.settings_service import SettingsService
+from backend.services.subscription_service import SubscriptionService
 from backend.api.admin import get_current_admin
+from backend.core.lookups import tariffs, durations, get_status
+from backend.services.profile_cache import ProfileCache
 from backend.models.admin import Admin
 from datetime import datetime, timedelta
-import httpx
 
 router = APIRouter(prefix="/admin/requests", tags=["Admin - Requests"])
 
-BOT_URL = "http://bot:8001/notify" 
-
 @router.get("/subscriptions")
-async def list_subscriptions(admin: Admin = Depends(get_current_admin)):
-    """
-    Получить все активные подписки с именем файла (требует аутентификации админа)
+async def list_subscriptions(
+    admin: Admin = Depends(get_current_admin),
+    after_id: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=5000),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
     """
-    subs = await Subscription.all().prefetch_related(
-        "user", "group", "group__files"
-    )
+    Получить подписки с именем файла (требует аутентификации админа).
 
-    result = []
-    for s in subs:
-        files = await s.group.files.all() if s.group else []
-        file_name = files[0].path if files else None
-
-        result.append({
-            "id": s.id,
-            "username": s.user.username if s.user else None,
-            "tg_id": s.user.tg_id if s.user else None,
-            "user_id": s.user.id if s.user else None,
-            "bonus_balance": s.user.bonus_balance if s.user else 0,
-            "token_balance": s.user.token_balance if s.user else 0,
-            "tariff_id": s.tariff_id,
-            "status_id": s.status_id,
-            "start_date": s.start_date,
-            "end_date": s.end_date,
-            "group": s.group.name if s.group else None,
-            "file_name": file_name,
-        })
+    after_id / limit - пагинация по ключу: следующая страница начинается после
+    последнего полученного id (он же в заголовке X-Next-After-Id).
+    format=ndjson - поток по одной подписке в строке для постепенной отрисовки.
+    Без limit отдаются все подписки потоком, без сборки списка в памяти.
+    """
+    if format == "ndjson":
+        async def ndjson_lines():
+            async for item in SubscriptionService.iter_subscriptions(after_id, limit):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
 
-    return result
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
-async def notify_user(tg_id: int, message: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(BOT_URL, json={"tg_id": tg_id, "message": message})
-        except Exception as e:
-            print(f"⚠ Ошибка при отправке уведомления: {e}")
+    if limit is not None:
+        page = await SubscriptionService.list_subscriptions_page(after_id, limit)
+        headers = {"X-Next-After-Id": str(page[-1]["id"])} if len(page) == limit else {}
+        return JSONResponse(page, headers=headers)
 
-async def get_status(type: str, code: str):
-    status = await Status.get_or_none(type=type, code=code)
-    if not status:
-        status = await Status.create(type=type, code=code, name=code.capitalize())
-    return status
+    async def json_array():
+        yield "["
+        first = True
+        async for item in SubscriptionService.iter_subscriptions(after_id):
+            yield ("" if first else ",") + json.dumps(item, ensure_ascii=False)
+            first = False
+        yield "]"
 
+    return StreamingResponse(json_array(), media_type="application/json")
 
 @router.get("/", response_model=list[RequestOut])
 async def list_requests(admin: Admin = Depends(get_current_admin)):
@@ -83,12 +80,12 @@ async def create_request(data: dict):
             print(f"[CREATE_REQUEST] User not found: tg_id={data['tg_id']}")
             raise HTTPException(status_code=404, detail="User not found")
 
-        tariff = await Tariff.get_or_none(code=data["tariff_code"])
+        tariff = tariffs.get(data["tariff_code"])
         if not tariff:
             print(f"[CREATE_REQUEST] Invalid tariff: {data['tariff_code']}")
             raise HTTPException(status_code=400, detail="Invalid tariff")
 
-        duration = await Duration.get_or_none(months=data["duration_months"])
+        duration = durations.get(data["duration_months"])
         if not duration:
             print(f"[CREATE_REQUEST] Invalid duration: {data['duration_months']}")
             raise HTTPException(status_code=400, detail="Invalid duration")
@@ -104,7 +101,7 @@ async def create_request(data: dict):
             # Для индивидуального доступа сохраняем email, если был указан
             if user_email:
                 user.email = user_email
-                await user.save()
+                await user.save(update_fields=["email"])
 
         status = await get_status(type="request", code="PENDING")
         print(f"[CREATE_REQUEST] Status: {status.name} (id={status.id})")
@@ -133,7 +130,6 @@ async def create_request(data: dict):
 @router.post("/{request_id}/approve")
 async def approve_request(
     request_id: int,
-    background_tasks: BackgroundTasks,
     admin: Admin = Depends(get_current_admin),
     group_id: int | None = Form(None),  # ID группы для складчины
 ):
@@ -175,6 +171,7 @@ async def approve_request(
 
     req.status = approved_status
     await req.save()
+    await ProfileCache.invalidate(tg_id=req.user.tg_id, user_id=req.user.id)
 
     # Создание ожидающего реферального бонуса вместо автоматического начисления
     referral = await Referral.get_or_none(referred=req.user)
@@ -202,7 +199,7 @@ async def approve_request(
     message = f"✅ Ваша заявка #{req.id} на тариф {req.tariff.name} ({subscription_type_name}) одобрена!\nИспользуйте /start еще раз для перехода в профиль и использования бота!"
     if group:
         message += f"\nГруппа файлов: {group.name} привязана к вашей подписке."
-    background_tasks.add_task(notify_user, req.user.tg_id, message)
+    await NotificationService.enqueue(req.user.tg_id, message)
 
     return {
         "message": f"Request {request_id} approved",
@@ -215,7 +212,6 @@ async def approve_request(
 @router.post("/{request_id}/reject")
 async def reject_request(
     request_id: int, 
-    background_tasks: BackgroundTasks,
     admin: Admin = Depends(get_current_admin)
 ):
     """
@@ -229,8 +225,7 @@ async def reject_request(
     req.status = rejected_status
     await req.save()
 
-    background_tasks.add_task(
-        notify_user,
+    await NotificationService.enqueue(
         req.user.tg_id,
         f"❌ Ваша заявка #{req.id} на тариф {req.tariff.name} отклонена."
     )
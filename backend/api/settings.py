@@ -1,35 +1,34 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from backend.schemas.settings import (
     SettingsUpdate, SettingsResponse,
     BroadcastCreate, BroadcastResponse,
     SubscriptionExtend, SubscriptionUpdate
 )
+from backend.core.http_cache import conditional_json
 from backend.services.settings_service import SettingsService
-from backend.models import BroadcastMessage, User, Subscription
+from backend.services.broadcast_service import BroadcastService
+from backend.models import BroadcastMessage, Subscription
 from datetime import datetime, timedelta
-import httpx
-import os
 
 router = APIRouter(prefix="/admin", tags=["Admin - Settings"])
 
 
 @router.get("/settings", response_model=SettingsResponse)
-async def get_settings():
-    """Получить текущие настройки"""
-    ai_prompt = await SettingsService.get_ai_prompt()
-    referral_bonus = await SettingsService.get_referral_bonus()
-    prompt_generator_prompt = await SettingsService.get_prompt_generator_prompt()
-    image_cost = await SettingsService.get_image_generation_cost()
-    gpt_cost = await SettingsService.get_gpt_request_cost()
-
-    return SettingsResponse(
-        ai_prompt=ai_prompt,
-        referral_bonus=referral_bonus,
-        prompt_generator_prompt=prompt_generator_prompt,
-        image_generation_cost=image_cost,
-        gpt_request_cost=gpt_cost
+async def get_settings(request: Request):
+    """Получить текущие настройки (с ETag: без изменений - 304 без тела)"""
+    values = await SettingsService.get_many(
+        ["ai_prompt", "referral_bonus", "prompt_generator_prompt", "image_generation_cost", "gpt_request_cost"]
     )
 
+    settings = SettingsResponse(
+        ai_prompt=values["ai_prompt"],
+        referral_bonus=int(values["referral_bonus"]),
+        prompt_generator_prompt=values["prompt_generator_prompt"],
+        image_generation_cost=int(values["image_generation_cost"]),
+        gpt_request_cost=int(values["gpt_request_cost"])
+    )
+    return conditional_json(request, settings)
+
 
 @router.put("/settings")
 async def update_settings(data: SettingsUpdate):
@@ -59,60 +58,9 @@ async def create_broadcast(data: BroadcastCreate):
     audience: 'active' - пользователи с активной подпиской
               'inactive' - пользователи без активной подписки
               'all' - все пользователи
+    Рассылка выполняется в фоне, прогресс - /admin/broadcast/jobs/{id}
     """
-    # Получаем список пользователей в зависимости от аудитории
-    if data.audience == "active":
-        # Пользователи с активными подписками
-        subscriptions = await Subscription.filter(
-            status="ACTIVE",
-            end_date__gte=datetime.now()
-        ).prefetch_related("user")
-        users = [sub.user for sub in subscriptions]
-        # Убираем дубликаты
-        unique_users = {user.tg_id: user for user in users}.values()
-    elif data.audience == "inactive":
-        # Все пользователи
-        all_users = await User.all()
-        # Пользователи с активными подписками
-        active_subscriptions = await Subscription.filter(
-            status="ACTIVE",
-            end_date__gte=datetime.now()
-        ).prefetch_related("user")
-        active_user_ids = {sub.user.tg_id for sub in active_subscriptions}
-        # Неактивные = все - активные
-        unique_users = [user for user in all_users if user.tg_id not in active_user_ids]
-    else:  # all
-        unique_users = await User.all()
-
-    # Создаем запись о рассылке
-    broadcast = await BroadcastMessage.create(
-        message=data.message,
-        audience=data.audience,
-        sent_count=0
-    )
-
-    # Отправляем сообщения через бот
-    sent_count = 0
-    bot_url = os.getenv("BACKEND_URL", "http://bot:8001").replace("backend:8000", "bot:8001")
-
-    async with httpx.AsyncClient() as client:
-        for user in unique_users:
-            try:
-                await client.post(
-                    f"{bot_url}/broadcast",
-                    json={
-                        "tg_id": user.tg_id,
-                        "message": data.message
-                    },
-                    timeout=5.0
-                )
-                sent_count += 1
-            except Exception as e:
-                print(f"Failed to send message to {user.tg_id}: {e}")
-
-    # Обновляем количество отправленных
-    broadcast.sent_count = sent_count
-    await broadcast.save()
+    broadcast = await BroadcastService.create_job(data.message, data.audience)
 
     return BroadcastResponse(
         id=broadcast.id,
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from backend.schemas.token import (
     ChargeTokensRequest,
     ChargeTokensResponse,
-    TokenPricingResponse
+    TokenPricingResponse,
+    ReserveTokensRequest,
+    ReserveTokensResponse,
+    ReservationStatusResponse
 )
+from backend.core.http_cache import conditional_json
 from backend.services.token_service import TokenService
 from backend.services.settings_service import SettingsService
 from backend.models.token_purchase import TokenPurchaseRequest
@@ -25,26 +29,49 @@ class TokenPurchaseRequestResponse(BaseModel):
 
 
 @router.get("/pricing", response_model=TokenPricingResponse)
-async def get_pricing():
-    """Стоимость доступных действий"""
+async def get_pricing(request: Request):
+    """Стоимость доступных действий (ETag: повторный запрос без изменений - 304)"""
     pricing = await TokenService.get_pricing()
-    return TokenPricingResponse(**pricing)
+    return conditional_json(request, TokenPricingResponse(**pricing))
 
 
 @router.get("/models")
-async def get_image_models():
-    """Получить список доступных моделей генерации изображений для пользователей"""
+async def get_image_models(request: Request):
+    """Получить список доступных моделей генерации изображений для пользователей (с ETag)"""
     models = await SettingsService.get_available_image_models()
-    return models
+    return conditional_json(request, models)
 
 
 @router.post("/charge", response_model=ChargeTokensResponse)
 async def charge_tokens(request: ChargeTokensRequest):
     """Списать токены у пользователя по действию"""
-    result = await TokenService.charge(request.tg_id, request.action)
+    result = await TokenService.charge(request.tg_id, request.action, request.idempotency_key)
     return ChargeTokensResponse(**result)
 
 
+@router.post("/reserve", response_model=ReserveTokensResponse)
+async def reserve_tokens(request: ReserveTokensRequest):
+    """Зарезервировать токены под действие (возвращаются, если действие не завершится)"""
+    result = await TokenService.reserve(
+        request.tg_id, request.action, request.ttl_seconds, request.idempotency_key
+    )
+    return ReserveTokensResponse(**result)
+
+
+@router.post("/reservations/{reservation_id}/commit", response_model=ReservationStatusResponse)
+async def commit_reservation(reservation_id: int):
+    """Подтвердить резерв после успешного выполнения действия"""
+    result = await TokenService.commit(reservation_id)
+    return ReservationStatusResponse(**result)
+
+
+@router.post("/reservations/{reservation_id}/release", response_model=ReservationStatusResponse)
+async def release_reservation(reservation_id: int):
+    """Освободить резерв и вернуть токены пользователю"""
+    result = await TokenService.release(reservation_id)
+    return ReservationStatusResponse(**result)
+
+
 @router.post("/purchase", response_model=TokenPurchaseRequestResponse)
 async def create_token_purchase_request(data: TokenPurchaseRequestCreate):
     """Создать заявку на пополнение токенов"""
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from backend.schemas import UserOut, UserUpdate, UserCreate
+from backend.schemas import UserOut, UserUpdate, UserCreate, UndeliverableReport
 from backend.services.user_service import UserService
 
 router = APIRouter(prefix="/admin/users", tags=["Admin - Users"])
@@ -17,6 +17,11 @@ async def get_user(user_id: int):
 async def create_user(data: UserCreate):
     return await UserService.create_user(data)
 
+@router.post("/undeliverable")
+async def mark_undeliverable(reports: list[UndeliverableReport]):
+    """Отчёт бота о получателях, которым нельзя писать (заблокировали бота и т.п.)"""
+    return {"updated": await UserService.mark_undeliverable(reports)}
+
 @router.patch("/{user_id}", response_model=UserOut)
 async def update_user(user_id: int, data: UserUpdate):
     return await UserService.update_user(user_id, data)
@@ -1,13 +1,24 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.api import (
-    profile, users, files, referrals, requests,
-    mailing, ai, session_updater, settings, tokens,
-    admin, admin_users, admin_broadcast, admin_settings, admin_tokens
-)
-from backend.api import admin_subscriptions, admin_groups, admin_bonuses
+from backend.core.timing import timed
+
+with timed("router import"):
+    from backend.api import (
+        profile, users, files, referrals, requests,
+        mailing, ai, session_updater, settings, tokens,
+        admin, admin_users, admin_broadcast, admin_settings, admin_tokens
+    )
+    from backend.api import admin_subscriptions, admin_groups, admin_bonuses
+    from backend.api import channel, generation
+
 from backend.core.db import init_db, close_db
 from backend.services.settings_service import SettingsService
+from backend.services.token_service import TokenService
+from backend.services.broadcast_service import BroadcastService
+from backend.services.notification_service import NotificationService
+from backend.services.fal_service import fal_client
+from backend.services.profile_cache import ProfileCache
 
 def create_app() -> FastAPI:
     app = FastAPI(
@@ -24,6 +35,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-After-Id"],
     )
 
     # Публичные роуты
@@ -38,8 +50,8 @@ def create_app() -> FastAPI:
     app.include_router(profile.router, prefix="/api")
     app.include_router(settings.router, prefix="/api")
     app.include_router(tokens.router, prefix="/api")
-    from backend.api import channel
     app.include_router(channel.router, prefix="/api")
+    app.include_router(generation.router, prefix="/api")
 
     # Админ роуты
     app.include_router(admin.router, prefix="/api")
@@ -54,11 +66,22 @@ def create_app() -> FastAPI:
 
     @app.on_event("startup")
     async def startup_event():
-        await init_db()
-        await SettingsService.initialize_defaults()
+        with timed("startup total"):
+            await init_db()
+            with timed("seed settings"):
+                await SettingsService.initialize_defaults()
+        app.state.reservation_sweeper = asyncio.create_task(TokenService.run_reservation_sweeper())
+        app.state.notification_dispatcher = asyncio.create_task(NotificationService.run_dispatcher())
+        app.state.broadcast_resumer = asyncio.create_task(BroadcastService.run_resumer())
 
     @app.on_event("shutdown")
     async def shutdown_event():
+        app.state.reservation_sweeper.cancel()
+        app.state.notification_dispatcher.cancel()
+        app.state.broadcast_resumer.cancel()
+        await BroadcastService.shutdown()
+        await fal_client.aclose()
+        await ProfileCache.aclose()
         await close_db()
 
     return app
@@ -0,0 +1,34 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли If-None-Match с ETag (слабое сравнение, как требует RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def conditional_json(request: Request, content: Any) -> Response:
+    """
+    JSON-ответ с ETag; 304 без тела, если If-None-Match совпал.
+
+    ETag - хэш тела, а не номер версии настроек: версия своя в каждом
+    воркере uvicorn и не меняется, когда настройки перечитываются по TTL.
+    Last-Modified не отдаётся: в таблице настроек нет времени изменения,
+    а время в памяти воркера после перезапуска и в разных воркерах разное.
+    """
+    body = json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    # no-cache: клиент может хранить ответ, но перед использованием сверяет ETag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
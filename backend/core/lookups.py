@@ -0,0 +1,114 @@
+"""
+Справочники (Status, Tariff, Duration) в памяти процесса.
+
+Таблицы маленькие и почти не меняются, поэтому загружаются один раз в init_db
+и обновляются при записи через get_status / refresh_lookups. Доступ:
+
+    statuses.subscription.ACTIVE.id
+    tariffs.INDIVIDUAL
+    tariffs.by_id(sub.tariff_id)
+    durations.get(3)
+"""
+from typing import Optional
+
+from backend.models import Status, Tariff, Duration
+
+
+class LookupTable:
+    """Справочник с доступом по ключу (атрибутом или get) и по id"""
+
+    def __init__(self, key_field: str = "code"):
+        self._key_field = key_field
+        self._by_key: dict = {}
+        self._by_id: dict = {}
+
+    def fill(self, rows):
+        self._by_key = {getattr(row, self._key_field): row for row in rows}
+        self._by_id = {row.id: row for row in rows}
+
+    def add(self, row):
+        self._by_key[getattr(row, self._key_field)] = row
+        self._by_id[row.id] = row
+
+    def get(self, key, default=None):
+        return self._by_key.get(key, default)
+
+    def by_id(self, row_id: Optional[int]):
+        return self._by_id.get(row_id)
+
+    def all(self) -> list:
+        return list(self._by_key.values())
+
+    def __getattr__(self, key):
+        if key.startswith("_"):
+            raise AttributeError(key)
+        try:
+            return self._by_key[key]
+        except KeyError:
+            raise AttributeError(f"Запись справочника '{key}' не найдена") from None
+
+    def __len__(self):
+        return len(self._by_key)
+
+
+class StatusRegistry:
+    """Статусы, сгруппированные по типу: statuses.subscription.ACTIVE"""
+
+    def __init__(self):
+        self._types: dict[str, LookupTable] = {}
+        self._by_id: dict = {}
+
+    def _table(self, type: str) -> LookupTable:
+        if type not in self._types:
+            self._types[type] = LookupTable()
+        return self._types[type]
+
+    def fill(self, rows):
+        self._types = {}
+        self._by_id = {}
+        for row in rows:
+            self.add(row)
+
+    def add(self, row: Status):
+        self._table(row.type).add(row)
+        self._by_id[row.id] = row
+
+    def get(self, type: str, code: str) -> Optional[Status]:
+        table = self._types.get(type)
+        return table.get(code) if table else None
+
+    def by_id(self, status_id: Optional[int]) -> Optional[Status]:
+        return self._by_id.get(status_id)
+
+    def __getattr__(self, type: str) -> LookupTable:
+        if type.startswith("_"):
+            raise AttributeError(type)
+        return self._types.get(type) or LookupTable()
+
+
+statuses = StatusRegistry()
+tariffs = LookupTable("code")
+durations = LookupTable("months")
+
+
+async def refresh_lookups(using_db=None):
+    """Перечитать все справочники из БД"""
+    statuses.fill(await Status.all().using_db(using_db))
+    tariffs.fill(await Tariff.all().using_db(using_db))
+    durations.fill(await Duration.all().using_db(using_db))
+
+
+async def get_status(type: str, code: str) -> Status:
+    """
+    Получение или создание статуса.
+    Статус берётся из справочника в памяти; в БД идём только если его там нет.
+    """
+    status = statuses.get(type, code)
+    if status:
+        return status
+
+    status, _ = await Status.get_or_create(
+        type=type, code=code, defaults={"name": code.capitalize()}
+    )
+    statuses.add(status)
+    return status
@@ -0,0 +1,177 @@
+"""
+Миграции схемы для уже развёрнутых баз.
+
+Tortoise.generate_schemas(safe=True) создаёт только отсутствующие таблицы,
+но не добавляет колонки в существующие. Миграции выполняются до generate_schemas:
+на новой базе они ничего не делают (таблиц ещё нет), на существующей -
+дополняют схему до текущих моделей. Применённые миграции записываются
+в таблицу schema_migrations.
+
+Запуск вручную: python -m backend.core.migrations
+"""
+import asyncio
+import logging
+
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from backend.core.sql import WRITE_CONNECTION, is_postgres, sql_for
+
+logger = logging.getLogger(__name__)
+
+
+async def table_exists(conn, table: str) -> bool:
+    if is_postgres(conn):
+        query = (
+            "SELECT table_name FROM information_schema.tables"
+            " WHERE table_schema = current_schema() AND table_name = ?"
+        )
+    else:
+        query = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?"
+    rows = await conn.execute_query_dict(sql_for(conn, query), [table])
+    return bool(rows)
+
+
+async def column_exists(conn, table: str, column: str) -> bool:
+    if is_postgres(conn):
+        rows = await conn.execute_query_dict(
+            sql_for(
+                conn,
+                "SELECT column_name AS name FROM information_schema.columns"
+                " WHERE table_schema = current_schema() AND table_name = ?",
+            ),
+            [table],
+        )
+    else:
+        rows = await conn.execute_query_dict(f'PRAGMA table_info("{table}")')
+    return any(row["name"] == column for row in rows)
+
+
+async def add_column(conn, table: str, column: str, ddl: str):
+    """Добавить колонку, если таблица уже есть, а колонки ещё нет"""
+    if await table_exists(conn, table) and not await column_exists(conn, table, column):
+        await conn.execute_query(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}')
+
+
+def datetime_ddl(conn) -> str:
+    """Тип колонки DatetimeField в текущей СУБД"""
+    return "TIMESTAMPTZ" if is_postgres(conn) else "TIMESTAMP"
+
+
+async def create_index(conn, table: str, name: str, columns: tuple):
+    """Создать индекс на существующей таблице (новые таблицы получат его из generate_schemas)"""
+    if await table_exists(conn, table):
+        cols = ", ".join(f'"{column}"' for column in columns)
+        await conn.execute_query(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({cols})')
+
+
+async def _0001_hot_path_indexes(conn):
+    """Составные индексы под частые фильтры (должны совпадать с Meta.indexes моделей)"""
+    await create_index(conn, "subscriptions", "idx_subscriptions_user_status_end", ("user_id", "status_id", "end_date"))
+    await create_index(conn, "subscriptions", "idx_subscriptions_status_end", ("status_id", "end_date"))
+    await create_index(conn, "access_files", "idx_access_files_group_updated", ("group_id", "last_updated"))
+    await create_index(conn, "requests", "idx_requests_status_created", ("status_id", "created_at"))
+    await create_index(conn, "pending_bonuses", "idx_pending_bonuses_status_created", ("status", "created_at"))
+    await create_index(conn, "token_purchase_requests", "idx_token_purchases_status_created", ("status", "created_at"))
+    await create_index(conn, "referrals", "idx_referrals_referrer", ("referrer_id",))
+    await create_index(conn, "referrals", "idx_referrals_referred", ("referred_id",))
+    await create_index(conn, "token_ledger", "idx_token_ledger_user_created", ("user_id", "created_at"))
+    await create_index(conn, "token_reservations", "idx_token_reservations_status_expires", ("status", "expires_at"))
+    await create_index(conn, "token_reservations", "idx_token_reservations_sweep", ("sweep_token",))
+
+
+async def _0002_broadcast_jobs(conn):
+    """Рассылки как задания с прогрессом; старые записи считаются завершёнными"""
+    await add_column(conn, "broadcast_messages", "status", "VARCHAR(20) NOT NULL DEFAULT 'completed'")
+    await add_column(conn, "broadcast_messages", "total_count", "INT NOT NULL DEFAULT 0")
+    await add_column(conn, "broadcast_messages", "failed_count", "INT NOT NULL DEFAULT 0")
+    await add_column(conn, "broadcast_messages", "cursor", "INT NOT NULL DEFAULT 0")
+    await add_column(conn, "broadcast_messages", "error", "TEXT")
+    for column in ("started_at", "updated_at", "finished_at"):
+        await add_column(conn, "broadcast_messages", column, datetime_ddl(conn))
+
+
+async def _0003_broadcast_media(conn):
+    """Медиа в рассылках (таблица telegram_files создаётся generate_schemas)"""
+    await add_column(conn, "broadcast_messages", "media", "JSONB" if is_postgres(conn) else "JSON")
+
+
+async def _0004_user_deliverable(conn):
+    """Список недоставляемых получателей (все существующие считаются доставляемыми)"""
+    await add_column(conn, "users", "deliverable", "BOOL NOT NULL DEFAULT TRUE" if is_postgres(conn) else "INT NOT NULL DEFAULT 1")
+    await add_column(conn, "users", "undeliverable_reason", "VARCHAR(50)")
+    await add_column(conn, "users", "undeliverable_at", datetime_ddl(conn))
+
+
+async def _0005_broadcast_lease(conn):
+    """Аренда рассылки, чтобы её не выполняли два воркера сразу"""
+    await add_column(conn, "broadcast_messages", "lease_until", datetime_ddl(conn))
+
+
+async def _0006_user_profile_version(conn):
+    """Версия профиля для проверки кэша профилей в воркерах"""
+    await add_column(conn, "users", "profile_version", "INT NOT NULL DEFAULT 0")
+
+
+async def _0007_generation_job_seed(conn):
+    """Seed заданий генерации (у старых заданий его нет - кэш для них не используется)"""
+    await add_column(conn, "generation_jobs", "seed", "BIGINT")
+
+
+async def _0008_generation_job_use_cache(conn):
+    """Кэш результатов для задания включается явно (у старых заданий - выключен)"""
+    await add_column(
+        conn, "generation_jobs", "use_cache", "BOOL NOT NULL DEFAULT FALSE" if is_postgres(conn) else "INT NOT NULL DEFAULT 0"
+    )
+
+
+# Порядок важен: новые миграции добавляются только в конец
+MIGRATIONS = [
+    ("0001_hot_path_indexes", _0001_hot_path_indexes),
+    ("0002_broadcast_jobs", _0002_broadcast_jobs),
+    ("0003_broadcast_media", _0003_broadcast_media),
+    ("0004_user_deliverable", _0004_user_deliverable),
+    ("0005_broadcast_lease", _0005_broadcast_lease),
+    ("0006_user_profile_version", _0006_user_profile_version),
+    ("0007_generation_job_seed", _0007_generation_job_seed),
+    ("0008_generation_job_use_cache", _0008_generation_job_use_cache),
+]
+
+
+async def apply_migrations() -> list:
+    """Применить ещё не применённые миграции. Возвращает их имена."""
+    conn = Tortoise.get_connection(WRITE_CONNECTION)
+    await conn.execute_script(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " name VARCHAR(255) PRIMARY KEY NOT NULL,"
+        " applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"
+        ")"
+    )
+    applied = {row["name"] for row in await conn.execute_query_dict("SELECT name FROM schema_migrations")}
+
+    done = []
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        async with in_transaction(WRITE_CONNECTION) as tx:
+            await migration(tx)
+            await tx.execute_query(sql_for(tx, "INSERT INTO schema_migrations (name) VALUES (?)"), [name])
+        logger.info(f"[MIGRATIONS] Применена миграция {name}")
+        done.append(name)
+    return done
+
+
+async def main():
+    from backend.core.db import TORTOISE_ORM
+
+    logging.basicConfig(level=logging.INFO)
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        applied = await apply_migrations()
+        print(f"Применено миграций: {len(applied)}")
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
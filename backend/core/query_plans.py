@@ -0,0 +1,123 @@
+"""
+Проверка планов частых запросов (EXPLAIN QUERY PLAN) на схеме из моделей.
+
+Падает с кодом 1, если какой-либо запрос из HOT_QUERIES читает таблицу
+полным сканированием (SCAN без индекса). Проверка выполняется на SQLite
+в памяти: индексы в Meta моделей одинаковы для SQLite и PostgreSQL. Та же
+проверка после миграций входит в тесты (backend/tests). Запуск:
+
+    python -m backend.core.query_plans
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+from tortoise import Tortoise
+
+from backend.services.broadcast_service import ACTIVE_SUBSCRIPTION_EXISTS, AUDIENCE_CHUNK_QUERY
+from backend.services.profile_cache import PROFILE_VERSION_QUERY
+from backend.services.user_service import PROFILE_QUERY
+
+NOW = datetime.utcnow()
+
+# (название, SQL, параметры) - запросы с горячих путей
+HOT_QUERIES = [
+    ("profile", PROFILE_QUERY, [1, NOW, 1]),
+    ("profile version", PROFILE_VERSION_QUERY, [1]),
+    ("users of access group", "SELECT DISTINCT user_id FROM subscriptions WHERE group_id = ?", [1]),
+    ("user by tg_id", "SELECT * FROM users WHERE tg_id = ?", [1]),
+    ("setting by key", "SELECT value FROM settings WHERE key = ?", ["ai_prompt"]),
+    (
+        "active subscription",
+        "SELECT * FROM subscriptions WHERE user_id = ? AND status_id = ? AND end_date >= ?"
+        " ORDER BY end_date DESC LIMIT 1",
+        [1, 1, NOW],
+    ),
+    (
+        "active audience chunk",
+        AUDIENCE_CHUNK_QUERY.format(condition=ACTIVE_SUBSCRIPTION_EXISTS),
+        [1, NOW, 0, 500],
+    ),
+    (
+        "inactive audience chunk",
+        AUDIENCE_CHUNK_QUERY.format(condition=f"NOT {ACTIVE_SUBSCRIPTION_EXISTS}"),
+        [1, NOW, 0, 500],
+    ),
+    (
+        "group file",
+        "SELECT * FROM access_files WHERE group_id = ? ORDER BY last_updated",
+        [1],
+    ),
+    (
+        "requests by status",
+        "SELECT * FROM requests WHERE status_id = ? ORDER BY created_at DESC",
+        [1],
+    ),
+    ("pending bonuses", "SELECT * FROM pending_bonuses WHERE status = ?", ["pending"]),
+    (
+        "token purchases by status",
+        "SELECT * FROM token_purchase_requests WHERE status = ? ORDER BY created_at DESC",
+        ["PENDING"],
+    ),
+    ("referrals of user", "SELECT COUNT(*) FROM referrals WHERE referrer_id = ?", [1]),
+    (
+        "token ledger of user",
+        "SELECT * FROM token_ledger WHERE user_id = ? ORDER BY created_at DESC",
+        [1],
+    ),
+    (
+        "stale reservations",
+        "SELECT id FROM token_reservations WHERE status = ? AND expires_at < ?",
+        ["held", NOW],
+    ),
+    ("reservation sweep", "SELECT user_id FROM token_reservations WHERE sweep_token = ?", ["x"]),
+    (
+        "notification outbox",
+        "SELECT id FROM notifications WHERE status IN (?, ?) AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+        ["pending", "sending", NOW, 100],
+    ),
+    ("notification claim", "SELECT * FROM notifications WHERE claim_token = ?", ["x"]),
+    (
+        "unfinished generation jobs",
+        "SELECT * FROM generation_jobs WHERE status IN (?, ?) ORDER BY id",
+        ["queued", "running"],
+    ),
+]
+
+
+def find_full_scans(plan_rows: list) -> list:
+    """Строки плана с полным сканированием таблицы"""
+    scans = []
+    for row in plan_rows:
+        detail = row["detail"]
+        if detail.startswith("SCAN ") and " USING " not in detail:
+            scans.append(detail)
+    return scans
+
+
+async def check_query_plans(conn) -> list:
+    """Вернуть список (название запроса, строка плана) для запросов с полным сканированием"""
+    failures = []
+    for name, sql, params in HOT_QUERIES:
+        plan = await conn.execute_query_dict(f"EXPLAIN QUERY PLAN {sql}", params)
+        for detail in find_full_scans(plan):
+            failures.append((name, detail))
+    return failures
+
+
+async def main() -> int:
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["backend.models"]})
+    try:
+        await Tortoise.generate_schemas()
+        failures = await check_query_plans(Tortoise.get_connection("default"))
+    finally:
+        await Tortoise.close_connections()
+
+    for name, detail in failures:
+        print(f"FULL SCAN: {name}: {detail}")
+    print(f"Проверено запросов: {len(HOT_QUERIES)}, с полным сканированием: {len(failures)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
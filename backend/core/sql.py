@@ -0,0 +1,24 @@
+"""
+Помощники для raw SQL, одинаково работающего на SQLite и PostgreSQL.
+
+Запросы пишутся с плейсхолдерами "?" (стиль SQLite); для PostgreSQL (asyncpg)
+они переводятся в $1, $2, ...
+"""
+import re
+
+# Имя соединения на запись (и единственного соединения для PostgreSQL)
+WRITE_CONNECTION = "default"
+
+_PLACEHOLDER = re.compile(r"\?")
+
+
+def is_postgres(conn) -> bool:
+    return conn.capabilities.dialect == "postgres"
+
+
+def sql_for(conn, query: str) -> str:
+    """Привести плейсхолдеры запроса к диалекту соединения"""
+    if not is_postgres(conn):
+        return query
+    counter = iter(range(1, query.count("?") + 1))
+    return _PLACEHOLDER.sub(lambda _: f"${next(counter)}", query)
@@ -0,0 +1,64 @@
+"""
+Настройки SQLite: PRAGMA и разделение соединений на чтение и запись.
+
+Используется, только когда DATABASE_URL не задан или указывает на SQLite.
+"""
+import itertools
+import os
+
+from backend.core.sql import WRITE_CONNECTION
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "/app/data/db.sqlite3")
+# Количество соединений только для чтения (0 - все запросы через одно соединение)
+SQLITE_READ_CONNECTIONS = int(os.getenv("SQLITE_READ_CONNECTIONS", "2"))
+
+# PRAGMA для каждого соединения. WAL позволяет читать параллельно с записью,
+# busy_timeout - ждать блокировку вместо мгновенного "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # < 0 - размер в KiB
+    "foreign_keys": "ON",
+}
+
+# Соединение на запись одно: SQLite всё равно сериализует записи
+READ_CONNECTIONS = [f"read_{i}" for i in range(SQLITE_READ_CONNECTIONS)]
+
+_read_cycle = itertools.cycle(READ_CONNECTIONS or [WRITE_CONNECTION])
+
+
+def sqlite_connection(path: str, read_only: bool = False) -> dict:
+    """Конфигурация SQLite-соединения Tortoise с PRAGMA"""
+    credentials = {"file_path": path, **SQLITE_PRAGMAS}
+    if read_only:
+        credentials["query_only"] = "ON"
+    return {"engine": "tortoise.backends.sqlite", "credentials": credentials}
+
+
+def sqlite_connections(path: str = SQLITE_PATH) -> dict:
+    """Соединение-писатель и пул соединений только для чтения"""
+    return {
+        WRITE_CONNECTION: sqlite_connection(path),
+        **{name: sqlite_connection(path, read_only=True) for name in READ_CONNECTIONS},
+    }
+
+
+def get_read_connection_name() -> str:
+    """Имя следующего соединения для чтения (по кругу)"""
+    return next(_read_cycle)
+
+
+class ReadWriteRouter:
+    """
+    Чтения вне транзакций уходят на пул соединений только для чтения,
+    записи - на единственное соединение-писатель. Запросы внутри
+    in_transaction() должны явно использовать using_db(conn).
+    """
+
+    def db_for_read(self, model):
+        return get_read_connection_name()
+
+    def db_for_write(self, model):
+        return WRITE_CONNECTION
@@ -0,0 +1,20 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("backend.startup")
+
+# Длительность этапов запуска (мс) - для логов и диагностики healthcheck
+STARTUP_TIMINGS: dict = {}
+
+
+@contextmanager
+def timed(stage: str):
+    """Замерить длительность этапа запуска и записать её в лог"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        STARTUP_TIMINGS[stage] = round(elapsed, 1)
+        logger.info(f"[STARTUP] {stage}: {elapsed:.1f} ms")
@@ -3,10 +3,14 @@ from .subscription import Subscription, AccessGroup
 from .file import AccessFile
 from .request import Request
 from .mailing import Mailing
-from .settings import Settings, BroadcastMessage
+from .settings import Settings, SettingsVersion, BroadcastMessage
 from .admin import Admin
 from .token_purchase import TokenPurchaseRequest
 from .pending_bonus import PendingBonus
+from .token_ledger import TokenLedger, TokenReservation
+from .telegram_file import TelegramFile
+from .notification import Notification
+from .generation_job import GenerationJob
 from .enums import (
     Tariff, Status, Duration, Audience
 )
@@ -19,11 +23,17 @@ __all__ = [
     "Request",
     "Mailing",
     "Settings",
+    "SettingsVersion",
     "BroadcastMessage",
     "Referral",
     "Admin",
     "TokenPurchaseRequest",
     "PendingBonus",
+    "TokenLedger",
+    "TokenReservation",
+    "TelegramFile",
+    "Notification",
+    "GenerationJob",
     "Tariff",
     "Status",
     "Duration",
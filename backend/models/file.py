@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import Index
 from tortoise.models import Model
 
 class AccessFile(Model):
@@ -14,3 +15,6 @@ class AccessFile(Model):
 
     class Meta:
         table = "access_files"
+        indexes = (
+            Index(fields=("group_id", "last_updated"), name="idx_access_files_group_updated"),
+        )
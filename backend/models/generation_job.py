@@ -0,0 +1,59 @@
+from tortoise import fields
+from tortoise.indexes import Index
+from tortoise.models import Model
+
+
+class GenerationJob(Model):
+    """
+    Задание генерации карточки товара.
+
+    Бот ставит задание и сразу отвечает пользователю; выполняет его пул
+    воркеров бота, результат отправляется в чат. Токены резервируются при
+    постановке (reservation_id) и списываются или возвращаются при завершении.
+    Незавершённые задания бот продолжает после перезапуска.
+    """
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+
+    id = fields.IntField(pk=True)
+    tg_id = fields.BigIntField()
+    chat_id = fields.BigIntField()
+    status = fields.CharField(max_length=20, default=STATUS_QUEUED)  # queued, running, completed, failed
+
+    model_id = fields.CharField(max_length=255, null=True)
+    model_name = fields.CharField(max_length=255, null=True)
+    prompt = fields.TextField(null=True)  # None - промпт генерирует AI по фото
+    card_text = fields.TextField(null=True)
+    product_images = fields.JSONField(default=list)
+    reference_images = fields.JSONField(default=list)
+    aspect_ratio = fields.CharField(max_length=10, default="3:4")
+    # Seed генерации FAL: сохраняется, чтобы результат можно было воспроизвести
+    seed = fields.BigIntField(null=True)
+    # Брать результат из кэша результатов: только если клиент сам задал seed
+    # или явно попросил кэш. Иначе "сгенерировать ещё раз" даёт новое изображение
+    use_cache = fields.BooleanField(default=False)
+    # Сообщение "Генерирую..." - удаляется при выдаче результата
+    status_message_id = fields.BigIntField(null=True)
+
+    reservation_id = fields.IntField(null=True)
+    cost = fields.IntField(default=0)
+    idempotency_key = fields.CharField(max_length=128, unique=True, null=True)
+
+    attempts = fields.IntField(default=0)
+    result_url = fields.TextField(null=True)
+    error = fields.TextField(null=True)
+
+    created_at = fields.DatetimeField(auto_now_add=True)
+    started_at = fields.DatetimeField(null=True)
+    finished_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "generation_jobs"
+        indexes = (
+            Index(fields=("status", "id"), name="idx_generation_jobs_status"),
+        )
+
+    def __str__(self):
+        return f"GenerationJob {self.id}: {self.tg_id} ({self.status})"
@@ -0,0 +1,42 @@
+from tortoise import fields
+from tortoise.indexes import Index
+from tortoise.models import Model
+
+
+class Notification(Model):
+    """
+    Исходящие уведомления пользователям (outbox).
+
+    Админские эндпоинты только добавляют запись, отправкой занимается
+    фоновый диспетчер NotificationService пачками через бота.
+    next_attempt_at - время следующей попытки; у взятой в отправку
+    записи (sending) это срок аренды, после которого её может забрать
+    другой процесс.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    id = fields.IntField(pk=True)
+    tg_id = fields.BigIntField()
+    message = fields.TextField()
+
+    status = fields.CharField(max_length=20, default=STATUS_PENDING)  # pending, sending, sent, failed
+    attempts = fields.IntField(default=0)
+    next_attempt_at = fields.DatetimeField()
+    claim_token = fields.CharField(max_length=32, null=True)
+    last_error = fields.TextField(null=True)
+
+    created_at = fields.DatetimeField(auto_now_add=True)
+    sent_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "notifications"
+        indexes = (
+            Index(fields=("status", "next_attempt_at"), name="idx_notifications_status_next"),
+            Index(fields=("claim_token",), name="idx_notifications_claim"),
+        )
+
+    def __str__(self):
+        return f"Notification {self.id}: {self.tg_id} ({self.status})"
@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import Index
 from tortoise.models import Model
 
 
@@ -23,4 +24,7 @@ class PendingBonus(Model):
 
     class Meta:
         table = "pending_bonuses"
+        indexes = (
+            Index(fields=("status", "created_at"), name="idx_pending_bonuses_status_created"),
+        )
 
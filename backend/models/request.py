@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import Index
 from tortoise.models import Model
 
 class Request(Model):
@@ -20,3 +21,6 @@ class Request(Model):
 
     class Meta:
         table = "requests"
+        indexes = (
+            Index(fields=("status_id", "created_at"), name="idx_requests_status_created"),
+        )
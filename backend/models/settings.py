@@ -13,13 +13,48 @@ class Settings(Model):
         return f"{self.key}: {self.value}"
 
 
+class SettingsVersion(Model):
+    """
+    Версия таблицы settings - одна строка. Растёт при каждой записи настроек
+    через SettingsService: по ней воркеры backend проверяют свой кэш настроек.
+    """
+    id = fields.IntField(pk=True)
+    version = fields.IntField(default=0)
+
+    class Meta:
+        table = "settings_version"
+
+
 class BroadcastMessage(Model):
-    """История рассылок"""
+    """
+    Рассылка (задание). Получатели обходятся по возрастанию users.id,
+    cursor - id последнего обработанного пользователя: после перезапуска
+    рассылка продолжается с него.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+
     id = fields.IntField(pk=True)
-    message = fields.TextField()
-    audience = fields.CharField(max_length=50)  # active, inactive, all
+    message = fields.TextField()  # Текст или подпись к медиа
+    # [{"type": "photo" | "document", "sha256": ..., "filename": ...}], несколько - альбом
+    media = fields.JSONField(null=True)
+    audience = fields.CharField(max_length=50)  # active, inactive, all, with_referrals
+    status = fields.CharField(max_length=20, default=STATUS_PENDING)  # pending, running, completed, failed
+
+    total_count = fields.IntField(default=0)  # Размер аудитории на момент создания
     sent_count = fields.IntField(default=0)
+    failed_count = fields.IntField(default=0)
+    cursor = fields.IntField(default=0)
+    error = fields.TextField(null=True)
+    # Рассылку выполняет процесс, взявший её до этого времени (несколько воркеров backend)
+    lease_until = fields.DatetimeField(null=True)
+
     created_at = fields.DatetimeField(auto_now_add=True)
+    started_at = fields.DatetimeField(null=True)
+    updated_at = fields.DatetimeField(null=True)
+    finished_at = fields.DatetimeField(null=True)
 
     class Meta:
         table = "broadcast_messages"
@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import Index
 from tortoise.models import Model
 
 class AccessGroup(Model):
@@ -22,3 +23,9 @@ class Subscription(Model):
 
     class Meta:
         table = "subscriptions"
+        indexes = (
+            # Активная подписка пользователя (профиль, файлы доступа)
+            Index(fields=("user_id", "status_id", "end_date"), name="idx_subscriptions_user_status_end"),
+            # Аудитории рассылок: все активные подписки
+            Index(fields=("status_id", "end_date"), name="idx_subscriptions_status_end"),
+        )
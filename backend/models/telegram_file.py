@@ -0,0 +1,20 @@
+from tortoise import fields
+from tortoise.models import Model
+
+
+class TelegramFile(Model):
+    """
+    file_id файлов, уже загруженных в Telegram (ключ - sha256 содержимого).
+    Повторная отправка того же файла идёт по file_id, без загрузки байтов.
+    """
+    id = fields.IntField(pk=True)
+    sha256 = fields.CharField(max_length=64, unique=True)
+    kind = fields.CharField(max_length=20)  # photo, document
+    file_id = fields.CharField(max_length=255)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "telegram_files"
+
+    def __str__(self):
+        return f"TelegramFile {self.sha256[:12]}: {self.kind}"
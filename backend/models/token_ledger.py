@@ -0,0 +1,74 @@
+from tortoise import fields
+from tortoise.indexes import Index
+from tortoise.models import Model
+
+
+class TokenLedger(Model):
+    """
+    Журнал движения токенов (записи только добавляются, не изменяются)
+    """
+    KIND_DEBIT = "debit"
+    KIND_CREDIT = "credit"
+    KIND_ADJUSTMENT = "adjustment"
+
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="token_ledger")
+
+    delta = fields.IntField()  # > 0 - начисление, < 0 - списание
+    balance_after = fields.IntField()  # Баланс пользователя после операции
+    kind = fields.CharField(max_length=20)  # debit, credit, adjustment
+    reason = fields.CharField(max_length=100)  # Действие или источник операции
+
+    # Ключ идемпотентности: повтор запроса с тем же ключом не меняет баланс
+    idempotency_key = fields.CharField(max_length=128, unique=True, null=True)
+
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "token_ledger"
+        indexes = (
+            Index(fields=("user_id", "created_at"), name="idx_token_ledger_user_created"),
+        )
+
+    def __str__(self):
+        return f"Ledger {self.id}: user={self.user_id} {self.delta:+d} ({self.reason})"
+
+
+class TokenReservation(Model):
+    """
+    Резерв токенов на время выполнения задачи (например, генерации изображения).
+
+    Токены списываются с баланса при создании резерва. Резерв подтверждается
+    (committed) после успешной выдачи результата или возвращается на баланс
+    (released / expired) при ошибке либо по истечении TTL.
+    """
+    STATUS_HELD = "held"
+    STATUS_COMMITTED = "committed"
+    STATUS_RELEASED = "released"
+    STATUS_EXPIRED = "expired"
+
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="token_reservations")
+
+    action = fields.CharField(max_length=50)
+    amount = fields.IntField()
+    status = fields.CharField(max_length=20, default=STATUS_HELD)  # held, committed, released, expired
+
+    idempotency_key = fields.CharField(max_length=128, unique=True, null=True)
+    # Метка прохода сборщика, который перевёл резерв в expired
+    sweep_token = fields.CharField(max_length=32, null=True)
+
+    expires_at = fields.DatetimeField()
+    created_at = fields.DatetimeField(auto_now_add=True)
+    resolved_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "token_reservations"
+        indexes = (
+            # Сборщик просроченных резервов
+            Index(fields=("status", "expires_at"), name="idx_token_reservations_status_expires"),
+            Index(fields=("sweep_token",), name="idx_token_reservations_sweep"),
+        )
+
+    def __str__(self):
+        return f"Reservation {self.id}: user={self.user_id} {self.amount} ({self.status})"
@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import Index
 from tortoise.models import Model
 
 
@@ -18,4 +19,7 @@ class TokenPurchaseRequest(Model):
     
     class Meta:
         table = "token_purchase_requests"
+        indexes = (
+            Index(fields=("status", "created_at"), name="idx_token_purchases_status_created"),
+        )
 
@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import Index
 from tortoise.models import Model
 
 
@@ -18,6 +19,16 @@ class User(Model):
     is_banned = fields.BooleanField(default=False)  # Черный список
     channel_bonus_given = fields.BooleanField(default=False)  # Был ли начислен бонус за подписку на канал
 
+    # Недоставляемые (заблокировали бота, удалили аккаунт) исключаются из рассылок;
+    # флаг снимается при следующем /start
+    deliverable = fields.BooleanField(default=True)
+    undeliverable_reason = fields.CharField(50, null=True)  # blocked, deactivated, chat_not_found, forbidden
+    undeliverable_at = fields.DatetimeField(null=True)
+
+    # Растёт при каждом изменении профиля (баланс, подписка, файл доступа):
+    # по ней воркеры backend проверяют свои закэшированные профили
+    profile_version = fields.IntField(default=0)
+
     referrer = fields.ForeignKeyField(
         "models.User",
         null=True,
@@ -45,3 +56,7 @@ class Referral(Model):
 
     class Meta:
         table = "referrals"
+        indexes = (
+            Index(fields=("referrer_id",), name="idx_referrals_referrer"),
+            Index(fields=("referred_id",), name="idx_referrals_referred"),
+        )
@@ -1,4 +1,4 @@
-from .user import UserBase, UserCreate, UserUpdate, UserOut, ReferralCreate, ReferralOut
+from .user import UserBase, UserCreate, UserUpdate, UserOut, UndeliverableReport, ReferralCreate, ReferralOut
 from .subscription import SubscriptionBase, SubscriptionCreate, SubscriptionOut, AccessGroupCreate, AccessGroupOut
 from .file import AccessFileBase, AccessFileCreate, AccessFileOut
 from .request import RequestBase, RequestCreate, RequestOut
@@ -12,7 +12,7 @@ from .enums import (
 
 __all__ = [
     # users / referrals
-    "UserBase", "UserCreate", "UserUpdate", "UserOut",
+    "UserBase", "UserCreate", "UserUpdate", "UserOut", "UndeliverableReport",
     "ReferralCreate", "ReferralOut",
 
     # subscriptions / access groups
@@ -0,0 +1,69 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class GenerationJobCreate(BaseModel):
+    tg_id: int = Field(..., description="Telegram ID пользователя")
+    chat_id: int = Field(..., description="Чат, куда отправить результат")
+    model_id: Optional[str] = None
+    model_name: Optional[str] = None
+    prompt: Optional[str] = Field(None, description="Промпт; без него промпт генерирует AI по фото")
+    card_text: Optional[str] = None
+    product_images: List[str] = Field(..., min_length=1)
+    reference_images: List[str] = []
+    aspect_ratio: str = Field("3:4", max_length=10)
+    seed: Optional[int] = Field(
+        None, ge=0, lt=2**31, description="Seed FAL; без него назначается случайный и сохраняется в задании"
+    )
+    use_cache: bool = Field(
+        False, description="Брать результат из кэша результатов; включается и заданным seed"
+    )
+    idempotency_key: Optional[str] = Field(
+        None, max_length=100, description="Повтор с тем же ключом не ставит задание и не резервирует токены повторно"
+    )
+
+
+class GenerationJobOut(BaseModel):
+    id: int
+    tg_id: int
+    chat_id: int
+    status: str
+    model_id: Optional[str] = None
+    model_name: Optional[str] = None
+    prompt: Optional[str] = None
+    card_text: Optional[str] = None
+    product_images: List[str]
+    reference_images: List[str]
+    aspect_ratio: str
+    seed: Optional[int] = None
+    use_cache: bool = False
+    status_message_id: Optional[int] = None
+    reservation_id: Optional[int] = None
+    cost: int
+    attempts: int
+    result_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    balance: Optional[int] = Field(None, description="Баланс после резерва (только при постановке)")
+    refunded: Optional[bool] = Field(None, description="Токены возвращены (только при ошибке)")
+    cache_epoch: Optional[str] = Field(None, description="Поколение кэша результатов (только при старте)")
+
+    class Config:
+        from_attributes = True
+
+
+class GenerationJobUpdate(BaseModel):
+    status_message_id: Optional[int] = None
+
+
+class GenerationJobComplete(BaseModel):
+    result_url: str
+    prompt: Optional[str] = Field(None, description="Промпт, по которому сгенерирован результат")
+    cached: bool = Field(False, description="Результат взят из кэша: резерв токенов возвращается, а не списывается")
+
+
+class GenerationJobFail(BaseModel):
+    error: str = Field(..., max_length=2000)
@@ -1,10 +1,14 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Literal, Optional
 
 
 class ChargeTokensRequest(BaseModel):
     tg_id: int = Field(..., description="Telegram ID пользователя")
     action: Literal["image_generation", "ai_chat"]
+    idempotency_key: Optional[str] = Field(
+        None, max_length=128, description="Ключ идемпотентности: повтор с тем же ключом не списывает токены повторно"
+    )
 
 
 class ChargeTokensResponse(BaseModel):
@@ -17,3 +21,26 @@ class ChargeTokensResponse(BaseModel):
 class TokenPricingResponse(BaseModel):
     image_generation_cost: int
     gpt_request_cost: int
+
+
+class ReserveTokensRequest(BaseModel):
+    tg_id: int = Field(..., description="Telegram ID пользователя")
+    action: Literal["image_generation", "ai_chat"]
+    ttl_seconds: Optional[int] = Field(None, gt=0, le=3600, description="Время жизни резерва в секундах")
+    idempotency_key: Optional[str] = Field(None, max_length=128)
+
+
+class ReserveTokensResponse(BaseModel):
+    reservation_id: int
+    action: str
+    cost: int
+    balance: int
+    status: str
+    expires_at: datetime
+    label: str
+
+
+class ReservationStatusResponse(BaseModel):
+    reservation_id: int
+    status: str
+    balance: Optional[int] = None
@@ -16,6 +16,11 @@ class UserCreate(BaseModel):
     username: str | None = None
     full_name: str | None = None
 
+class UndeliverableReport(BaseModel):
+    """Получатель, которому бот не может писать (из ошибок /broadcast и /notify)"""
+    tg_id: int
+    reason: str  # blocked, deactivated, chat_not_found, forbidden
+
 class UserUpdate(BaseModel):
     username: Optional[str] = None
     full_name: Optional[str] = None
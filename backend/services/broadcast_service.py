@@ -0,0 +1,464 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException, UploadFile
+from tortoise.expressions import F, Q
+
+from backend.core.db import get_read_connection
+from backend.core.lookups import statuses
+from backend.core.sql import sql_for
+from backend.models import BroadcastMessage, Subscription, TelegramFile, User
+from backend.schemas import UndeliverableReport
+from backend.services.user_service import UserService
+
+logger = logging.getLogger(__name__)
+
+BOT_API_URL = os.getenv("BOT_API_URL", "http://bot:8001")
+
+# Получателей в одном запросе к боту; после каждой пачки сохраняется прогресс
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "200"))
+# Пачка из 200 сообщений при ~25 msg/s уходит за ~8 с, запас на flood-паузы
+BROADCAST_BOT_TIMEOUT = float(os.getenv("BROADCAST_BOT_TIMEOUT", "120"))
+# Попыток подряд отправить пачку; если бот всё ещё недоступен, рассылка отпускает
+# аренду и ждёт следующего прохода run_resumer (failed - только для неповторяемых ошибок)
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "5"))
+# На сколько процесс берёт рассылку; продлевается после каждой пачки.
+# Должно быть больше времени отправки пачки со всеми повторами.
+BROADCAST_LEASE_SECONDS = float(os.getenv("BROADCAST_LEASE_SECONDS", "900"))
+# Как часто проверять рассылки, брошенные упавшим процессом (аренда истекла)
+BROADCAST_RESUME_INTERVAL = float(os.getenv("BROADCAST_RESUME_INTERVAL", "60"))
+
+TARGETS = ("all", "active", "inactive", "with_referrals")
+
+# Файлы рассылок; каталог общий с ботом (том /app/data)
+BROADCAST_MEDIA_DIR = os.getenv("BROADCAST_MEDIA_DIR", "/app/data/broadcast_media")
+MEDIA_TYPES = ("photo", "document")
+PHOTO_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp")
+MAX_PHOTO_SIZE = 10 * 1024 * 1024  # Ограничения Bot API на загрузку
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+MAX_ALBUM_SIZE = 10
+CAPTION_LIMIT = 1024
+# Загруженный файл читается и пишется на диск частями такого размера
+MEDIA_CHUNK_SIZE = 1024 * 1024
+
+# Есть активная подписка (полусоединение по индексу subscriptions(user_id, status_id, end_date));
+# для inactive - NOT EXISTS, т.е. антисоединение без выгрузки активных в память
+ACTIVE_SUBSCRIPTION_EXISTS = (
+    "EXISTS (SELECT 1 FROM subscriptions s"
+    " WHERE s.user_id = u.id AND s.status_id = ? AND s.end_date >= ?)"
+)
+
+# Пачка аудитории по ключу (u.id > after_id), а не OFFSET; недоставляемые исключаются
+AUDIENCE_CHUNK_QUERY = """
+SELECT u.id, u.tg_id
+FROM users u
+WHERE u.deliverable AND {condition} AND u.id > ?
+ORDER BY u.id
+LIMIT ?
+"""
+
+
+def _bot_unavailable(error: Exception) -> bool:
+    """Бот перезапускается или перегружен: сеть, таймаут или 5xx - пачку можно повторить"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code >= 500
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class BroadcastService:
+    """
+    Рассылки как фоновые задания.
+
+    Задание обходит аудиторию пачками по возрастанию users.id, отправляет
+    каждую пачку в бот и сохраняет прогресс (sent/failed/cursor).
+    При старте backend незавершённые задания продолжаются с cursor:
+    пачка, прерванная перезапуском, может быть отправлена повторно.
+    Недоступный бот (перезапуск) рассылку не завершает: она отпускает аренду
+    и продолжается на следующем проходе run_resumer.
+    Задание выполняет только процесс, взявший аренду (lease_until), поэтому
+    несколько воркеров uvicorn не отправляют одну рассылку дважды.
+    """
+
+    _tasks: dict[int, asyncio.Task] = {}
+
+    @staticmethod
+    def normalize_target(target: Optional[str]) -> str:
+        """Неизвестная аудитория - все пользователи (как и раньше)"""
+        return target if target in TARGETS else "all"
+
+    # ---------- Аудитория ----------
+
+    @staticmethod
+    def _subscription_filter(target: str) -> Optional[tuple]:
+        """
+        Условие для active/inactive: (SQL, параметры) либо None, если статуса ACTIVE нет
+        (тогда активных пользователей нет, а неактивные - все).
+        """
+        active_status = statuses.subscription.get("ACTIVE")
+        if not active_status:
+            return None
+        now = Subscription._meta.fields_map["end_date"].to_db_value(datetime.utcnow(), None)
+        condition = ACTIVE_SUBSCRIPTION_EXISTS if target == "active" else f"NOT {ACTIVE_SUBSCRIPTION_EXISTS}"
+        return condition, [active_status.id, now]
+
+    @staticmethod
+    def _user_query(target: str):
+        query = User.filter(deliverable=True)
+        if target == "with_referrals":
+            query = query.filter(referrer_id__isnull=False)
+        return query
+
+    @classmethod
+    async def count_audience(cls, target: str) -> int:
+        if target in ("active", "inactive"):
+            subscription_filter = cls._subscription_filter(target)
+            if subscription_filter:
+                condition, params = subscription_filter
+                conn = get_read_connection(User)
+                rows = await conn.execute_query_dict(
+                    sql_for(conn, f"SELECT COUNT(*) AS cnt FROM users u WHERE u.deliverable AND {condition}"), params
+                )
+                return rows[0]["cnt"]
+            if target == "active":
+                return 0
+        return await cls._user_query(target).count()
+
+    @classmethod
+    async def audience_chunk(cls, target: str, after_id: int, limit: int):
+        """
+        Следующая пачка аудитории после пользователя after_id (по возрастанию users.id).
+        Возвращает (tg_ids, last_id); last_id = None - аудитория закончилась.
+        """
+        if target in ("active", "inactive") and (subscription_filter := cls._subscription_filter(target)):
+            condition, params = subscription_filter
+            conn = get_read_connection(User)
+            rows = await conn.execute_query_dict(
+                sql_for(conn, AUDIENCE_CHUNK_QUERY.format(condition=condition)), [*params, after_id, limit]
+            )
+            rows = [(row["id"], row["tg_id"]) for row in rows]
+        elif target == "active":
+            rows = []
+        else:
+            rows = await cls._user_query(target).filter(id__gt=after_id).order_by("id").limit(limit).values_list("id", "tg_id")
+
+        if not rows:
+            return [], None
+        return [tg_id for _, tg_id in rows], rows[-1][0]
+
+    @classmethod
+    async def iter_audience(cls, target: str, after_id: int = 0, chunk_size: int = BROADCAST_CHUNK_SIZE):
+        """
+        Аудитория потоком пачек (tg_ids, last_id). Следующая пачка читается из БД,
+        пока вызывающий отправляет текущую; в памяти не больше двух пачек.
+        """
+        next_chunk = asyncio.create_task(cls.audience_chunk(target, after_id, chunk_size))
+        try:
+            while True:
+                tg_ids, last_id = await next_chunk
+                if last_id is None:
+                    return
+                next_chunk = asyncio.create_task(cls.audience_chunk(target, last_id, chunk_size))
+                yield tg_ids, last_id
+        finally:
+            next_chunk.cancel()
+
+    # ---------- Медиа ----------
+
+    @staticmethod
+    async def save_media(file: UploadFile) -> dict:
+        """
+        Сохранить файл рассылки под именем sha256 содержимого.
+        Одинаковые файлы сохраняются один раз и получают один file_id в Telegram.
+        Файл читается частями во временный файл рядом с итоговым: в памяти не больше
+        одной части, запись на диск - в потоке, не в event loop.
+        """
+        await asyncio.to_thread(os.makedirs, BROADCAST_MEDIA_DIR, exist_ok=True)
+        fd, tmp_path = await asyncio.to_thread(tempfile.mkstemp, suffix=".part", dir=BROADCAST_MEDIA_DIR)
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := await file.read(MEDIA_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > MAX_DOCUMENT_SIZE:
+                        raise HTTPException(status_code=400, detail="Файл больше 50 МБ")
+                    sha256.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            if not size:
+                raise HTTPException(status_code=400, detail="Пустой файл")
+
+            ext = os.path.splitext(file.filename or "")[1].lower()
+            stored_name = f"{sha256.hexdigest()}{ext}"
+            # mkstemp создаёт файл 0600, а читает его бот; тот же файл уже мог
+            # быть сохранён - содержимое одинаковое, замена безопасна
+            await asyncio.to_thread(os.chmod, tmp_path, 0o644)
+            await asyncio.to_thread(os.replace, tmp_path, os.path.join(BROADCAST_MEDIA_DIR, stored_name))
+        except BaseException:
+            await asyncio.to_thread(_remove_file, tmp_path)
+            raise
+
+        is_photo = file.content_type in PHOTO_CONTENT_TYPES and size <= MAX_PHOTO_SIZE
+        return {"type": "photo" if is_photo else "document", "sha256": sha256.hexdigest(), "filename": stored_name}
+
+    @staticmethod
+    def validate_media(message: str, media: Optional[list]) -> Optional[list]:
+        if not media:
+            return None
+        if len(media) > MAX_ALBUM_SIZE:
+            raise HTTPException(status_code=400, detail=f"В альбоме не больше {MAX_ALBUM_SIZE} файлов")
+        if len(message) > CAPTION_LIMIT:
+            raise HTTPException(status_code=400, detail=f"Подпись к медиа не длиннее {CAPTION_LIMIT} символов")
+
+        types = {item["type"] for item in media}
+        if not types <= set(MEDIA_TYPES):
+            raise HTTPException(status_code=400, detail="Поддерживаются только photo и document")
+        if len(media) > 1 and len(types) > 1:
+            raise HTTPException(status_code=400, detail="Фото и документы нельзя смешивать в одном альбоме")
+        for item in media:
+            # Только имена, выданные save_media: sha256 содержимого и расширение,
+            # без каталогов - путь не выходит за BROADCAST_MEDIA_DIR
+            filename = item.get("filename") or ""
+            if filename != os.path.basename(filename) or os.path.splitext(filename)[0] != item.get("sha256"):
+                raise HTTPException(status_code=400, detail=f"Некорректное имя файла {filename}")
+            if not os.path.exists(os.path.join(BROADCAST_MEDIA_DIR, filename)):
+                raise HTTPException(status_code=400, detail=f"Файл {item['filename']} не загружен")
+        return media
+
+    @staticmethod
+    async def _known_file_ids(media: Optional[list]) -> dict:
+        """sha256 -> file_id для файлов, уже загруженных в Telegram"""
+        if not media:
+            return {}
+        rows = await TelegramFile.filter(
+            sha256__in=[item["sha256"] for item in media]
+        ).values_list("sha256", "file_id")
+        return dict(rows)
+
+    @staticmethod
+    async def _remember_file_ids(media: list, file_ids: dict):
+        kinds = {item["sha256"]: item["type"] for item in media}
+        await TelegramFile.bulk_create(
+            [
+                TelegramFile(sha256=sha256, kind=kinds.get(sha256, "document"), file_id=file_id)
+                for sha256, file_id in file_ids.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+    # ---------- Задания ----------
+
+    @classmethod
+    async def create_job(cls, message: str, target: Optional[str], media: Optional[list] = None) -> BroadcastMessage:
+        """Создать рассылку и запустить её в фоне"""
+        target = cls.normalize_target(target)
+        job = await BroadcastMessage.create(
+            message=message,
+            media=cls.validate_media(message, media),
+            audience=target,
+            total_count=await cls.count_audience(target),
+        )
+        logger.info(f"[BROADCAST] Создана рассылка {job.id}: target={target}, получателей {job.total_count}")
+        cls.start(job.id)
+        return job
+
+    @classmethod
+    def start(cls, job_id: int):
+        task = cls._tasks.get(job_id)
+        if task and not task.done():
+            return
+        task = asyncio.create_task(cls.run_job(job_id))
+        cls._tasks[job_id] = task
+        task.add_done_callback(lambda _: cls._tasks.pop(job_id, None))
+
+    @staticmethod
+    def _lease_until() -> datetime:
+        return datetime.utcnow() + timedelta(seconds=BROADCAST_LEASE_SECONDS)
+
+    @classmethod
+    async def _claim(cls, job_id: int) -> bool:
+        """Взять рассылку в работу, если её не выполняет другой процесс"""
+        now = datetime.utcnow()
+        claimed = await BroadcastMessage.filter(
+            Q(lease_until__isnull=True) | Q(lease_until__lt=now),
+            id=job_id,
+            status__in=[BroadcastMessage.STATUS_PENDING, BroadcastMessage.STATUS_RUNNING],
+        ).update(lease_until=cls._lease_until())
+        return bool(claimed)
+
+    @staticmethod
+    async def _send_chunk(client: httpx.AsyncClient, tg_ids: list, job: BroadcastMessage, file_ids: dict) -> dict:
+        payload = {"user_ids": tg_ids, "message": job.message}
+        if job.media:
+            payload["media"] = [
+                {**item, "file_id": file_ids.get(item["sha256"])} for item in job.media
+            ]
+
+        for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+            try:
+                response = await client.post(f"{BOT_API_URL}/broadcast", json=payload)
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPError as e:
+                if attempt == BROADCAST_MAX_ATTEMPTS or not _bot_unavailable(e):
+                    raise
+                logger.warning(f"[BROADCAST] Бот недоступен ({e}), попытка {attempt}/{BROADCAST_MAX_ATTEMPTS}")
+                await asyncio.sleep(2 ** attempt)
+
+    @classmethod
+    async def run_job(cls, job_id: int):
+        job = await BroadcastMessage.get_or_none(id=job_id)
+        if not job or job.status in (BroadcastMessage.STATUS_COMPLETED, BroadcastMessage.STATUS_FAILED):
+            return
+        if not await cls._claim(job_id):
+            logger.info(f"[BROADCAST] Рассылку {job_id} выполняет другой процесс")
+            return
+
+        if job.status == BroadcastMessage.STATUS_PENDING:
+            job.status = BroadcastMessage.STATUS_RUNNING
+            job.started_at = datetime.utcnow()
+            await job.save(update_fields=["status", "started_at"])
+
+        try:
+            file_ids = await cls._known_file_ids(job.media)
+            async with httpx.AsyncClient(timeout=BROADCAST_BOT_TIMEOUT) as client:
+                async for tg_ids, last_id in cls.iter_audience(job.audience, job.cursor):
+                    result = await cls._send_chunk(client, tg_ids, job, file_ids)
+                    new_file_ids = {
+                        sha256: file_id for sha256, file_id in (result.get("file_ids") or {}).items()
+                        if sha256 not in file_ids
+                    }
+                    if new_file_ids:
+                        await cls._remember_file_ids(job.media, new_file_ids)
+                        file_ids.update(new_file_ids)
+                    if result.get("undeliverable"):
+                        await UserService.mark_undeliverable(
+                            [UndeliverableReport(**item) for item in result["undeliverable"]]
+                        )
+                    await BroadcastMessage.filter(id=job_id).update(
+                        sent_count=F("sent_count") + result.get("success_count", 0),
+                        failed_count=F("failed_count") + result.get("failed_count", 0),
+                        cursor=last_id,
+                        error=None,
+                        updated_at=datetime.utcnow(),
+                        lease_until=cls._lease_until(),
+                    )
+
+            await BroadcastMessage.filter(id=job_id).update(
+                status=BroadcastMessage.STATUS_COMPLETED,
+                finished_at=datetime.utcnow(),
+                lease_until=None,
+            )
+            logger.info(f"[BROADCAST] Рассылка {job_id} завершена")
+        except asyncio.CancelledError:
+            # Остаётся running - будет продолжена при следующем старте (аренда снимается сразу)
+            await BroadcastMessage.filter(id=job_id).update(lease_until=None)
+            raise
+        except httpx.HTTPError as e:
+            if not _bot_unavailable(e):
+                await cls._fail(job_id, e)
+                return
+            # Бот перезапускается: рассылка остаётся running на сохранённом cursor,
+            # аренда снимается - run_resumer продолжит её на следующем проходе
+            logger.warning(f"[BROADCAST] Рассылка {job_id} приостановлена, бот недоступен: {e}")
+            await BroadcastMessage.filter(id=job_id).update(
+                error=f"Бот недоступен, рассылка будет продолжена: {e}",
+                updated_at=datetime.utcnow(),
+                lease_until=None,
+            )
+        except Exception as e:
+            await cls._fail(job_id, e)
+
+    @staticmethod
+    async def _fail(job_id: int, e: Exception):
+        logger.error(f"[BROADCAST] Рассылка {job_id} прервана: {e}")
+        await BroadcastMessage.filter(id=job_id).update(
+            status=BroadcastMessage.STATUS_FAILED,
+            error=str(e),
+            finished_at=datetime.utcnow(),
+            lease_until=None,
+        )
+
+    @classmethod
+    async def resume_jobs(cls) -> int:
+        """
+        Продолжить незавершённые рассылки, которые никто не выполняет:
+        аренды нет или она истекла (процесс, который вёл рассылку, упал)
+        """
+        job_ids = await BroadcastMessage.filter(
+            Q(lease_until__isnull=True) | Q(lease_until__lt=datetime.utcnow()),
+            status__in=[BroadcastMessage.STATUS_PENDING, BroadcastMessage.STATUS_RUNNING],
+        ).order_by("id").values_list("id", flat=True)
+        resumed = 0
+        for job_id in job_ids:
+            task = cls._tasks.get(job_id)
+            if task and not task.done():
+                continue
+            logger.info(f"[BROADCAST] Продолжение рассылки {job_id}")
+            cls.start(job_id)
+            resumed += 1
+        return resumed
+
+    @classmethod
+    async def run_resumer(cls, interval: float = BROADCAST_RESUME_INTERVAL):
+        """
+        Фоновая задача: при старте и затем периодически подхватывает рассылки
+        с истёкшей арендой. Захват в run_job атомарный, поэтому несколько
+        воркеров могут проверять одновременно - рассылку возьмёт один.
+        """
+        while True:
+            try:
+                await cls.resume_jobs()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[BROADCAST] Ошибка при продолжении рассылок: {e}")
+            await asyncio.sleep(interval)
+
+    @classmethod
+    async def shutdown(cls):
+        tasks = list(cls._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def progress(job: BroadcastMessage) -> dict:
+        processed = job.sent_count + job.failed_count
+        remaining = 0 if job.status == BroadcastMessage.STATUS_COMPLETED else max(job.total_count - processed, 0)
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "target": job.audience,
+            "media": len(job.media or []),
+            "total": job.total_count,
+            "sent": job.sent_count,
+            "failed": job.failed_count,
+            "remaining": remaining,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    @classmethod
+    async def get_progress(cls, job_id: int) -> Optional[dict]:
+        job = await BroadcastMessage.get_or_none(id=job_id)
+        return cls.progress(job) if job else None
+
+    @classmethod
+    async def list_jobs(cls, limit: int = 20) -> list:
+        jobs = await BroadcastMessage.all().order_by("-id").limit(limit)
+        return [cls.progress(job) for job in jobs]
@@ -0,0 +1,112 @@
+"""
+Сколько соединений открывает FalAIClient на пачке заданий (локальная заглушка FAL).
+
+Заглушка отвечает как очередь FAL: POST модели возвращает response_url,
+который несколько раз отдаёт IN_PROGRESS, затем результат. Сравниваются:
+  per-call - новый httpx-клиент на каждый запрос (как было раньше);
+  pooled   - общий клиент FalAIClient с пулом соединений.
+
+Заглушка работает по HTTP/1.1 без TLS, поэтому число соединений ограничено
+пулом (FAL_MAX_CONNECTIONS); с fal.run по HTTP/2 запросы дополнительно
+мультиплексируются в этих соединениях.
+
+Запуск: python -m backend.services.fal_benchmark --jobs 50
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import httpx
+from aiohttp import web
+
+from backend.services.fal_service import FalAIClient
+
+
+class PerCallFalAIClient(FalAIClient):
+    """Прежнее поведение: отдельный клиент (и соединение) на каждый запрос"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._clients: list = []
+
+    def _get_client(self) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(timeout=self.max_wait_seconds)
+        self._clients.append(client)
+        return client
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(client.aclose() for client in self._clients))
+        self._clients.clear()
+
+
+def stub_fal(polls_before_ready: int, peers: set) -> web.Application:
+    ids = itertools.count(1)
+    polls: dict = {}
+
+    async def invoke(request: web.Request):
+        peers.add(request.transport.get_extra_info("peername"))
+        request_id = next(ids)
+        polls[request_id] = 0
+        base = f"{request.scheme}://{request.host}"
+        return web.json_response({"request_id": request_id, "response_url": f"{base}/requests/{request_id}"})
+
+    async def result(request: web.Request):
+        peers.add(request.transport.get_extra_info("peername"))
+        request_id = int(request.match_info["request_id"])
+        polls[request_id] += 1
+        if polls[request_id] <= polls_before_ready:
+            return web.json_response({"status": "IN_PROGRESS"})
+        return web.json_response({"images": [{"url": f"https://cdn.local/{request_id}.png"}]})
+
+    app = web.Application()
+    app.router.add_post("/fal-ai/stub-model", invoke)
+    app.router.add_get("/requests/{request_id}", result)
+    return app
+
+
+async def burst(client: FalAIClient, jobs: int) -> float:
+    started = time.perf_counter()
+    results = await asyncio.gather(*(client.generate_image(f"prompt {i}") for i in range(jobs)))
+    assert all(result.get("images") for result in results)
+    return time.perf_counter() - started
+
+
+async def run_benchmark(args):
+    import logging
+    logging.getLogger("fal_service").setLevel(logging.WARNING)
+
+    peers: set = set()
+    runner = web.AppRunner(stub_fal(args.polls, peers))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    try:
+        for mode, client_cls in (("per-call", PerCallFalAIClient), ("pooled", FalAIClient)):
+            client = client_cls()
+            client.api_key = "stub"
+            client.base_url = f"http://127.0.0.1:{args.port}"
+            client.default_image_model = "fal-ai/stub-model"
+            client.poll_interval = args.poll_interval
+            peers.clear()
+            try:
+                elapsed = await burst(client, args.jobs)
+            finally:
+                await client.aclose()
+            requests_made = args.jobs * (args.polls + 2)
+            print(f"{mode:9} заданий {args.jobs}, запросов {requests_made}, соединений {len(peers)}, {elapsed:.2f} с")
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=3, help="ответов IN_PROGRESS до результата")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8097)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ from typing import Any, Dict, Optional, Sequence
 import httpx
 from dotenv import load_dotenv
 
+from backend.services.result_cache import ResultCacheService, fal_result_cache
+
 load_dotenv()
 
 logger = logging.getLogger("fal_service")
@@ -33,10 +35,43 @@ class FalAIClient:
         self.max_retries = int(os.getenv("FAL_MAX_RETRIES", "3"))
         self.retry_backoff = float(os.getenv("FAL_RETRY_BACKOFF", "1.5"))
         self.default_image_prompt_strength = float(os.getenv("FAL_IMAGE_PROMPT_STRENGTH", "0.85"))
+        # Очередь FAL (submit -> status -> result): задание ждёт опросами,
+        # не занимая ни потока, ни открытого запроса
+        self.queue_base_url = os.getenv("FAL_QUEUE_BASE_URL", "https://queue.fal.run").rstrip("/")
+        self.queue_max_wait_seconds = float(os.getenv("FAL_QUEUE_MAX_WAIT_SECONDS", "600"))
+        # Сколько заданий процесс держит в очереди FAL одновременно; остальные ждут слота
+        self.max_concurrent_jobs = int(os.getenv("FAL_MAX_CONCURRENT_JOBS", "200"))
+        self._job_slots = asyncio.Semaphore(self.max_concurrent_jobs)
+        # Пул соединений общего HTTP/2 клиента: запросы и опросы статуса
+        # мультиплексируются в уже открытых соединениях. keep-alive пул не меньше
+        # общего лимита, иначе при пиках соединения закрываются и открываются заново
+        max_connections = int(os.getenv("FAL_MAX_CONNECTIONS", "20"))
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=int(os.getenv("FAL_MAX_KEEPALIVE_CONNECTIONS", str(max_connections))),
+            keepalive_expiry=float(os.getenv("FAL_KEEPALIVE_EXPIRY", "60")),
+        )
+        self._client: Optional[httpx.AsyncClient] = None
 
         if not self.api_key:
             logger.warning("FAL_API_KEY не установлен. Генерация изображений недоступна.")
 
+    def _get_client(self) -> httpx.AsyncClient:
+        """Общий клиент процесса (создаётся при первом запросе)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                limits=self.limits,
+                timeout=httpx.Timeout(self.max_wait_seconds, connect=10.0),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Закрыть общий клиент (при остановке приложения)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     def _headers(self) -> Dict[str, str]:
         return {
             "Authorization": f"Key {self.api_key}",
@@ -72,50 +107,44 @@ class FalAIClient:
 
         loop = asyncio.get_running_loop()
         deadline = loop.time() + self.max_wait_seconds
-        async with httpx.AsyncClient(timeout=self.max_wait_seconds, http2=True) as client:
-            while True:
-                if loop.time() > deadline:
-                    raise FalAIError("Таймаут ожидания ответа FAL AI")
-
-                try:
-                    response = await client.get(url, headers=self._headers())
-                except httpx.HTTPError as exc:
-                    logger.error("FAL AI polling failed: %s", exc)
-                    raise FalAIError("Ошибка сети при получении ответа FAL AI") from exc
-                if response.status_code >= 400:
-                    logger.error("FAL AI error %s: %s", response.status_code, response.text)
-                    raise FalAIError(
-                        f"FAL AI error {response.status_code}: {response.text}",
-                    )
-
-                try:
-                    data = response.json()
-                except ValueError as exc:
-                    logger.error("FAL AI вернул некорректный JSON: %s", response.text)
-                    raise FalAIError("FAL AI вернул некорректный JSON") from exc
-
-                status = str(data.get("status") or data.get("state") or "").upper()
-                if status in {"PENDING", "IN_PROGRESS", "RUNNING"}:
-                    await asyncio.sleep(self.poll_interval)
-                    continue
+        client = self._get_client()
+        while True:
+            if loop.time() > deadline:
+                raise FalAIError("Таймаут ожидания ответа FAL AI")
 
-                return data
+            try:
+                response = await client.get(url, headers=self._headers())
+            except httpx.HTTPError as exc:
+                logger.error("FAL AI polling failed: %s", exc)
+                raise FalAIError("Ошибка сети при получении ответа FAL AI") from exc
+            if response.status_code >= 400:
+                logger.error("FAL AI error %s: %s", response.status_code, response.text)
+                raise FalAIError(
+                    f"FAL AI error {response.status_code}: {response.text}",
+                )
 
-    async def _invoke_model(self, model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        if not self.api_key:
-            raise FalAIError("FAL_API_KEY не задан")
-        if not model:
-            raise FalAIError("Не указан идентификатор модели FAL AI")
+            try:
+                data = response.json()
+            except ValueError as exc:
+                logger.error("FAL AI вернул некорректный JSON: %s", response.text)
+                raise FalAIError("FAL AI вернул некорректный JSON") from exc
 
-        url = self._build_model_url(model)
+            status = str(data.get("status") or data.get("state") or "").upper()
+            if status in {"PENDING", "IN_PROGRESS", "RUNNING"}:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            return data
+
+    async def _post_json(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST с повторами при сетевых ошибках; ответ - разобранный JSON"""
         headers = self._headers()
         response: Optional[httpx.Response] = None
         last_exc: Optional[Exception] = None
 
         for attempt in range(1, max(self.max_retries, 1) + 1):
             try:
-                async with httpx.AsyncClient(timeout=self.max_wait_seconds, http2=True) as client:
-                    response = await client.post(url, headers=headers, json=payload)
+                response = await self._get_client().post(url, headers=headers, json=payload)
                 break
             except httpx.HTTPError as exc:
                 last_exc = exc
@@ -144,6 +173,30 @@ class FalAIClient:
         except ValueError as exc:
             logger.error("FAL AI вернул некорректный JSON: %s", response.text)
             raise FalAIError("FAL AI вернул некорректный JSON") from exc
+        return data
+
+    async def _get_json(self, url: str) -> Dict[str, Any]:
+        try:
+            response = await self._get_client().get(url, headers=self._headers())
+        except httpx.HTTPError as exc:
+            logger.error("FAL AI request failed: %s", exc)
+            raise FalAIError("Ошибка сети при обращении к FAL AI") from exc
+        if response.status_code >= 400:
+            logger.error("FAL AI error %s: %s", response.status_code, response.text)
+            raise FalAIError(f"FAL AI error {response.status_code}: {response.text}")
+        try:
+            return response.json()
+        except ValueError as exc:
+            logger.error("FAL AI вернул некорректный JSON: %s", response.text)
+            raise FalAIError("FAL AI вернул некорректный JSON") from exc
+
+    async def _invoke_model(self, model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.api_key:
+            raise FalAIError("FAL_API_KEY не задан")
+        if not model:
+            raise FalAIError("Не указан идентификатор модели FAL AI")
+
+        data = await self._post_json(self._build_model_url(model), payload)
 
         # Если ответ содержит ссылку на итоговый результат — дожидаемся его.
         response_url = data.get("response_url")
@@ -169,9 +222,14 @@ class FalAIClient:
         seed: Optional[int] = None,
         model: Optional[str] = None,
         extra: Optional[Dict[str, Any]] = None,
+        cache: bool = False,
     ) -> Dict[str, Any]:
         """
         Запускает генерацию изображения через FAL AI.
+
+        cache - брать результат из кэша по содержимому запроса. Включается
+        вызывающим, только когда seed зафиксирован явно: иначе повторная
+        генерация должна давать новое изображение.
         """
         logger.info("=== FAL AI GENERATION PROMPT ===")
         logger.info("Final prompt:\n%s", prompt)
@@ -215,7 +273,19 @@ class FalAIClient:
             payload.update({k: v for k, v in extra.items() if v is not None})
 
         model_name = model or self.default_image_model
-        return await self._invoke_model(model_name, payload)
+        if not cache:
+            return await self._invoke_model(model_name, payload)
+
+        await ResultCacheService.sync_epoch()
+        cache_key = fal_result_cache.key(model_name, payload)
+        cached = fal_result_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Результат генерации взят из кэша: %s", cache_key[:16])
+            return cached
+        result = await self._invoke_model(model_name, payload)
+        if result.get("images"):
+            fal_result_cache.set(cache_key, result)
+        return result
 
     async def upscale_image(
         self,
@@ -255,8 +325,7 @@ class FalAIClient:
                 raise FalAIError("Не удалось определить модель для статуса задания")
             url = f"{self._normalized_base_url()}/{model.strip('/')}/requests/{job_reference}"
 
-        async with httpx.AsyncClient(timeout=self.max_wait_seconds, http2=True) as client:
-            response = await client.get(url, headers=self._headers())
+        response = await self._get_client().get(url, headers=self._headers())
 
         if response.status_code >= 400:
             logger.error("FAL AI job error %s: %s", response.status_code, response.text)
@@ -268,6 +337,89 @@ class FalAIClient:
             logger.error("FAL AI вернул некорректный JSON: %s", response.text)
             raise FalAIError("FAL AI вернул некорректный JSON") from exc
 
+    # ---------- Очередь FAL ----------
+
+    def _build_queue_url(self, model: str) -> str:
+        return f"{self.queue_base_url}/{model.strip('/')}"
+
+    async def submit(self, model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ставит задание в очередь FAL AI.
+        Возвращает описатель: request_id, status_url, response_url, cancel_url.
+        """
+        if not self.api_key:
+            raise FalAIError("FAL_API_KEY не задан")
+        if not model:
+            raise FalAIError("Не указан идентификатор модели FAL AI")
+
+        handle = await self._post_json(self._build_queue_url(model), payload)
+        if not handle.get("status_url") or not handle.get("response_url"):
+            raise FalAIError("FAL AI не вернул адреса задания в очереди")
+        return handle
+
+    async def queue_status(self, handle: Dict[str, Any]) -> Dict[str, Any]:
+        """Статус задания: IN_QUEUE, IN_PROGRESS или COMPLETED"""
+        return await self._get_json(handle["status_url"])
+
+    async def queue_result(self, handle: Dict[str, Any]) -> Dict[str, Any]:
+        """Результат завершённого задания"""
+        return await self._get_json(handle["response_url"])
+
+    async def cancel(self, handle: Dict[str, Any]) -> None:
+        """Отменить задание (если оно ещё в очереди), ошибки только логируются"""
+        url = handle.get("cancel_url")
+        if not url:
+            return
+        try:
+            await self._get_client().put(url, headers=self._headers())
+        except httpx.HTTPError as exc:
+            logger.warning("FAL AI cancel failed: %s", exc)
+
+    async def run_queued(
+        self,
+        model: str,
+        payload: Dict[str, Any],
+        *,
+        max_wait_seconds: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Выполняет задание через очередь: submit -> опрос статуса -> результат.
+
+        Одновременно выполняется не более max_concurrent_jobs заданий,
+        остальные ждут слота. Между опросами - asyncio.sleep, потоки не заняты.
+        При таймауте или отмене задание снимается с очереди FAL.
+        """
+        async with self._job_slots:
+            handle = await self.submit(model, payload)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + (max_wait_seconds or self.queue_max_wait_seconds)
+            poll_errors = 0
+            try:
+                while True:
+                    try:
+                        status = await self.queue_status(handle)
+                        poll_errors = 0
+                    except FalAIError:
+                        # Разовый сбой опроса не прерывает генерацию
+                        poll_errors += 1
+                        if poll_errors >= self.max_retries:
+                            raise
+                        status = {}
+
+                    state = str(status.get("status") or "").upper()
+                    if state == "COMPLETED":
+                        break
+                    if status and state not in {"IN_QUEUE", "IN_PROGRESS"}:
+                        raise FalAIError(f"Неожиданный статус задания FAL AI: {status}")
+                    if loop.time() > deadline:
+                        raise FalAIError("Таймаут ожидания ответа FAL AI")
+                    await asyncio.sleep(self.poll_interval)
+            except (FalAIError, asyncio.CancelledError):
+                await self.cancel(handle)
+                raise
+
+            return await self.queue_result(handle)
+
     async def health_check(self) -> Dict[str, Any]:
         """
         Проверяет доступность FAL AI API (через HEAD запрос к модели).
@@ -280,8 +432,7 @@ class FalAIClient:
             raise FalAIError("Не задана модель для health-check")
 
         url = self._build_model_url(model)
-        async with httpx.AsyncClient(timeout=10, http2=True) as client:
-            response = await client.head(url, headers=self._headers())
+        response = await self._get_client().head(url, headers=self._headers(), timeout=10)
 
         if response.status_code >= 400:
             logger.error("FAL AI health error %s: %s", response.status_code, response.text)
@@ -9,6 +9,7 @@ from fastapi import HTTPException
 
 from backend.models.file import AccessFile
 from backend.models import AccessGroup, Subscription, User
+from backend.services.profile_cache import ProfileCache
 
 logger = logging.getLogger(__name__)
 
@@ -84,6 +85,7 @@ class FileService:
         file.last_updated = datetime.now(timezone.utc)
         file.locked_until = datetime.now(timezone.utc) + timedelta(minutes=10)
         await file.save()
+        await ProfileCache.invalidate_group(file.group_id)
         return file
 
     @staticmethod
@@ -112,6 +114,7 @@ class FileService:
         file.last_updated = datetime.now(timezone.utc)
         file.locked_until = datetime.now(timezone.utc) + timedelta(minutes=10)
         await file.save()
+        await ProfileCache.invalidate_group(file.group_id)
         
         logger.info(f"Создан пустой файл куков для файла {file.id}: {cookie_file_path}")
         return file
@@ -203,6 +206,7 @@ class FileService:
         file.last_updated = datetime.now(timezone.utc)
         file.locked_until = datetime.now(timezone.utc) + timedelta(minutes=10)
         await file.save()
+        await ProfileCache.invalidate_group(file.group_id)
         return file
 
     @staticmethod
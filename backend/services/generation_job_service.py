@@ -0,0 +1,191 @@
+import logging
+import os
+import random
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+
+from backend.models import GenerationJob, TokenReservation, User
+from backend.schemas.generation import GenerationJobCreate
+from backend.services.token_service import TokenService
+
+logger = logging.getLogger(__name__)
+
+# Резерв токенов под задание живёт дольше обычного: задание может стоять в очереди.
+# При старте задания резерв продлевается ещё на столько же - срок должен с запасом
+# покрывать выполнение (ожидание очереди FAL - до FAL_QUEUE_MAX_WAIT_SECONDS)
+GENERATION_RESERVATION_TTL = int(os.getenv("GENERATION_RESERVATION_TTL", "3600"))
+# Сколько раз задание можно начать: прерванное перезапуском бота продолжается,
+# но задание, которое раз за разом роняет бота, снимается с возвратом токенов
+GENERATION_MAX_ATTEMPTS = int(os.getenv("GENERATION_MAX_ATTEMPTS", "3"))
+
+# Seed задания, если клиент его не передал: диапазон принимают все модели FAL
+GENERATION_SEED_LIMIT = 2**31
+
+UNFINISHED_STATUSES = [GenerationJob.STATUS_QUEUED, GenerationJob.STATUS_RUNNING]
+
+
+class GenerationJobService:
+    """Очередь заданий генерации: постановка с резервом токенов и смена статусов"""
+
+    @staticmethod
+    async def _get(job_id: int) -> GenerationJob:
+        job = await GenerationJob.get_or_none(id=job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Задание не найдено")
+        return job
+
+    @staticmethod
+    def _own_job(job: GenerationJob, tg_id: int) -> GenerationJob:
+        """Задание с тем же ключом идемпотентности, но другого пользователя - не повтор"""
+        if job.tg_id != tg_id:
+            raise HTTPException(status_code=409, detail="Ключ идемпотентности уже использован другим пользователем")
+        return job
+
+    @staticmethod
+    async def _balance(tg_id: int) -> Optional[int]:
+        return await User.filter(tg_id=tg_id).first().values_list("bonus_balance", flat=True)
+
+    @classmethod
+    async def create(cls, data: GenerationJobCreate) -> Tuple[GenerationJob, Optional[int]]:
+        """
+        Поставить задание: токены резервируются сразу (402, если не хватает),
+        списываются при выдаче результата и возвращаются при ошибке.
+        """
+        if data.idempotency_key:
+            existing = await GenerationJob.get_or_none(idempotency_key=data.idempotency_key)
+            if existing:
+                return cls._own_job(existing, data.tg_id), await cls._balance(existing.tg_id)
+
+        reservation = await TokenService.reserve(
+            data.tg_id,
+            TokenService.ACTION_IMAGE_GENERATION,
+            GENERATION_RESERVATION_TTL,
+            f"generation:{data.idempotency_key}" if data.idempotency_key else None,
+        )
+        try:
+            job = await GenerationJob.create(
+                **data.model_dump(exclude={"seed", "use_cache"}),
+                seed=data.seed if data.seed is not None else random.randrange(GENERATION_SEED_LIMIT),
+                # Случайный seed кэш не включает: повтор запроса - это новая генерация
+                use_cache=data.use_cache or data.seed is not None,
+                reservation_id=reservation["reservation_id"],
+                cost=reservation["cost"],
+            )
+        except IntegrityError:
+            if not data.idempotency_key:
+                raise
+            # Параллельный повтор с тем же ключом уже поставил задание (резерв у них общий)
+            job = cls._own_job(await GenerationJob.get(idempotency_key=data.idempotency_key), data.tg_id)
+        except Exception:
+            await TokenService.release(reservation["reservation_id"])
+            raise
+        return job, reservation["balance"]
+
+    @classmethod
+    async def update(cls, job_id: int, status_message_id: Optional[int]) -> GenerationJob:
+        """Запомнить сообщение "Генерирую..." (удаляется при выдаче результата)"""
+        await GenerationJob.filter(id=job_id).update(status_message_id=status_message_id)
+        return await cls._get(job_id)
+
+    @classmethod
+    async def start(cls, job_id: int) -> Tuple[GenerationJob, Optional[bool]]:
+        """
+        Воркер взял задание; повторный start после перезапуска бота допустим.
+
+        Резерв токенов продлевается на время выполнения. Если резерв уже
+        закрыт (истёк, пока задание ждало) или попытки исчерпаны, задание
+        снимается через fail() - результат после возврата токенов не выдаётся.
+        Возвращает задание и refunded (None, если задание запущено).
+        """
+        job = await cls._get(job_id)
+        if job.status not in UNFINISHED_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Задание уже завершено (статус: {job.status})")
+
+        if job.attempts >= GENERATION_MAX_ATTEMPTS:
+            logger.warning(f"Задание {job.id}: исчерпаны попытки ({job.attempts}), задание снято")
+            return await cls.fail(job_id, f"Генерация прерывалась {job.attempts} раз(а) и отменена")
+
+        if job.reservation_id and not await TokenService.extend(job.reservation_id, GENERATION_RESERVATION_TTL):
+            logger.warning(f"Задание {job.id}: резерв {job.reservation_id} закрыт до начала генерации")
+            return await cls.fail(job_id, "Резерв токенов истёк до начала генерации")
+
+        started = await GenerationJob.filter(id=job_id, status__in=UNFINISHED_STATUSES).update(
+            status=GenerationJob.STATUS_RUNNING,
+            attempts=F("attempts") + 1,
+            started_at=datetime.utcnow(),
+        )
+        job = await cls._get(job_id)
+        if not started:
+            raise HTTPException(status_code=409, detail=f"Задание уже завершено (статус: {job.status})")
+        return job, None
+
+    @classmethod
+    async def complete(
+        cls, job_id: int, result_url: str, prompt: Optional[str] = None, cached: bool = False
+    ) -> Tuple[GenerationJob, bool]:
+        """
+        Результат выдан: задание завершено, резерв токенов подтверждён.
+        Результат из кэша (cached) новой генерации не стоил - резерв возвращается.
+        Возвращает задание и refunded.
+        """
+        values = {
+            "status": GenerationJob.STATUS_COMPLETED,
+            "result_url": result_url,
+            "error": None,
+            "finished_at": datetime.utcnow(),
+        }
+        if prompt:
+            values["prompt"] = prompt
+        completed = await GenerationJob.filter(id=job_id, status__in=UNFINISHED_STATUSES).update(**values)
+
+        job = await cls._get(job_id)
+        if not completed:
+            if job.status == GenerationJob.STATUS_COMPLETED:
+                return job, False
+            raise HTTPException(status_code=409, detail=f"Задание уже завершено (статус: {job.status})")
+
+        if not job.reservation_id:
+            return job, False
+        if cached:
+            return job, await cls._release(job)
+        try:
+            await TokenService.commit(job.reservation_id)
+        except HTTPException as e:
+            # start() продлевает резерв на всё время выполнения - сюда попадать не должны
+            logger.error(f"Задание {job.id}: резерв {job.reservation_id} не подтверждён: {e.detail}")
+        return job, False
+
+    @staticmethod
+    async def _release(job: GenerationJob) -> bool:
+        """Вернуть резерв задания; True, если токены вернулись на баланс"""
+        try:
+            result = await TokenService.release(job.reservation_id)
+        except HTTPException as e:
+            logger.warning(f"Задание {job.id}: резерв {job.reservation_id} не освобождён: {e.detail}")
+            return False
+        return result["status"] in (TokenReservation.STATUS_RELEASED, TokenReservation.STATUS_EXPIRED)
+
+    @classmethod
+    async def fail(cls, job_id: int, error: str) -> Tuple[GenerationJob, bool]:
+        """Задание не выполнено: токены возвращаются на баланс"""
+        failed = await GenerationJob.filter(id=job_id, status__in=UNFINISHED_STATUSES).update(
+            status=GenerationJob.STATUS_FAILED,
+            error=error,
+            finished_at=datetime.utcnow(),
+        )
+        job = await cls._get(job_id)
+        if not failed:
+            if job.status == GenerationJob.STATUS_FAILED:
+                return job, False
+            raise HTTPException(status_code=409, detail=f"Задание уже завершено (статус: {job.status})")
+
+        return job, bool(job.reservation_id) and await cls._release(job)
+
+    @staticmethod
+    async def list_unfinished() -> List[GenerationJob]:
+        """Задания, которые бот должен продолжить после перезапуска"""
+        return await GenerationJob.filter(status__in=UNFINISHED_STATUSES).order_by("id")
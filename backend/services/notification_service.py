@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+
+from backend.models import Notification
+
+logger = logging.getLogger(__name__)
+
+BOT_API_URL = os.getenv("BOT_API_URL", "http://bot:8001")
+
+# Уведомлений в одном запросе к боту
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "100"))
+# Как часто проверять outbox, если новых уведомлений в этом процессе не было
+NOTIFY_POLL_INTERVAL = float(os.getenv("NOTIFY_POLL_INTERVAL", "5"))
+# Повторы: 5 с, 10 с, 20 с, ... но не реже чем раз в 15 минут
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+NOTIFY_RETRY_BASE = float(os.getenv("NOTIFY_RETRY_BASE", "5"))
+NOTIFY_RETRY_MAX = float(os.getenv("NOTIFY_RETRY_MAX", "900"))
+# Срок аренды взятой в отправку пачки: если процесс упал, её заберёт другой
+NOTIFY_LEASE_SECONDS = float(os.getenv("NOTIFY_LEASE_SECONDS", "300"))
+NOTIFY_BOT_TIMEOUT = float(os.getenv("NOTIFY_BOT_TIMEOUT", "60"))
+
+
+class NotificationService:
+    """
+    Outbox уведомлений пользователям.
+
+    enqueue() только добавляет запись; фоновый диспетчер забирает пачку
+    готовых к отправке записей (с меткой claim_token, поэтому несколько
+    процессов backend не отправят одно уведомление дважды) и отправляет
+    её одним запросом в /notify/bulk бота. Неудачные попытки повторяются
+    с экспоненциальной задержкой.
+    """
+
+    _wakeup: Optional[asyncio.Event] = None
+
+    @classmethod
+    def _event(cls) -> asyncio.Event:
+        if cls._wakeup is None:
+            cls._wakeup = asyncio.Event()
+        return cls._wakeup
+
+    @classmethod
+    async def enqueue(cls, tg_id: int, message: str, using_db=None) -> Notification:
+        """Поставить уведомление в очередь на отправку"""
+        notification = await Notification.create(
+            tg_id=tg_id,
+            message=message,
+            next_attempt_at=datetime.utcnow(),
+            using_db=using_db,
+        )
+        cls._event().set()
+        return notification
+
+    @staticmethod
+    def retry_delay(attempts: int) -> float:
+        return min(NOTIFY_RETRY_BASE * 2 ** (attempts - 1), NOTIFY_RETRY_MAX)
+
+    @staticmethod
+    async def claim_batch(limit: int = NOTIFY_BATCH_SIZE) -> list:
+        """Забрать пачку готовых к отправке уведомлений (и просроченных аренд)"""
+        now = datetime.utcnow()
+        claimable = {
+            "status__in": [Notification.STATUS_PENDING, Notification.STATUS_SENDING],
+            "next_attempt_at__lte": now,
+        }
+        ids = await Notification.filter(**claimable).order_by("id").limit(limit).values_list("id", flat=True)
+        if not ids:
+            return []
+
+        claim_token = uuid.uuid4().hex
+        # Условие повторяется в UPDATE: запись, которую успел забрать другой процесс, не попадёт в пачку
+        await Notification.filter(id__in=list(ids), **claimable).update(
+            status=Notification.STATUS_SENDING,
+            claim_token=claim_token,
+            next_attempt_at=now + timedelta(seconds=NOTIFY_LEASE_SECONDS),
+        )
+        return await Notification.filter(claim_token=claim_token).order_by("id")
+
+    @staticmethod
+    async def _post_batch(client: httpx.AsyncClient, batch: list) -> dict:
+        """Отправить пачку боту. Возвращает id -> результат"""
+        response = await client.post(
+            f"{BOT_API_URL}/notify/bulk",
+            json={"notifications": [
+                {"id": n.id, "tg_id": n.tg_id, "message": n.message} for n in batch
+            ]},
+        )
+        response.raise_for_status()
+        return {item["id"]: item for item in response.json().get("results", [])}
+
+    @classmethod
+    async def _record_results(cls, batch: list, results: dict, error: Optional[str] = None):
+        now = datetime.utcnow()
+        sent_ids = [n.id for n in batch if results.get(n.id, {}).get("ok")]
+        if sent_ids:
+            await Notification.filter(id__in=sent_ids).update(
+                status=Notification.STATUS_SENT, sent_at=now, last_error=None
+            )
+
+        # Неудачные группируются по новому состоянию, чтобы обновлять их пачками
+        groups: dict = {}
+        for n in batch:
+            result = results.get(n.id)
+            if result and result.get("ok"):
+                continue
+            attempts = n.attempts + 1
+            reason = (result or {}).get("error") or error or "Нет ответа от бота"
+            if (result or {}).get("undeliverable") or attempts >= NOTIFY_MAX_ATTEMPTS:
+                key = (Notification.STATUS_FAILED, attempts, None, reason)
+            else:
+                next_attempt_at = now + timedelta(seconds=cls.retry_delay(attempts))
+                key = (Notification.STATUS_PENDING, attempts, next_attempt_at, reason)
+            groups.setdefault(key, []).append(n.id)
+
+        for (status, attempts, next_attempt_at, reason), ids in groups.items():
+            fields = {"status": status, "attempts": attempts, "last_error": reason[:1000]}
+            if next_attempt_at:
+                fields["next_attempt_at"] = next_attempt_at
+            await Notification.filter(id__in=ids).update(**fields)
+
+    @classmethod
+    async def dispatch_once(cls, client: httpx.AsyncClient) -> int:
+        """Отправить одну пачку. Возвращает число взятых уведомлений"""
+        batch = await cls.claim_batch()
+        if not batch:
+            return 0
+
+        try:
+            results = await cls._post_batch(client, batch)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"[NOTIFY] Бот недоступен, {len(batch)} уведомлений отложены: {e}")
+            await cls._record_results(batch, {}, error=str(e))
+        else:
+            await cls._record_results(batch, results)
+        return len(batch)
+
+    @classmethod
+    async def run_dispatcher(cls):
+        """Фоновая задача: отправка уведомлений из outbox"""
+        event = cls._event()
+        async with httpx.AsyncClient(timeout=NOTIFY_BOT_TIMEOUT) as client:
+            while True:
+                event.clear()
+                try:
+                    claimed = await cls.dispatch_once(client)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"[NOTIFY] Ошибка диспетчера уведомлений: {e}")
+                    claimed = 0
+
+                if claimed >= NOTIFY_BATCH_SIZE:
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), NOTIFY_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
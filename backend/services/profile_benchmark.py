@@ -0,0 +1,115 @@
+"""
+Задержка GET /api/profile/{tg_id} под параллельной нагрузкой (SQLite во временном файле).
+
+Запросы идут в приложение FastAPI в памяти (httpx.ASGITransport), каждый
+пользователь - отдельный tg_id с активной подпиской и файлом группы.
+Сравниваются:
+  cold   - кэш профилей пуст, каждый запрос выполняет полный запрос профиля;
+  cached - профили в кэше, запрос проверяет только users.profile_version.
+
+Клиент и приложение работают в одном event loop, поэтому в задержку входит
+обработка всех одновременных запросов в этом процессе: для сравнения режимов
+и версий, а не как оценка продакшена.
+
+Запуск: python -m backend.services.profile_benchmark --users 200 --rounds 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from tortoise import Tortoise
+
+from backend.core.db import build_tortoise_config, seed_reference_data
+from backend.core.lookups import refresh_lookups
+from backend.core.migrations import apply_migrations
+from backend.models import AccessFile, AccessGroup, Status, Subscription, Tariff, User
+from backend.services.profile_cache import ProfileCache
+
+
+async def create_users(count: int) -> list:
+    group = await AccessGroup.create(name="benchmark")
+    await AccessFile.create(group=group, path="/app/data/benchmark.txt")
+    tariff = await Tariff.first()
+    active = await Status.get(type="subscription", code="ACTIVE")
+    await User.bulk_create([User(tg_id=100000 + i, username=f"user{i}") for i in range(count)])
+    users = await User.filter(tg_id__gte=100000).order_by("tg_id")
+    await Subscription.bulk_create([
+        Subscription(
+            user=user,
+            tariff_id=tariff.id,
+            status_id=active.id,
+            group=group,
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=30),
+        )
+        for user in users
+    ])
+    return [user.tg_id for user in users]
+
+
+async def timed_get(client: httpx.AsyncClient, tg_id: int) -> float:
+    started = time.perf_counter()
+    response = await client.get(f"/api/profile/{tg_id}")
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run_round(client: httpx.AsyncClient, tg_ids: list) -> list:
+    return await asyncio.gather(*(timed_get(client, tg_id) for tg_id in tg_ids))
+
+
+def report(mode: str, latencies: list, elapsed: float):
+    ms = sorted(latency * 1000 for latency in latencies)
+    p95 = statistics.quantiles(ms, n=100)[94]
+    print(
+        f"{mode:6} запросов {len(ms)}, p50 {statistics.median(ms):.1f} мс, p95 {p95:.1f} мс,"
+        f" max {ms[-1]:.1f} мс, {len(ms) / elapsed:.0f} запросов/с"
+    )
+
+
+async def run_benchmark(args):
+    from backend.app import create_app
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("backend.services.profile_cache").setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        await Tortoise.init(config=build_tortoise_config(f"sqlite://{os.path.join(tmp, 'benchmark.db')}"))
+        try:
+            await apply_migrations()
+            await Tortoise.generate_schemas()
+            await seed_reference_data()
+            await refresh_lookups()
+            tg_ids = await create_users(args.users)
+
+            transport = httpx.ASGITransport(app=create_app())
+            async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+                for mode in ("cold", "cached"):
+                    if mode == "cached":
+                        await run_round(client, tg_ids)  # прогрев кэша
+                    latencies = []
+                    started = time.perf_counter()
+                    for _ in range(args.rounds):
+                        if mode == "cold":
+                            # Только локальный кэш: версии в базе и кэш бота не трогаем
+                            ProfileCache._cache.clear()
+                        latencies += await run_round(client, tg_ids)
+                    report(mode, latencies, time.perf_counter() - started)
+        finally:
+            await Tortoise.close_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="одновременных запросов (разных пользователей)")
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
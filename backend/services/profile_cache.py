@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+from typing import Iterable, Optional
+
+import httpx
+from tortoise.expressions import F
+
+from backend.core.cache import TTLCache
+from backend.core.sql import sql_for
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+# Бот кэширует профили у себя; сбросы передаются ему пачкой за BOT_INVALIDATE_DELAY
+BOT_API_URL = os.getenv("BOT_API_URL", "http://bot:8001")
+BOT_INVALIDATE_DELAY = float(os.getenv("BOT_INVALIDATE_DELAY", "0.05"))
+BOT_INVALIDATE_TIMEOUT = float(os.getenv("BOT_INVALIDATE_TIMEOUT", "5"))
+
+
+# Версия профиля - одна строка по уникальному индексу: дешевле полного запроса профиля
+PROFILE_VERSION_QUERY = "SELECT profile_version FROM users WHERE tg_id = ?"
+
+
+class ProfileCache:
+    """
+    Кэш профилей пользователей по tg_id.
+
+    Кэш свой у каждого воркера uvicorn, поэтому запись хранится вместе
+    с users.profile_version, прочитанной тем же запросом, что и профиль.
+    Любое изменение профиля увеличивает версию в базе (invalidate*), и запись
+    выдаётся, только пока версия в базе с ней совпадает: сброс в одном воркере
+    сразу виден остальным, а профиль, прочитанный до сброса, не будет выдан после него.
+    TTL ограничивает память под давно не запрашиваемые профили. Каждый сброс также
+    передаётся кэшу профилей бота (POST /cache/invalidate).
+    """
+
+    _cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+    # Сбросы, ещё не переданные боту
+    _bot_tg_ids: set = set()
+    _bot_user_ids: set = set()
+    _bot_all = False
+    _bot_task: Optional[asyncio.Task] = None
+    _bot_client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def set(cls, profile, version: int, group_id: Optional[int] = None):
+        entry = cls._cache.get(profile.tg_id)
+        # Параллельный запрос мог уже положить более новую версию
+        if entry is None or entry[1] <= version:
+            cls._cache.set(profile.tg_id, (profile, version, group_id))
+
+    @classmethod
+    async def get_profile(cls, conn, tg_id: int):
+        """Профиль из кэша, если его версия совпадает с версией в базе, иначе None"""
+        entry = cls._cache.get(tg_id)
+        if entry is None:
+            return None
+        rows = await conn.execute_query_dict(sql_for(conn, PROFILE_VERSION_QUERY), [tg_id])
+        if not rows or rows[0]["profile_version"] != entry[1]:
+            cls._cache.pop(tg_id)
+            return None
+        return entry[0]
+
+    @classmethod
+    async def invalidate(cls, tg_id: Optional[int] = None, user_id: Optional[int] = None):
+        """Сбросить профиль по tg_id или по id пользователя (вызывать после записи изменений)"""
+        from backend.models import User
+        if user_id is not None:
+            await User.filter(id=user_id).update(profile_version=F("profile_version") + 1)
+            cls._bot_user_ids.add(user_id)
+        elif tg_id is not None:
+            await User.filter(tg_id=tg_id).update(profile_version=F("profile_version") + 1)
+        if tg_id is not None:
+            cls._cache.pop(tg_id)
+            cls._bot_tg_ids.add(tg_id)
+        cls._schedule_bot_invalidation()
+
+    @classmethod
+    async def invalidate_users(cls, user_ids: Iterable[int]):
+        from backend.models import User
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        await User.filter(id__in=list(user_ids)).update(profile_version=F("profile_version") + 1)
+        cls._bot_user_ids |= user_ids
+        cls._schedule_bot_invalidation()
+
+    @classmethod
+    async def invalidate_group(cls, group_id: int):
+        """Сбросить профили всех пользователей группы доступа (смена файла/названия)"""
+        from backend.models import Subscription, User
+        user_ids = await Subscription.filter(group_id=group_id).distinct().values_list("user_id", flat=True)
+        if user_ids:
+            await User.filter(id__in=list(user_ids)).update(profile_version=F("profile_version") + 1)
+        for tg_id, (_, _, cached_group_id) in cls._cache.items():
+            if cached_group_id == group_id:
+                cls._cache.pop(tg_id)
+        # Состав группы боту неизвестен, а смена файла группы редкая - сбрасывается весь его кэш
+        cls._bot_all = True
+        cls._schedule_bot_invalidation()
+
+    @classmethod
+    def clear(cls):
+        """Очистить кэш этого воркера и бота (версии в базе не меняются)"""
+        cls._cache.clear()
+        cls._bot_all = True
+        cls._schedule_bot_invalidation()
+
+    @classmethod
+    def _schedule_bot_invalidation(cls):
+        if cls._bot_task and not cls._bot_task.done():
+            return
+        try:
+            cls._bot_task = asyncio.get_running_loop().create_task(cls._flush_bot_invalidations())
+        except RuntimeError:
+            # Вне event loop (скрипты) - передавать некому
+            cls._bot_tg_ids, cls._bot_user_ids, cls._bot_all = set(), set(), False
+
+    @classmethod
+    async def _flush_bot_invalidations(cls):
+        """Передать накопленные сбросы боту одним запросом"""
+        while cls._bot_tg_ids or cls._bot_user_ids or cls._bot_all:
+            await asyncio.sleep(BOT_INVALIDATE_DELAY)
+            tg_ids, user_ids, everything = cls._bot_tg_ids, cls._bot_user_ids, cls._bot_all
+            cls._bot_tg_ids, cls._bot_user_ids, cls._bot_all = set(), set(), False
+            try:
+                if everything:
+                    payload = {"all": True}
+                else:
+                    if user_ids:
+                        from backend.models import User
+                        tg_ids |= set(await User.filter(id__in=list(user_ids)).values_list("tg_id", flat=True))
+                    payload = {"tg_ids": sorted(tg_ids)}
+                if cls._bot_client is None:
+                    cls._bot_client = httpx.AsyncClient(timeout=BOT_INVALIDATE_TIMEOUT)
+                await cls._bot_client.post(f"{BOT_API_URL}/cache/invalidate", json=payload)
+            except Exception as e:
+                # Запись в боте устареет не дольше его TTL
+                logger.warning(f"[PROFILE_CACHE] Не удалось сбросить кэш профилей бота: {e}")
+
+    @classmethod
+    async def aclose(cls):
+        if cls._bot_task and not cls._bot_task.done():
+            await asyncio.gather(cls._bot_task, return_exceptions=True)
+        if cls._bot_client is not None:
+            await cls._bot_client.aclose()
+            cls._bot_client = None
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "size": len(cls._cache),
+            "hits": cls._cache.hits,
+            "misses": cls._cache.misses,
+        }
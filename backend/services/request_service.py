@@ -1,7 +1,9 @@
 from datetime import datetime
 
 from matplotlib.dates import relativedelta
-from backend.models import Request, Status
+from backend.models import Request
+from backend.core.lookups import get_status
+from backend.services.profile_cache import ProfileCache
 from backend.models.subscription import AccessGroup, Subscription
 from backend.schemas import RequestOut
 from tortoise.exceptions import DoesNotExist
@@ -22,7 +24,7 @@ class RequestService:
     async def approve_request(request_id: int, group_id: int | None = None) -> dict:
         request = await Request.get(id=request_id).prefetch_related("user", "duration", "tariff")
 
-        status = await Status.get(type="subscription", code="ACTIVE")
+        status = await get_status(type="subscription", code="ACTIVE")
 
         request.status = status
         await request.save()
@@ -53,6 +55,7 @@ class RequestService:
             start_date=start_date,
             end_date=end_date
         )
+        await ProfileCache.invalidate(tg_id=request.user.tg_id, user_id=request.user.id)
 
         return {"message": f"Заявка {request_id} одобрена", "group": group.name, "duration_months": duration_months}
 
@@ -60,7 +63,7 @@ class RequestService:
     async def reject_request(request_id: int) -> dict:
         request = await Request.get(id=request_id)
 
-        status = await Status.get(type="request", code="REJECTED")
+        status = await get_status(type="request", code="REJECTED")
 
         request.status = status
         await request.save()
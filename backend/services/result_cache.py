@@ -0,0 +1,142 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Optional
+
+import httpx
+
+from backend.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Результаты FAL хранятся на CDN ограниченное время: кэш не должен выдавать мёртвые ссылки
+FAL_RESULT_CACHE_TTL = float(os.getenv("FAL_RESULT_CACHE_TTL", str(24 * 3600)))
+FAL_RESULT_CACHE_SIZE = int(os.getenv("FAL_RESULT_CACHE_SIZE", "1000"))
+
+BOT_API_URL = os.getenv("BOT_API_URL", "http://bot:8001")
+BOT_PURGE_TIMEOUT = float(os.getenv("BOT_INVALIDATE_TIMEOUT", "5"))
+
+# Номер "поколения" кэша в настройках: входит в ключ, поэтому сброс в одном
+# воркере uvicorn сразу виден остальным (версия настроек в БД).
+# Бот узнаёт поколение из сигнала сброса и при старте каждого задания генерации
+RESULT_CACHE_EPOCH_KEY = "fal_result_cache_epoch"
+
+
+class ResultCache:
+    """
+    Кэш результатов генерации по содержимому запроса.
+
+    Ключ - sha256 канонического JSON (модель + аргументы, ключи отсортированы),
+    поэтому одинаковые запросы совпадают независимо от порядка аргументов.
+    Имеет смысл только для детерминированных генераций: с фиксированным seed
+    или когда вызывающий явно согласен получить прошлый результат.
+    Ключи backend и бота строятся одинаково (key) и включают поколение кэша.
+    """
+
+    def __init__(self, maxsize: int = FAL_RESULT_CACHE_SIZE, ttl: float = FAL_RESULT_CACHE_TTL):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.epoch = "0"
+        self.purged = 0
+
+    @staticmethod
+    def make_key(model: str, arguments: dict, namespace: str = "") -> str:
+        canonical = json.dumps(
+            {"namespace": namespace, "model": model, "arguments": arguments},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def key(self, model: str, arguments: dict) -> str:
+        """Ключ запроса в текущем поколении кэша"""
+        return self.make_key(model, arguments, self.epoch)
+
+    def set_epoch(self, epoch) -> int:
+        """Перейти на поколение epoch; записи прежнего поколения удаляются"""
+        epoch = str(epoch)
+        if epoch == self.epoch:
+            return 0
+        self.epoch = epoch
+        return self.purge()
+
+    def get(self, key: str) -> Optional[Any]:
+        result = self.entries.get(key)
+        # Копия: вызывающий код может менять результат
+        return copy.deepcopy(result) if result is not None else None
+
+    def set(self, key: str, result: Any):
+        self.entries.set(key, copy.deepcopy(result))
+
+    def purge(self) -> int:
+        count = len(self.entries)
+        self.entries.clear()
+        self.purged += count
+        return count
+
+    def stats(self) -> dict:
+        lookups = self.entries.hits + self.entries.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.entries.hits,
+            "misses": self.entries.misses,
+            "hit_rate": round(self.entries.hits / lookups, 3) if lookups else None,
+            "purged": self.purged,
+            "epoch": self.epoch,
+        }
+
+
+# Один кэш на процесс (воркер backend или бот)
+fal_result_cache = ResultCache()
+
+
+class ResultCacheService:
+    """Поколение кэша результатов и сброс во всех процессах"""
+
+    @staticmethod
+    async def epoch() -> str:
+        from backend.services.settings_service import SettingsService
+        return await SettingsService.get_setting(RESULT_CACHE_EPOCH_KEY, "0")
+
+    @classmethod
+    async def sync_epoch(cls):
+        """Перевести кэш процесса на поколение из настроек (перед построением ключа)"""
+        fal_result_cache.set_epoch(await cls.epoch())
+
+    @classmethod
+    async def purge(cls) -> dict:
+        """
+        Сбросить кэш: новое поколение для всех воркеров backend,
+        локальная очистка и сброс кэша бота.
+        """
+        from backend.services.settings_service import SettingsService
+        epoch = int(await cls.epoch() or 0) + 1
+        await SettingsService.set_setting(RESULT_CACHE_EPOCH_KEY, str(epoch))
+        purged = fal_result_cache.set_epoch(epoch)
+
+        bot_purged = None
+        try:
+            async with httpx.AsyncClient(timeout=BOT_PURGE_TIMEOUT) as client:
+                response = await client.post(f"{BOT_API_URL}/cache/results/purge", json={"epoch": epoch})
+                response.raise_for_status()
+                bot_purged = response.json().get("purged")
+        except Exception as e:
+            logger.warning(f"Не удалось сбросить кэш результатов бота: {e}")
+
+        return {"epoch": epoch, "purged": purged, "bot_purged": bot_purged}
+
+    @staticmethod
+    async def stats() -> dict:
+        """Статистика воркера, принявшего запрос, и бота"""
+        bot_stats = None
+        try:
+            async with httpx.AsyncClient(timeout=BOT_PURGE_TIMEOUT) as client:
+                response = await client.get(f"{BOT_API_URL}/metrics/result-cache")
+                response.raise_for_status()
+                bot_stats = response.json()
+        except Exception as e:
+            logger.warning(f"Не удалось получить статистику кэша результатов бота: {e}")
+        return {"backend": fal_result_cache.stats(), "bot": bot_stats}
@@ -1,9 +1,30 @@
-from backend.models import Settings
+import os
+import time
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional
+
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from backend.models import Settings, SettingsVersion
+
+# Максимальный возраст кэша настроек (секунды). Изменения через SettingsService
+# видны всем воркерам сразу (версия в БД); TTL - только для записей в обход сервиса.
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "300"))
+# Единственная строка settings_version
+SETTINGS_VERSION_ID = 1
 
 
 class SettingsService:
     """Сервис для работы с настройками приложения"""
 
+    # Кэш таблицы settings целиком: {key: value}. Кэш свой у каждого воркера
+    # uvicorn, поэтому хранится с версией из settings_version, прочитанной до загрузки
+    _cache: Optional[dict] = None
+    _cache_version: int = -1
+    _cache_loaded_at: float = 0.0
+
     DEFAULT_AI_PROMPT = """Ты - помощник по маркетплейсам и онлайн-торговле.
 Твоя задача - помогать пользователям с вопросами о продажах на маркетплейсах,
 аналитике, оптимизации карточек товаров и других аспектах электронной коммерции.
@@ -76,15 +97,68 @@ class SettingsService:
 ВЫВОДИ ТОЛЬКО JSON БЕЗ ДОПОЛНИТЕЛЬНОГО ТЕКСТА!"""
 
     @staticmethod
-    async def get_setting(key: str, default: str = None) -> str:
+    async def get_version() -> int:
+        """Версия настроек в БД, общая для всех воркеров (строка по первичному ключу)"""
+        version = await SettingsVersion.filter(id=SETTINGS_VERSION_ID).first().values_list("version", flat=True)
+        return version or 0
+
+    @classmethod
+    async def invalidate(cls):
+        """
+        Увеличить версию настроек в БД: кэши всех воркеров перечитают настройки
+        при следующем обращении. Вызывается после записи в settings.
+        """
+        bumped = await SettingsVersion.filter(id=SETTINGS_VERSION_ID).update(version=F("version") + 1)
+        if not bumped:
+            try:
+                await SettingsVersion.create(id=SETTINGS_VERSION_ID, version=1)
+            except IntegrityError:
+                # Строку только что создал другой воркер
+                await SettingsVersion.filter(id=SETTINGS_VERSION_ID).update(version=F("version") + 1)
+        cls._cache = None
+
+    @classmethod
+    async def get_all(cls) -> Mapping[str, str]:
+        """
+        Все настройки {key: value} - только для чтения (общий кэш воркера).
+        Таблица читается одним SELECT и кэшируется, пока версия в БД та же
+        (одна строка по первичному ключу на обращение) и не истёк TTL.
+        """
+        version = await cls.get_version()
+        cache = cls._cache
+        if (
+            cache is not None
+            and cls._cache_version == version
+            and time.monotonic() - cls._cache_loaded_at < SETTINGS_CACHE_TTL
+        ):
+            return cache
+
+        rows = await Settings.all().values_list("key", "value")
+        cache = MappingProxyType(dict(rows))
+        # Версия прочитана до загрузки: если настройки изменились во время
+        # загрузки, версия в БД уже другая, и кэш будет перечитан
+        cls._cache = cache
+        cls._cache_version = version
+        cls._cache_loaded_at = time.monotonic()
+        return cache
+
+    @classmethod
+    async def get_setting(cls, key: str, default: str = None) -> str:
         """Получить значение настройки по ключу"""
-        setting = await Settings.filter(key=key).first()
-        if setting:
-            return setting.value
-        return default
+        return (await cls.get_all()).get(key, default)
 
-    @staticmethod
-    async def set_setting(key: str, value: str) -> Settings:
+    @classmethod
+    async def get_many(cls, keys: Iterable[str], defaults: Optional[dict] = None) -> dict:
+        """
+        Получить несколько настроек за одно обращение к кэшу.
+        Отсутствующие берутся из defaults, по умолчанию - из get_default_values().
+        """
+        settings = await cls.get_all()
+        defaults = cls.get_default_values() if defaults is None else defaults
+        return {key: settings.get(key, defaults.get(key)) for key in keys}
+
+    @classmethod
+    async def set_setting(cls, key: str, value: str) -> Settings:
         """Установить значение настройки"""
         setting = await Settings.filter(key=key).first()
         if setting:
@@ -92,8 +166,17 @@ class SettingsService:
             await setting.save()
         else:
             setting = await Settings.create(key=key, value=value)
+        await cls.invalidate()
         return setting
 
+    @classmethod
+    async def delete_setting(cls, key: str) -> bool:
+        """Удалить настройку. Возвращает False, если её не было"""
+        deleted = await Settings.filter(key=key).delete()
+        if deleted:
+            await cls.invalidate()
+        return bool(deleted)
+
     @classmethod
     async def get_ai_prompt(cls) -> str:
         """Получить AI промпт"""
@@ -150,10 +233,8 @@ class SettingsService:
     @classmethod
     async def get_token_costs(cls) -> dict:
         """Получить текущие тарифы по токенам"""
-        return {
-            "image_generation_cost": await cls.get_image_generation_cost(),
-            "gpt_request_cost": await cls.get_gpt_request_cost()
-        }
+        values = await cls.get_many(["image_generation_cost", "gpt_request_cost"])
+        return {key: int(value) for key, value in values.items()}
 
     @classmethod
     async def get_gpt_model(cls) -> str:
@@ -225,23 +306,29 @@ class SettingsService:
     @classmethod
     async def get_available_image_models(cls) -> dict:
         """Получить список доступных моделей с их стоимостью"""
+        values = await cls.get_many(
+            [
+                "image_model", "image_model_pro", "image_model_sd",
+                "image_model_cost", "image_model_pro_cost", "image_model_sd_cost",
+            ]
+        )
         return {
             "nano-banana": {
                 "name": "Nano Banana",
-                "model_id": await cls.get_image_model(),
-                "cost": await cls.get_image_model_cost("nano-banana"),
+                "model_id": values["image_model"],
+                "cost": int(values["image_model_cost"]),
                 "description": "Быстрая генерация с применением стиля референсов"
             },
             "pro": {
                 "name": "FLUX Pro Ultra",
-                "model_id": await cls.get_image_model_pro(),
-                "cost": await cls.get_image_model_cost("pro"),
+                "model_id": values["image_model_pro"],
+                "cost": int(values["image_model_pro_cost"]),
                 "description": "Высокое качество, генерация без референсов"
             },
             "sd": {
                 "name": "FLUX Pro",
-                "model_id": await cls.get_image_model_sd(),
-                "cost": await cls.get_image_model_cost("sd"),
+                "model_id": values["image_model_sd"],
+                "cost": int(values["image_model_sd_cost"]),
                 "description": "Базовое качество, низкая стоимость"
             }
         }
@@ -290,53 +377,46 @@ class SettingsService:
         return await cls.set_setting("channel_username", username)
 
     @classmethod
-    async def initialize_defaults(cls):
-        """Инициализация настроек по умолчанию"""
-        # Проверяем и создаем настройки если их нет
-        if not await Settings.filter(key="ai_prompt").exists():
-            await cls.set_ai_prompt(cls.DEFAULT_AI_PROMPT)
-
-        if not await Settings.filter(key="referral_bonus").exists():
-            await cls.set_referral_bonus(cls.DEFAULT_REFERRAL_BONUS)
-
-        if not await Settings.filter(key="image_generation_cost").exists():
-            await cls.set_image_generation_cost(cls.DEFAULT_IMAGE_GENERATION_COST)
-
-        if not await Settings.filter(key="gpt_request_cost").exists():
-            await cls.set_gpt_request_cost(cls.DEFAULT_GPT_REQUEST_COST)
-
-        if not await Settings.filter(key="prompt_generator_prompt").exists():
-            await cls.set_prompt_generator_prompt(cls.DEFAULT_PROMPT_GENERATOR_PROMPT)
-
-        if not await Settings.filter(key="gpt_model").exists():
-            await cls.set_gpt_model(cls.DEFAULT_GPT_MODEL)
-
-        if not await Settings.filter(key="image_model").exists():
-            await cls.set_image_model(cls.DEFAULT_IMAGE_MODEL)
-        
-        if not await Settings.filter(key="image_model_pro").exists():
-            await cls.set_image_model_pro(cls.DEFAULT_IMAGE_MODEL_PRO)
-        
-        if not await Settings.filter(key="image_model_sd").exists():
-            await cls.set_image_model_sd(cls.DEFAULT_IMAGE_MODEL_SD)
-        
-        if not await Settings.filter(key="image_model_cost").exists():
-            await cls.set_image_model_cost("nano-banana", cls.DEFAULT_IMAGE_MODEL_COST)
-        
-        if not await Settings.filter(key="image_model_pro_cost").exists():
-            await cls.set_image_model_cost("pro", cls.DEFAULT_IMAGE_MODEL_PRO_COST)
-        
-        if not await Settings.filter(key="image_model_sd_cost").exists():
-            await cls.set_image_model_cost("sd", cls.DEFAULT_IMAGE_MODEL_SD_COST)
-
-        if not await Settings.filter(key="referral_referrer_bonus").exists():
-            await cls.set_referral_referrer_bonus(50)
+    def get_default_values(cls) -> dict:
+        """Значения настроек по умолчанию {key: value}"""
+        return {
+            "ai_prompt": cls.DEFAULT_AI_PROMPT,
+            "referral_bonus": str(cls.DEFAULT_REFERRAL_BONUS),
+            "image_generation_cost": str(cls.DEFAULT_IMAGE_GENERATION_COST),
+            "gpt_request_cost": str(cls.DEFAULT_GPT_REQUEST_COST),
+            "prompt_generator_prompt": cls.DEFAULT_PROMPT_GENERATOR_PROMPT,
+            "gpt_model": cls.DEFAULT_GPT_MODEL,
+            "image_model": cls.DEFAULT_IMAGE_MODEL,
+            "image_model_pro": cls.DEFAULT_IMAGE_MODEL_PRO,
+            "image_model_sd": cls.DEFAULT_IMAGE_MODEL_SD,
+            "image_model_cost": str(cls.DEFAULT_IMAGE_MODEL_COST),
+            "image_model_pro_cost": str(cls.DEFAULT_IMAGE_MODEL_PRO_COST),
+            "image_model_sd_cost": str(cls.DEFAULT_IMAGE_MODEL_SD_COST),
+            "referral_referrer_bonus": "50",
+            "referral_referred_tokens": "10",
+            "channel_bonus": str(cls.DEFAULT_CHANNEL_BONUS),
+            "channel_username": cls.DEFAULT_CHANNEL_USERNAME,
+        }
 
-        if not await Settings.filter(key="referral_referred_tokens").exists():
-            await cls.set_referral_referred_tokens(10)
-        
-        if not await Settings.filter(key="channel_bonus").exists():
-            await cls.set_channel_bonus(cls.DEFAULT_CHANNEL_BONUS)
-        
-        if not await Settings.filter(key="channel_username").exists():
-            await cls.set_channel_username(cls.DEFAULT_CHANNEL_USERNAME)
+    @classmethod
+    async def initialize_defaults(cls) -> int:
+        """
+        Инициализация настроек по умолчанию.
+        Одна транзакция: один SELECT существующих ключей и bulk_create недостающих.
+        Возвращает количество созданных настроек.
+        """
+        defaults = cls.get_default_values()
+        async with in_transaction("default") as conn:
+            existing = set(await Settings.all().using_db(conn).values_list("key", flat=True))
+            missing = [
+                Settings(key=key, value=value)
+                for key, value in defaults.items()
+                if key not in existing
+            ]
+            if missing:
+                # ignore_conflicts: параллельно стартующие воркеры могут вставить те же ключи
+                await Settings.bulk_create(missing, ignore_conflicts=True, using_db=conn)
+
+        if missing:
+            await cls.invalidate()
+        return len(missing)
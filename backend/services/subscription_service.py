@@ -1,11 +1,32 @@
-from typing import Optional
+from typing import AsyncIterator, Optional
 from datetime import datetime
-from backend.models import Subscription, Status, AccessFile
+from backend.models import Subscription, AccessFile
+from backend.core.db import get_read_connection
+from backend.core.lookups import statuses
+from backend.core.sql import sql_for
+
+# Подписки для админки одним запросом: пользователь, группа и первый файл группы.
+# Пагинация по ключу (s.id > after_id), а не OFFSET
+SUBSCRIPTIONS_PAGE_QUERY = """
+SELECT s.id, s.user_id, s.tariff_id, s.status_id, s.start_date, s.end_date,
+       u.username, u.tg_id, u.bonus_balance, u.token_balance,
+       g.name AS group_name,
+       (SELECT f.path FROM access_files f WHERE f.group_id = s.group_id ORDER BY f.id LIMIT 1) AS file_name
+FROM subscriptions s
+LEFT JOIN users u ON u.id = s.user_id
+LEFT JOIN access_groups g ON g.id = s.group_id
+WHERE s.id > ?
+ORDER BY s.id
+LIMIT ?
+"""
+
+# Размер пачки при потоковой выдаче всех подписок
+SUBSCRIPTIONS_CHUNK_SIZE = 500
 
 class SubscriptionService:
     @staticmethod
     async def get_active_subscription(user_id: int) -> Optional[dict]:
-        active_status = await Status.get_or_none(type="subscription", code="ACTIVE")
+        active_status = statuses.subscription.get("ACTIVE")
         if not active_status:
             return None
 
@@ -28,3 +49,45 @@ class SubscriptionService:
             "group_name": sub.group.name if sub.group_id else None,
             "file_path": access_file.path if access_file else None,
         }
+
+    @staticmethod
+    def _subscription_row(row: dict) -> dict:
+        to_datetime = Subscription._meta.fields_map["end_date"].to_python_value
+        start_date = to_datetime(row["start_date"]) if row["start_date"] else None
+        end_date = to_datetime(row["end_date"]) if row["end_date"] else None
+        return {
+            "id": row["id"],
+            "username": row["username"],
+            "tg_id": row["tg_id"],
+            "user_id": row["user_id"],
+            "bonus_balance": row["bonus_balance"] or 0,
+            "token_balance": row["token_balance"] or 0,
+            "tariff_id": row["tariff_id"],
+            "status_id": row["status_id"],
+            "start_date": start_date.isoformat() if start_date else None,
+            "end_date": end_date.isoformat() if end_date else None,
+            "group": row["group_name"],
+            "file_name": row["file_name"],
+        }
+
+    @classmethod
+    async def list_subscriptions_page(cls, after_id: int = 0, limit: int = SUBSCRIPTIONS_CHUNK_SIZE) -> list[dict]:
+        """Страница подписок с id > after_id, отсортированная по id"""
+        conn = get_read_connection(Subscription)
+        rows = await conn.execute_query_dict(sql_for(conn, SUBSCRIPTIONS_PAGE_QUERY), [after_id, limit])
+        return [cls._subscription_row(row) for row in rows]
+
+    @classmethod
+    async def iter_subscriptions(cls, after_id: int = 0, limit: Optional[int] = None) -> AsyncIterator[dict]:
+        """Все подписки (или первые limit) пачками по SUBSCRIPTIONS_CHUNK_SIZE"""
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = SUBSCRIPTIONS_CHUNK_SIZE if remaining is None else min(remaining, SUBSCRIPTIONS_CHUNK_SIZE)
+            page = await cls.list_subscriptions_page(after_id, size)
+            for item in page:
+                yield item
+            if len(page) < size:
+                return
+            after_id = page[-1]["id"]
+            if remaining is not None:
+                remaining -= len(page)
@@ -0,0 +1,95 @@
+"""
+Параллельные списания токенов у одного пользователя (SQLite во временном файле).
+
+Сотни одновременных TokenService.charge с разными ключами идемпотентности
+против баланса, которого хватает только на часть из них; затем повтор всех
+запросов с теми же ключами (как ретраи APIClient.charge_tokens). Проверяется:
+  - баланс не уходит в минус и равен начальному минус успешные списания;
+  - в журнале ровно по записи на успешное списание;
+  - повторы ничего не списывают.
+
+Запуск: python -m backend.services.token_benchmark --charges 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from fastapi import HTTPException
+from tortoise import Tortoise
+
+from backend.core.db import build_tortoise_config, seed_reference_data
+from backend.core.migrations import apply_migrations
+from backend.models import TokenLedger, User
+from backend.services.token_service import TokenService
+
+
+async def timed_charge(tg_id: int, key: str) -> tuple:
+    started = time.perf_counter()
+    try:
+        result = await TokenService.charge(tg_id, TokenService.ACTION_IMAGE_GENERATION, key)
+        status = result["cost"]
+    except HTTPException as e:
+        status = e.status_code
+    return status, time.perf_counter() - started
+
+
+async def burst(tg_id: int, keys: list) -> tuple:
+    started = time.perf_counter()
+    results = await asyncio.gather(*(timed_charge(tg_id, key) for key in keys))
+    return results, time.perf_counter() - started
+
+
+def report(name: str, results: list, elapsed: float):
+    ms = sorted(latency * 1000 for _, latency in results)
+    p95 = statistics.quantiles(ms, n=100)[94]
+    refused = sum(1 for status, _ in results if status == 402)
+    print(
+        f"{name:7} запросов {len(results)}, отказов 402: {refused}, p95 {p95:.1f} мс,"
+        f" {len(results) / elapsed:.0f} запросов/с"
+    )
+
+
+async def run_benchmark(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        await Tortoise.init(config=build_tortoise_config(f"sqlite://{os.path.join(tmp, 'benchmark.db')}"))
+        try:
+            await apply_migrations()
+            await Tortoise.generate_schemas()
+            await seed_reference_data()
+
+            cost = await TokenService.get_cost_for_action(TokenService.ACTION_IMAGE_GENERATION)
+            initial = cost * (args.charges // 2)
+            user = await User.create(tg_id=1, bonus_balance=initial)
+            keys = [f"benchmark:{i}" for i in range(args.charges)]
+
+            results, elapsed = await burst(user.tg_id, keys)
+            report("charge", results, elapsed)
+            charged = sum(1 for status, _ in results if status == cost)
+            balance = (await User.get(id=user.id)).bonus_balance
+
+            retries, elapsed = await burst(user.tg_id, keys)
+            report("retry", retries, elapsed)
+            balance_after_retry = (await User.get(id=user.id)).bonus_balance
+            ledger = await TokenLedger.filter(user_id=user.id).count()
+
+            print(f"начальный баланс {initial}, списано {charged} x {cost}, баланс {balance}, журнал {ledger}")
+            assert balance >= 0
+            assert balance == initial - charged * cost
+            assert ledger == charged
+            assert balance_after_retry == balance
+            print("OK: баланс не ушёл в минус, журнал сходится, повторы ничего не списали")
+        finally:
+            await Tortoise.close_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--charges", type=int, default=500, help="одновременных списаний")
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,75 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
 from fastapi import HTTPException
-from backend.models import User
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from backend.core.sql import is_postgres, sql_for
+from backend.models import User, TokenLedger, TokenReservation
+from backend.services.profile_cache import ProfileCache
 from backend.services.settings_service import SettingsService
 
+logger = logging.getLogger(__name__)
+
+# Время жизни резерва токенов и период запуска сборщика просроченных резервов
+RESERVATION_TTL_SECONDS = int(os.getenv("TOKEN_RESERVATION_TTL", "900"))
+RESERVATION_SWEEP_INTERVAL = float(os.getenv("TOKEN_RESERVATION_SWEEP_INTERVAL", "60"))
+
+# balance_after в журнале - нарастающий итог: из баланса после возврата вычитаются
+# резервы того же пользователя из этого прохода с большим id (они вернулись "позже")
+_SWEEP_BALANCE_AFTER = (
+    "{balance} - COALESCE(SUM({r}.amount) OVER ("
+    "PARTITION BY {r}.user_id ORDER BY {r}.id DESC ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING"
+    "), 0)"
+)
+
+# SQLite: возврат на балансы по метке прохода sweep_token
+SWEEP_REFUND_SQL = (
+    "UPDATE users SET bonus_balance = bonus_balance + ("
+    " SELECT COALESCE(SUM(r.amount), 0) FROM token_reservations r"
+    " WHERE r.user_id = users.id AND r.sweep_token = ?"
+    ") WHERE id IN (SELECT user_id FROM token_reservations WHERE sweep_token = ?)"
+)
+
+# SQLite: строка журнала на каждый возвращённый резерв прохода
+SWEEP_LEDGER_SQL = (
+    "INSERT INTO token_ledger (user_id, delta, balance_after, kind, reason, created_at)"
+    f" SELECT r.user_id, r.amount, {_SWEEP_BALANCE_AFTER.format(balance='u.bonus_balance', r='r')},"
+    " ?, 'expire:' || r.action, ?"
+    " FROM token_reservations r JOIN users u ON u.id = r.user_id"
+    " WHERE r.sweep_token = ? AND r.amount > 0"
+    " ORDER BY r.id"
+)
+
+# PostgreSQL: весь проход одним запросом - пометка резервов, возврат на балансы
+# и журнал в изменяющих CTE; возвращает user_id каждого просроченного резерва
+SWEEP_POSTGRES_SQL = f"""
+WITH expired AS (
+    UPDATE token_reservations SET status = ?, resolved_at = ?, sweep_token = ?
+    WHERE status = ? AND expires_at < ?
+    RETURNING id, user_id, amount, action
+), refunded AS (
+    UPDATE users u SET bonus_balance = u.bonus_balance + t.amount
+    FROM (SELECT user_id, SUM(amount) AS amount FROM expired GROUP BY user_id) t
+    WHERE u.id = t.user_id
+    RETURNING u.id, u.bonus_balance
+), ledger AS (
+    INSERT INTO token_ledger (user_id, delta, balance_after, kind, reason, created_at)
+    SELECT e.user_id, e.amount, {_SWEEP_BALANCE_AFTER.format(balance='b.bonus_balance', r='e')},
+           CAST(? AS VARCHAR), 'expire:' || e.action, CAST(? AS TIMESTAMPTZ)
+    FROM expired e JOIN refunded b ON b.id = e.user_id
+    WHERE e.amount > 0
+    ORDER BY e.id
+)
+SELECT user_id FROM expired
+"""
+
 
 class TokenService:
     """Сервис для списания токенов за различные действия"""
@@ -23,37 +91,346 @@ class TokenService:
         raise HTTPException(status_code=400, detail="Неизвестный тип действия для списания токенов")
 
     @classmethod
-    async def charge(cls, tg_id: int, action: str) -> dict:
+    def _charge_result(cls, action: str, cost: int, balance: int) -> dict:
+        return {
+            "action": action,
+            "cost": cost,
+            "balance": balance,
+            "label": cls.ACTION_LABELS.get(action, action)
+        }
+
+    @staticmethod
+    def _own_record(record, user_id: int):
+        """
+        Ключи идемпотентности уникальны на всю таблицу: запись другого пользователя
+        с тем же ключом - ошибка клиента, а не повтор (иначе он получил бы чужую
+        операцию и ничего не заплатил).
+        """
+        if record.user_id != user_id:
+            raise HTTPException(status_code=409, detail="Ключ идемпотентности уже использован другим пользователем")
+        return record
+
+    @staticmethod
+    async def _apply_delta_in(
+        conn,
+        user_id: int,
+        delta: int,
+        kind: str,
+        reason: str,
+        idempotency_key: Optional[str] = None,
+    ) -> TokenLedger:
+        """
+        Меняет баланс и пишет запись в журнал в рамках уже открытой транзакции.
+
+        Списание выполняется одним условным UPDATE (bonus_balance >= cost),
+        поэтому параллельные запросы не могут увести баланс в минус.
+        """
+        query = User.filter(id=user_id)
+        if delta < 0:
+            query = query.filter(bonus_balance__gte=-delta)
+        updated = await query.using_db(conn).update(bonus_balance=F("bonus_balance") + delta)
+        if not updated:
+            raise HTTPException(status_code=402, detail="Недостаточно токенов")
+
+        balance = await User.filter(id=user_id).using_db(conn).first().values_list(
+            "bonus_balance", flat=True
+        )
+        return await TokenLedger.create(
+            user_id=user_id,
+            delta=delta,
+            balance_after=balance,
+            kind=kind,
+            reason=reason,
+            idempotency_key=idempotency_key,
+            using_db=conn,
+        )
+
+    @classmethod
+    async def _apply_delta(
+        cls,
+        user_id: int,
+        delta: int,
+        kind: str,
+        reason: str,
+        idempotency_key: Optional[str] = None,
+    ) -> tuple[TokenLedger, bool]:
+        """
+        Атомарно меняет баланс и пишет запись в журнал.
+        Возвращает (запись журнала, был ли это повтор по ключу идемпотентности).
+        """
+        if idempotency_key:
+            existing = await TokenLedger.get_or_none(idempotency_key=idempotency_key)
+            if existing:
+                return cls._own_record(existing, user_id), True
+
+        try:
+            async with in_transaction("default") as conn:
+                entry = await cls._apply_delta_in(conn, user_id, delta, kind, reason, idempotency_key)
+        except IntegrityError:
+            # Параллельный повтор с тем же ключом успел провести операцию первым
+            if not idempotency_key:
+                raise
+            return cls._own_record(await TokenLedger.get(idempotency_key=idempotency_key), user_id), True
+
+        await ProfileCache.invalidate(user_id=user_id)
+        return entry, False
+
+    @classmethod
+    async def charge(cls, tg_id: int, action: str, idempotency_key: Optional[str] = None) -> dict:
         user = await User.get_or_none(tg_id=tg_id)
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
 
+        if idempotency_key:
+            existing = await TokenLedger.get_or_none(idempotency_key=idempotency_key)
+            if existing:
+                cls._own_record(existing, user.id)
+                return cls._charge_result(action, -existing.delta, existing.balance_after)
+
         cost = await cls.get_cost_for_action(action)
 
         if cost < 0:
             raise HTTPException(status_code=400, detail="Стоимость действия не может быть отрицательной")
 
         if cost == 0:
-            return {
-                "action": action,
-                "cost": 0,
-                "balance": user.bonus_balance,
-                "label": cls.ACTION_LABELS.get(action, action)
-            }
-
-        if user.bonus_balance < cost:
-            raise HTTPException(status_code=402, detail="Недостаточно токенов")
+            return cls._charge_result(action, 0, user.bonus_balance)
+
+        entry, _ = await cls._apply_delta(
+            user.id, -cost, TokenLedger.KIND_DEBIT, action, idempotency_key
+        )
+        return cls._charge_result(action, -entry.delta, entry.balance_after)
+
+    @classmethod
+    async def credit(
+        cls,
+        user_id: int,
+        amount: int,
+        reason: str,
+        idempotency_key: Optional[str] = None,
+    ) -> int:
+        """Начислить токены пользователю. Возвращает новый баланс."""
+        if amount < 0:
+            raise HTTPException(status_code=400, detail="Сумма начисления не может быть отрицательной")
 
-        user.bonus_balance -= cost
-        await user.save()
+        if amount == 0:
+            balance = await User.filter(id=user_id).first().values_list("bonus_balance", flat=True)
+            return balance or 0
 
+        entry, _ = await cls._apply_delta(
+            user_id, amount, TokenLedger.KIND_CREDIT, reason, idempotency_key
+        )
+        return entry.balance_after
+
+    @staticmethod
+    async def set_balance(user_id: int, balance: int, reason: str = "admin") -> int:
+        """Установить баланс вручную (из админки) с записью разницы в журнал"""
+        async with in_transaction("default") as conn:
+            current = await User.filter(id=user_id).using_db(conn).first().values_list(
+                "bonus_balance", flat=True
+            )
+            if current is None:
+                raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+            await User.filter(id=user_id).using_db(conn).update(bonus_balance=balance)
+            if balance != current:
+                await TokenLedger.create(
+                    user_id=user_id,
+                    delta=balance - current,
+                    balance_after=balance,
+                    kind=TokenLedger.KIND_ADJUSTMENT,
+                    reason=reason,
+                    using_db=conn,
+                )
+        await ProfileCache.invalidate(user_id=user_id)
+        return balance
+
+    @classmethod
+    def _reservation_result(cls, reservation: TokenReservation, balance: int) -> dict:
         return {
-            "action": action,
-            "cost": cost,
-            "balance": user.bonus_balance,
-            "label": cls.ACTION_LABELS.get(action, action)
+            "reservation_id": reservation.id,
+            "action": reservation.action,
+            "cost": reservation.amount,
+            "balance": balance,
+            "status": reservation.status,
+            "expires_at": reservation.expires_at,
+            "label": cls.ACTION_LABELS.get(reservation.action, reservation.action)
         }
 
+    @classmethod
+    async def reserve(
+        cls,
+        tg_id: int,
+        action: str,
+        ttl_seconds: Optional[int] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> dict:
+        """
+        Зарезервировать токены под действие: токены сразу снимаются с баланса,
+        а по ошибке или истечении TTL возвращаются обратно.
+        """
+        user = await User.get_or_none(tg_id=tg_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+        if idempotency_key:
+            existing = await TokenReservation.get_or_none(idempotency_key=idempotency_key)
+            if existing:
+                return cls._reservation_result(cls._own_record(existing, user.id), user.bonus_balance)
+
+        cost = await cls.get_cost_for_action(action)
+        if cost < 0:
+            raise HTTPException(status_code=400, detail="Стоимость действия не может быть отрицательной")
+
+        ttl = ttl_seconds or RESERVATION_TTL_SECONDS
+        balance = user.bonus_balance
+        try:
+            async with in_transaction("default") as conn:
+                if cost > 0:
+                    entry = await cls._apply_delta_in(
+                        conn, user.id, -cost, TokenLedger.KIND_DEBIT, f"reserve:{action}"
+                    )
+                    balance = entry.balance_after
+                reservation = await TokenReservation.create(
+                    user_id=user.id,
+                    action=action,
+                    amount=cost,
+                    idempotency_key=idempotency_key,
+                    expires_at=datetime.utcnow() + timedelta(seconds=ttl),
+                    using_db=conn,
+                )
+        except IntegrityError:
+            if not idempotency_key:
+                raise
+            reservation = cls._own_record(await TokenReservation.get(idempotency_key=idempotency_key), user.id)
+            balance = await User.filter(id=user.id).first().values_list("bonus_balance", flat=True)
+
+        await ProfileCache.invalidate(tg_id=tg_id, user_id=user.id)
+        return cls._reservation_result(reservation, balance)
+
+    @staticmethod
+    async def _get_reservation(reservation_id: int) -> TokenReservation:
+        reservation = await TokenReservation.get_or_none(id=reservation_id)
+        if not reservation:
+            raise HTTPException(status_code=404, detail="Резерв не найден")
+        return reservation
+
+    @classmethod
+    async def commit(cls, reservation_id: int) -> dict:
+        """Подтвердить резерв: токены окончательно списаны"""
+        committed = await TokenReservation.filter(
+            id=reservation_id, status=TokenReservation.STATUS_HELD
+        ).update(status=TokenReservation.STATUS_COMMITTED, resolved_at=datetime.utcnow())
+
+        reservation = await cls._get_reservation(reservation_id)
+        if not committed and reservation.status != TokenReservation.STATUS_COMMITTED:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Резерв уже закрыт (статус: {reservation.status})"
+            )
+        return {"reservation_id": reservation.id, "status": reservation.status}
+
+    @staticmethod
+    async def extend(reservation_id: int, ttl_seconds: int) -> bool:
+        """
+        Продлить удерживаемый резерв на ttl_seconds от текущего момента.
+        False - резерв уже закрыт (подтверждён, возвращён или истёк).
+        """
+        extended = await TokenReservation.filter(
+            id=reservation_id, status=TokenReservation.STATUS_HELD
+        ).update(expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds))
+        return bool(extended)
+
+    @classmethod
+    async def release(cls, reservation_id: int) -> dict:
+        """Освободить резерв и вернуть токены на баланс"""
+        async with in_transaction("default") as conn:
+            released = await TokenReservation.filter(
+                id=reservation_id, status=TokenReservation.STATUS_HELD
+            ).using_db(conn).update(
+                status=TokenReservation.STATUS_RELEASED, resolved_at=datetime.utcnow()
+            )
+            reservation = await TokenReservation.filter(id=reservation_id).using_db(conn).first()
+            if not reservation:
+                raise HTTPException(status_code=404, detail="Резерв не найден")
+
+            if released and reservation.amount > 0:
+                await cls._apply_delta_in(
+                    conn,
+                    reservation.user_id,
+                    reservation.amount,
+                    TokenLedger.KIND_CREDIT,
+                    f"release:{reservation.action}",
+                )
+
+        if reservation.status == TokenReservation.STATUS_COMMITTED:
+            raise HTTPException(status_code=409, detail="Резерв уже подтверждён")
+
+        if released:
+            await ProfileCache.invalidate(user_id=reservation.user_id)
+
+        balance = await User.filter(id=reservation.user_id).first().values_list("bonus_balance", flat=True)
+        return {"reservation_id": reservation.id, "status": reservation.status, "balance": balance}
+
+    @staticmethod
+    async def expire_stale_reservations() -> int:
+        """
+        Вернуть токены по всем просроченным резервам за один проход.
+
+        На PostgreSQL проход - один запрос (SWEEP_POSTGRES_SQL). SQLite не
+        поддерживает изменяющие CTE, поэтому там те же шаги выполняются тремя
+        множественными запросами в одной транзакции, связанными меткой прохода.
+        В обоих случаях - по строке журнала на резерв, не построчные запросы.
+        """
+        now = datetime.utcnow()
+        sweep_token = uuid.uuid4().hex
+
+        async with in_transaction("default") as conn:
+            db_now = TokenReservation._meta.fields_map["expires_at"].to_db_value(now, None)
+            if is_postgres(conn):
+                rows = await conn.execute_query_dict(
+                    sql_for(conn, SWEEP_POSTGRES_SQL),
+                    [
+                        TokenReservation.STATUS_EXPIRED, db_now, sweep_token,
+                        TokenReservation.STATUS_HELD, db_now,
+                        TokenLedger.KIND_CREDIT, db_now,
+                    ],
+                )
+                expired = len(rows)
+                user_ids = [row["user_id"] for row in rows]
+            else:
+                expired = await TokenReservation.filter(
+                    status=TokenReservation.STATUS_HELD, expires_at__lt=now
+                ).using_db(conn).update(
+                    status=TokenReservation.STATUS_EXPIRED, resolved_at=now, sweep_token=sweep_token
+                )
+                if not expired:
+                    return 0
+                await conn.execute_query(sql_for(conn, SWEEP_REFUND_SQL), [sweep_token, sweep_token])
+                await conn.execute_query(
+                    sql_for(conn, SWEEP_LEDGER_SQL), [TokenLedger.KIND_CREDIT, db_now, sweep_token]
+                )
+                user_ids = await TokenReservation.filter(sweep_token=sweep_token).using_db(conn).values_list(
+                    "user_id", flat=True
+                )
+
+        if not expired:
+            return 0
+        await ProfileCache.invalidate_users(user_ids)
+        logger.info("Возвращены токены по %s просроченным резервам", expired)
+        return expired
+
+    @classmethod
+    async def run_reservation_sweeper(cls, interval: float = RESERVATION_SWEEP_INTERVAL):
+        """Фоновая задача: периодически освобождает просроченные резервы"""
+        while True:
+            try:
+                await cls.expire_stale_reservations()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при очистке резервов токенов: {e}")
+            await asyncio.sleep(interval)
+
     @classmethod
     async def get_pricing(cls) -> dict:
         return await SettingsService.get_token_costs()
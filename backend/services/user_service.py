@@ -1,10 +1,31 @@
+from datetime import datetime
+
 from fastapi import HTTPException
-from backend.services.subscription_service import SubscriptionService
-from backend.models import User
-from backend.models.enums import Tariff
-from backend.schemas import UserOut, UserBase, UserUpdate, UserCreate
+from backend.services.token_service import TokenService
+from backend.models import User, Subscription
+from backend.services.profile_cache import ProfileCache
+from backend.core.db import get_read_connection
+from backend.core.lookups import statuses, tariffs
+from backend.core.sql import sql_for
+from backend.schemas import UserOut, UserBase, UserUpdate, UserCreate, UndeliverableReport
 from backend.schemas.user import ProfileOut
 
+# Активная подписка - последняя по дате окончания; файл группы - первый по id
+PROFILE_QUERY = """
+SELECT u.id, u.tg_id, u.username, u.full_name, u.bonus_balance, u.token_balance, u.profile_version,
+       s.tariff_id, s.end_date, s.group_id, g.name AS group_name,
+       (SELECT f.path FROM access_files f WHERE f.group_id = s.group_id ORDER BY f.id LIMIT 1) AS file_path
+FROM users u
+LEFT JOIN subscriptions s ON s.id = (
+    SELECT s2.id FROM subscriptions s2
+    WHERE s2.user_id = u.id AND s2.status_id = ? AND s2.end_date >= ?
+    ORDER BY s2.end_date DESC
+    LIMIT 1
+)
+LEFT JOIN access_groups g ON g.id = s.group_id
+WHERE u.tg_id = ?
+"""
+
 class UserService:
 
     @staticmethod
@@ -25,9 +46,30 @@ class UserService:
     async def create_user(data: UserCreate):
         existing = await User.get_or_none(tg_id=data.tg_id)
         if existing:
+            if not existing.deliverable:
+                # Пользователь снова написал боту (/start) - возвращаем в рассылки
+                existing.deliverable = True
+                existing.undeliverable_reason = None
+                existing.undeliverable_at = None
+                await existing.save(update_fields=["deliverable", "undeliverable_reason", "undeliverable_at"])
             return existing
         return await User.create(**data.dict())
 
+    @staticmethod
+    async def mark_undeliverable(reports: list[UndeliverableReport]) -> int:
+        """Исключить из рассылок пользователей, которым бот не может писать"""
+        by_reason: dict[str, list[int]] = {}
+        for report in reports:
+            by_reason.setdefault(report.reason, []).append(report.tg_id)
+
+        now = datetime.utcnow()
+        updated = 0
+        for reason, tg_ids in by_reason.items():
+            updated += await User.filter(tg_id__in=tg_ids, deliverable=True).update(
+                deliverable=False, undeliverable_reason=reason, undeliverable_at=now
+            )
+        return updated
+
     @staticmethod
     async def list_users() -> list[UserOut]:
         users = await User.all()
@@ -45,49 +87,68 @@ class UserService:
         user = await User.get(id=user_id)
         data_dict = data.dict(exclude_unset=True)
 
+        # Баланс меняем через TokenService, чтобы изменение попало в журнал
+        bonus_balance = data_dict.pop("bonus_balance", None)
+        if bonus_balance is not None:
+            user.bonus_balance = await TokenService.set_balance(user.id, bonus_balance)
+
         for key, value in data_dict.items():
             setattr(user, key, value)
 
-        await user.save()
+        if data_dict:
+            await user.save(update_fields=list(data_dict.keys()))
+        await ProfileCache.invalidate(tg_id=user.tg_id, user_id=user.id)
         return UserOut.from_orm(user)
 
     @staticmethod
     async def deactivate_user(user_id: int) -> dict:
+        # Отдельного флага активности у пользователя нет: деактивация - черный список.
+        # Пишется только is_banned: полное сохранение затёрло бы баланс и profile_version
         user = await User.get(id=user_id)
-        user.is_active = False
-        await user.save()
+        user.is_banned = True
+        await user.save(update_fields=["is_banned"])
+        await ProfileCache.invalidate(tg_id=user.tg_id, user_id=user.id)
         return {"message": f"Пользователь {user_id} деактивирован"}
     
+    @staticmethod
     async def get_profile_by_tg(tg_id: int) -> ProfileOut:
-        user = await UserService.get_by_tg(tg_id)
-
-        sub_info = await SubscriptionService.get_active_subscription(user.id)
-
-        tariff_code = tariff_name = None
-        active_until = None
-        access_group = None
-        access_file_path = None
-
-        if sub_info:
-            active_until = sub_info["end_date"]
-            access_group = sub_info["group_name"]
-            access_file_path = sub_info["file_path"]
-
-            tariff = await Tariff.get_or_none(id=sub_info["tariff_id"])
-            if tariff:
-                tariff_code = tariff.code
-                tariff_name = tariff.name
-
-        return ProfileOut(
-            user_id=user.id,
-            tg_id=user.tg_id,
-            username=user.username,
-            full_name=user.full_name,
-            tariff_code=tariff_code,
-            tariff_name=tariff_name,
-            active_until=active_until,
-            access_group=access_group,
-            access_file_path=access_file_path,
-            bonus_balance=user.bonus_balance,
-            token_balance=user.token_balance,
-        )
\ No newline at end of file
+        """
+        Профиль пользователя одним запросом: пользователь, активная подписка,
+        группа доступа и файл группы. Результат кэшируется по tg_id
+        вместе с версией профиля (см. ProfileCache).
+        """
+        conn = get_read_connection(User)
+        cached = await ProfileCache.get_profile(conn, tg_id)
+        if cached is not None:
+            return cached
+
+        active_status = statuses.subscription.get("ACTIVE")
+        now = Subscription._meta.fields_map["end_date"].to_db_value(datetime.utcnow(), None)
+        rows = await conn.execute_query_dict(
+            sql_for(conn, PROFILE_QUERY), [active_status.id if active_status else None, now, tg_id]
+        )
+        if not rows:
+            raise HTTPException(status_code=404, detail="User not found")
+        row = rows[0]
+
+        tariff = tariffs.by_id(row["tariff_id"])
+        profile = ProfileOut(
+            user_id=row["id"],
+            tg_id=row["tg_id"],
+            username=row["username"],
+            full_name=row["full_name"],
+            tariff_code=tariff.code if tariff else None,
+            tariff_name=tariff.name if tariff else None,
+            active_until=row["end_date"],
+            access_group=row["group_name"],
+            access_file_path=row["file_path"],
+            bonus_balance=row["bonus_balance"],
+            token_balance=row["token_balance"],
+        )
+        ProfileCache.set(profile, row["profile_version"], row["group_id"])
+        return profile
+
+    @staticmethod
+    async def invalidate_profile(tg_id: int | None = None, user_id: int | None = None):
+        """Сбросить закэшированный профиль пользователя"""
+        await ProfileCache.invalidate(tg_id=tg_id, user_id=user_id)
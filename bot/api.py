@@ -1,7 +1,75 @@
+import logging
+
 from fastapi import FastAPI
 from bot.loader import bot
+from bot.services.api_client import APIClient
+from bot.services.broadcast import BroadcastEngine, MediaBroadcast, classify_undeliverable
+from bot.services.upload_cache import upload_cache
+from backend.services.result_cache import fal_result_cache
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
+api = APIClient()
+
+# Один движок на процесс: лимит скорости общий для всех рассылок бота
+broadcast_engine = BroadcastEngine(bot)
+
+
+async def report_undeliverable(reports: list):
+    """Сообщить backend о получателях, которым нельзя писать"""
+    try:
+        await api.report_undeliverable(reports)
+    except Exception as e:
+        logger.error(f"Не удалось передать недоставляемых получателей: {e}")
+
+
+@app.get("/metrics/backend")
+async def backend_metrics():
+    """Задержки запросов бота к backend по эндпоинтам"""
+    return APIClient.latency.snapshot()
+
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(payload: dict):
+    """
+    Сброс кэша профилей по сигналу backend: {"tg_ids": [...]} или {"all": true}
+    """
+    if payload.get("all"):
+        APIClient.invalidate_profiles()
+    else:
+        APIClient.invalidate_profiles(payload.get("tg_ids") or [])
+    return {"ok": True, "size": len(APIClient.profiles)}
+
+
+@app.get("/metrics/profile-cache")
+async def profile_cache_metrics():
+    """Попадания в кэш профилей бота"""
+    return {
+        "size": len(APIClient.profiles),
+        "hits": APIClient.profiles.hits,
+        "misses": APIClient.profiles.misses,
+    }
+
+
+@app.get("/metrics/upload-cache")
+async def upload_cache_metrics():
+    """Повторные фото, не загруженные в FAL заново"""
+    return {"size": len(upload_cache), "hits": upload_cache.hits, "misses": upload_cache.misses}
+
+
+@app.get("/metrics/result-cache")
+async def result_cache_metrics():
+    """Генерации, выданные из кэша результатов"""
+    return fal_result_cache.stats()
+
+
+@app.post("/cache/results/purge")
+async def purge_result_cache(payload: dict | None = None):
+    """Сброс кэша результатов генерации по команде админки: {"epoch": новое поколение}"""
+    epoch = (payload or {}).get("epoch")
+    purged = fal_result_cache.purge() if epoch is None else fal_result_cache.set_epoch(epoch)
+    return {"ok": True, "purged": purged}
 
 
 @app.post("/notify")
@@ -12,10 +80,56 @@ async def notify(payload: dict):
     tg_id = payload.get("tg_id")
     message = payload.get("message")
     if tg_id and message:
-        await bot.send_message(chat_id=tg_id, text=message)
+        try:
+            await bot.send_message(chat_id=tg_id, text=message)
+        except Exception as e:
+            reason = classify_undeliverable(e)
+            if not reason:
+                raise
+            await report_undeliverable([{"tg_id": tg_id, "reason": reason}])
+            return {"ok": False, "error": str(e), "undeliverable": reason}
     return {"ok": True}
 
 
+@app.post("/notify/bulk")
+async def notify_bulk(payload: dict):
+    """
+    Пачка уведомлений из outbox backend: [{"id", "tg_id", "message"}].
+    Отправляется через общий движок рассылок (те же лимиты Telegram),
+    результат возвращается по каждому id.
+    """
+    notifications = [
+        n for n in payload.get("notifications", [])
+        if n.get("id") is not None and n.get("tg_id") and n.get("message")
+    ]
+    if not notifications:
+        return {"results": []}
+
+    async def send(notification: dict):
+        await bot.send_message(chat_id=notification["tg_id"], text=notification["message"])
+
+    result = await broadcast_engine.run(notifications, send=send, chat_of=lambda n: n["tg_id"])
+
+    # Ошибки по id уведомления: в один чат может идти несколько уведомлений пачки
+    failures = {n["id"]: failure for n, failure in zip(result.failed_ids, result.failures)}
+    if result.undeliverable:
+        await report_undeliverable(result.undeliverable)
+
+    results = []
+    for n in notifications:
+        failure = failures.get(n["id"])
+        if failure is None:
+            results.append({"id": n["id"], "ok": True})
+            continue
+        results.append({
+            "id": n["id"],
+            "ok": False,
+            "undeliverable": failure["reason"],
+            "error": failure["error"] or failure["reason"] or "Не доставлено",
+        })
+    return {"results": results}
+
+
 @app.post("/broadcast")
 async def broadcast(payload: dict):
     """
@@ -23,8 +137,10 @@ async def broadcast(payload: dict):
     Поддерживает как одиночную отправку (tg_id), так и массовую (user_ids)
     """
     message = payload.get("message")
+    # Фото/документ/альбом: [{"type", "sha256", "filename", "file_id"?}]
+    media = payload.get("media")
 
-    if not message:
+    if not message and not media:
         return {"ok": False, "error": "Missing message"}
 
     # Поддержка старого формата (один tg_id)
@@ -38,21 +154,20 @@ async def broadcast(payload: dict):
     if not user_ids:
         return {"ok": False, "error": "Missing tg_id or user_ids"}
 
-    success_count = 0
-    failed_count = 0
-    errors = []
-
-    for user_id in user_ids:
-        try:
-            await bot.send_message(chat_id=user_id, text=message)
-            success_count += 1
-        except Exception as e:
-            failed_count += 1
-            errors.append({"user_id": user_id, "error": str(e)})
+    if media:
+        media_broadcast = MediaBroadcast(bot, media, caption=message)
+        result = await broadcast_engine.run(user_ids, send=media_broadcast.send)
+    else:
+        media_broadcast = None
+        result = await broadcast_engine.run(user_ids, text=message)
 
     return {
         "ok": True,
-        "success_count": success_count,
-        "failed_count": failed_count,
-        "errors": errors[:10]  # Возвращаем первые 10 ошибок
+        "success_count": result.success_count,
+        "failed_count": result.failed_count,
+        "errors": result.errors[:10],  # Возвращаем первые 10 ошибок
+        # sha256 -> file_id загруженных файлов, backend сохраняет их для следующих отправок
+        "file_ids": media_broadcast.file_ids if media_broadcast else {},
+        # Заблокировавшие бота и т.п. - backend исключает их из следующих рассылок
+        "undeliverable": result.undeliverable,
     }
@@ -4,6 +4,10 @@ from aiogram import Dispatcher
 from bot.loader import bot, dp
 from bot.handlers import files, start, subscription, profile, ai, image_generation, topup
 from bot.api import app as fastapi_app
+from bot.services.api_client import APIClient
+from bot.services.fal_service import fal_queue
+from bot.services.upload_cache import upload_cache
+from bot.handlers.image_generation import generation_queue
 
 
 async def run_bot():
@@ -18,6 +22,18 @@ async def run_bot():
     # dp.include_router(faq.router)
     # dp.include_router(access_file.router)
 
+    # Общая сессия к backend живёт столько же, сколько диспетчер
+    dp.startup.register(APIClient.start)
+    # Очередь генераций: при старте продолжает задания, прерванные перезапуском,
+    # и останавливается раньше, чем закрываются соединения к backend и FAL
+    dp.startup.register(generation_queue.start)
+    dp.shutdown.register(generation_queue.stop)
+    dp.shutdown.register(APIClient.close)
+    # Пул соединений к очереди FAL
+    dp.shutdown.register(fal_queue.aclose)
+    # Кэш загрузок в FAL дописывается на диск
+    dp.shutdown.register(upload_cache.flush)
+
     await dp.start_polling(bot)
 
 
@@ -1,6 +1,6 @@
-import os
 import logging
 import asyncio
+import aiohttp
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
@@ -21,20 +21,21 @@ from bot.keyboards.main_menu import main_menu_kb
 from bot.services.fal_service import FALService
 from bot.services.prompt_generator import PromptGeneratorService
 from bot.services.api_client import APIClient, InsufficientTokensError, APIClientError
-from bot.loader import bot
+from bot.services.generation_queue import GenerationQueue
+from backend.services.result_cache import fal_result_cache
+from bot.loader import bot, dp
 from bot.utils import get_full_name
 
 router = Router()
 logger = logging.getLogger(__name__)
 api_client = APIClient()
 
-# Временная директория для сохранения фото
-TEMP_PHOTO_DIR = "/tmp/bot_photos"
-os.makedirs(TEMP_PHOTO_DIR, exist_ok=True)
-
 # Хранилище для медиа-групп (альбомов)
 media_groups = {}
 
+# Ключи заданий, которые сейчас ставятся в очередь (двойное нажатие в этом процессе)
+_enqueuing: set = set()
+
 
 async def delete_messages(chat_id: int, message_ids: list):
     """Удаление списка сообщений"""
@@ -45,20 +46,200 @@ async def delete_messages(chat_id: int, message_ids: list):
             logger.debug(f"Не удалось удалить сообщение {msg_id}: {e}")
 
 
-async def charge_image_generation(message: Message, state: FSMContext, user_id: int):
-    """Списание токенов перед генерацией изображения"""
+def generation_key(message: Message) -> str:
+    """
+    Ключ идемпотентности задания - сообщение, из которого запущена генерация
+    (сообщение с кнопкой или текст пользователя). Двойное нажатие и повторно
+    доставленный callback дают тот же ключ: задание и резерв токенов - одни.
+    """
+    return f"{message.chat.id}:{message.message_id}"
+
+
+async def enqueue_generation(message: Message, state: FSMContext, user_id: int, prompt: str | None, title: str):
+    """
+    Поставить задание генерации в очередь и сразу вернуть управление.
+    Токены резервируются при постановке; результат пришлёт воркер очереди.
+    prompt=None - промпт сгенерирует AI по фото (уже в воркере).
+    """
+    key = generation_key(message)
+    if key in _enqueuing:
+        return None
+    _enqueuing.add(key)
     try:
-        return await api_client.charge_tokens(user_id, "image_generation")
+        return await _enqueue_generation(message, state, user_id, prompt, title, key)
+    finally:
+        _enqueuing.discard(key)
+
+
+async def _enqueue_generation(
+    message: Message, state: FSMContext, user_id: int, prompt: str | None, title: str, key: str
+):
+    data = await state.get_data()
+    card_text = data.get("card_text")
+    # Если указан текст на карточке, добавляем его в промпт
+    if prompt and card_text:
+        prompt = f"{prompt}. Add text on the card: '{card_text}'"
+
+    try:
+        job = await api_client.create_generation_job({
+            "tg_id": user_id,
+            "chat_id": message.chat.id,
+            "model_id": data.get("model_id"),
+            "model_name": data.get("model_name", "Nano Banana"),
+            "prompt": prompt,
+            "card_text": card_text,
+            "product_images": data.get("product_photos", []),
+            "reference_images": data.get("reference_photos", []),
+            "aspect_ratio": data.get("aspect_ratio", "3:4"),
+            "idempotency_key": key,
+        })
     except InsufficientTokensError:
         await message.answer(
             "❌ Недостаточно токенов для генерации.\n"
             "Пополните баланс или обратитесь в поддержку."
         )
-        await state.set_state(None)
-    except APIClientError as exc:
-        await message.answer(f"⚠️ Не удалось списать токены: {exc}")
-        await state.set_state(None)
-    return None
+        return None
+    except (APIClientError, aiohttp.ClientError, asyncio.TimeoutError) as exc:
+        await message.answer(f"⚠️ Не удалось поставить генерацию в очередь: {exc}")
+        return None
+
+    if job.get("status_message_id") or job["status"] != "queued":
+        # Задание по этому сообщению уже поставлено раньше: токены повторно не резервировались
+        if job["status"] in ("completed", "failed"):
+            await message.answer("ℹ️ Этот запрос уже обработан. Чтобы сгенерировать ещё раз, начните заново.")
+        return None
+
+    status = await message.answer(
+        f"{title} через {job['model_name'] or 'Nano Banana'}...\n\n"
+        f"💰 Списано: <b>{job['cost']} токенов</b>\n"
+        f"💼 Остаток: <b>{job['balance']} токенов</b>\n\n"
+        "Результат придёт сюда, как только будет готов."
+    )
+    job["status_message_id"] = status.message_id
+    try:
+        await api_client.update_generation_job(job["id"], status.message_id)
+    except Exception as e:
+        # Не критично: после перезапуска сообщение просто не удалится
+        logger.warning(f"Не удалось сохранить сообщение статуса задания {job['id']}: {e}")
+
+    generation_queue.submit(job)
+    return job
+
+
+async def run_generation_job(job: dict):
+    """Выполнить задание из очереди и отправить результат в чат"""
+    chat_id = job["chat_id"]
+    try:
+        job = await api_client.start_generation_job(job["id"])
+    except APIClientError as e:
+        # Задание уже завершено (например, результат выдан до перезапуска)
+        logger.info(f"Задание генерации {job['id']} пропущено: {e}")
+        return
+
+    if job["status"] == "failed":
+        # Backend снял задание (резерв токенов истёк или исчерпаны попытки)
+        if job.get("status_message_id"):
+            await delete_messages(chat_id, [job["status_message_id"]])
+        try:
+            await bot.send_message(
+                chat_id,
+                f"❌ <b>Генерация отменена:</b> {job.get('error') or 'задание не выполнено'}."
+                + ("\n💰 Токены возвращены на баланс." if job.get("refunded") else "")
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить об отмене генерации в чат {chat_id}: {e}")
+        return
+
+    if job.get("cache_epoch") is not None:
+        # Поколение кэша результатов из backend: сброс, не дошедший до бота, применяется здесь
+        fal_result_cache.set_epoch(job["cache_epoch"])
+
+    prompt = job.get("prompt")
+    image_url = None
+    from_cache = False
+    error = None
+    try:
+        if not prompt:
+            prompt_data = await PromptGeneratorService.generate_prompt_from_images(
+                product_image_urls=job["product_images"],
+                reference_image_urls=job["reference_images"]
+            )
+            prompt = prompt_data["generated_text_prompt"]
+            if job.get("card_text"):
+                prompt = f"{prompt}. Add text on the card: '{job['card_text']}'"
+
+        image_urls, from_cache = await FALService.generate_product_image(
+            prompt=prompt,
+            product_images=job["product_images"],
+            reference_images=job["reference_images"],
+            num_images=1,
+            aspect_ratio=job["aspect_ratio"],
+            model_id=job.get("model_id"),
+            seed=job.get("seed"),
+            # Кэш - только для заданий с явно заданным seed: "ещё раз" - новая генерация
+            use_cache=job.get("use_cache", False),
+        )
+        if image_urls:
+            await bot.send_photo(
+                chat_id,
+                photo=image_urls[0],
+                caption=(
+                    "✨ <b>Готово!</b>\n\n"
+                    "Ваша карточка товара успешно сгенерирована!\n\n"
+                    + ("💰 Такая карточка уже была сгенерирована - токены возвращены.\n\n" if from_cache else "")
+                    + "Выберите действие:"
+                ),
+                reply_markup=result_keyboard()
+            )
+            image_url = image_urls[0]
+    except Exception as e:
+        logger.error(f"Ошибка при генерации изображения (задание {job['id']}): {e}")
+        error = str(e)
+
+    if job.get("status_message_id"):
+        await delete_messages(chat_id, [job["status_message_id"]])
+
+    if image_url:
+        # Сохраняем результат для правок
+        state = dp.fsm.get_context(bot=bot, chat_id=chat_id, user_id=job["tg_id"])
+        await state.update_data(last_generated_image=image_url, generated_prompt=prompt)
+        try:
+            await api_client.complete_generation_job(job, image_url, prompt, cached=from_cache)
+        except Exception as e:
+            # Резерв токенов подтвердится при следующем complete или вернётся по TTL
+            logger.error(f"Не удалось завершить задание генерации {job['id']}: {e}")
+        logger.info(f"Пользователь успешно сгенерировал изображение")
+        return
+
+    refunded = False
+    try:
+        result = await api_client.fail_generation_job(job, error or "Пустой результат генерации")
+        refunded = bool(result.get("refunded"))
+    except Exception as e:
+        logger.error(f"Не удалось отметить ошибку задания генерации {job['id']}: {e}")
+
+    refund_note = "\n💰 Токены возвращены на баланс." if refunded else ""
+    try:
+        if error:
+            await bot.send_message(
+                chat_id,
+                f"❌ <b>Ошибка при генерации:</b>\n\n"
+                f"<code>{error}</code>\n\n"
+                f"Попробуйте ещё раз позже." + refund_note
+            )
+        else:
+            await bot.send_message(chat_id, "❌ Не удалось сгенерировать изображение. Попробуйте ещё раз." + refund_note)
+    except Exception as e:
+        logger.warning(f"Не удалось сообщить об ошибке генерации в чат {chat_id}: {e}")
+
+
+# Общая очередь генераций бота: задания хранятся в backend и продолжаются после перезапуска
+generation_queue = GenerationQueue(
+    run_generation_job,
+    resume=api_client.list_unfinished_generation_jobs,
+    # Лимит считается по модели FAL, которая реально будет вызвана
+    model_of=lambda job: FALService.model_for(job["reference_images"]),
+)
 
 
 # Обработчик для кнопки "🎨Генерация карточки" удалён - теперь используется inline кнопка из профиля
@@ -84,6 +265,7 @@ async def start_generation(callback: CallbackQuery, state: FSMContext):
             callback.from_user.id,
             username=callback.from_user.username,
             full_name=get_full_name(callback.from_user),
+            fresh=True,
         )
     except Exception as exc:
         logger.warning(f"Не удалось получить профиль пользователя: {exc}")
@@ -207,22 +389,11 @@ async def collect_product_photos(message: Message, state: FSMContext):
         messages_to_process = media_groups[media_group_id]
         del media_groups[media_group_id]
 
-        uploaded_count = 0
-        for msg in messages_to_process:
-            if len(product_photos) >= 5:
-                break
-
-            photo = msg.photo[-1]
-            file_info = await bot.get_file(photo.file_id)
-
-            # Скачиваем фото
-            file_path = os.path.join(TEMP_PHOTO_DIR, f"{msg.from_user.id}_product_{len(product_photos)}.jpg")
-            await bot.download_file(file_info.file_path, file_path)
-
-            # Загружаем в FAL storage
-            fal_url = await FALService.upload_image_to_fal(file_path)
-            product_photos.append(fal_url)
-            uploaded_count += 1
+        # Скачиваем фото в память и загружаем в FAL storage параллельно
+        photos = [msg.photo[-1] for msg in messages_to_process[:5 - len(product_photos)]]
+        fal_urls = await FALService.upload_telegram_photos(bot, photos)
+        product_photos.extend(fal_urls)
+        uploaded_count = len(fal_urls)
 
         await state.update_data(product_photos=product_photos)
 
@@ -246,15 +417,8 @@ async def collect_product_photos(message: Message, state: FSMContext):
         )
     else:
         # Одиночное фото
-        photo = message.photo[-1]
-        file_info = await bot.get_file(photo.file_id)
-
-        # Скачиваем фото
-        file_path = os.path.join(TEMP_PHOTO_DIR, f"{message.from_user.id}_product_{len(product_photos)}.jpg")
-        await bot.download_file(file_info.file_path, file_path)
-
-        # Загружаем в FAL storage
-        fal_url = await FALService.upload_image_to_fal(file_path)
+        # Скачиваем фото в память и загружаем в FAL storage
+        fal_url = await FALService.upload_telegram_photo(bot, message.photo[-1])
 
         product_photos.append(fal_url)
         await state.update_data(product_photos=product_photos)
@@ -339,22 +503,11 @@ async def collect_reference_photos(message: Message, state: FSMContext):
         messages_to_process = media_groups[media_group_id]
         del media_groups[media_group_id]
 
-        uploaded_count = 0
-        for msg in messages_to_process:
-            if len(reference_photos) >= 5:
-                break
-
-            photo = msg.photo[-1]
-            file_info = await bot.get_file(photo.file_id)
-
-            # Скачиваем фото
-            file_path = os.path.join(TEMP_PHOTO_DIR, f"{msg.from_user.id}_ref_{len(reference_photos)}.jpg")
-            await bot.download_file(file_info.file_path, file_path)
-
-            # Загружаем в FAL storage
-            fal_url = await FALService.upload_image_to_fal(file_path)
-            reference_photos.append(fal_url)
-            uploaded_count += 1
+        # Скачиваем фото в память и загружаем в FAL storage параллельно
+        photos = [msg.photo[-1] for msg in messages_to_process[:5 - len(reference_photos)]]
+        fal_urls = await FALService.upload_telegram_photos(bot, photos)
+        reference_photos.extend(fal_urls)
+        uploaded_count = len(fal_urls)
 
         await state.update_data(reference_photos=reference_photos)
 
@@ -378,15 +531,8 @@ async def collect_reference_photos(message: Message, state: FSMContext):
         )
     else:
         # Одиночное фото
-        photo = message.photo[-1]
-        file_info = await bot.get_file(photo.file_id)
-
-        # Скачиваем фото
-        file_path = os.path.join(TEMP_PHOTO_DIR, f"{message.from_user.id}_ref_{len(reference_photos)}.jpg")
-        await bot.download_file(file_info.file_path, file_path)
-
-        # Загружаем в FAL storage
-        fal_url = await FALService.upload_image_to_fal(file_path)
+        # Скачиваем фото в память и загружаем в FAL storage
+        fal_url = await FALService.upload_telegram_photo(bot, message.photo[-1])
 
         reference_photos.append(fal_url)
         await state.update_data(reference_photos=reference_photos)
@@ -632,88 +778,9 @@ async def receive_edited_prompt(message: Message, state: FSMContext):
 
 async def generate_with_confirmed_prompt(message: Message, state: FSMContext, prompt: str, user_id: int | None = None):
     """Генерация изображения с подтверждённым промптом (без повторной генерации промпта)"""
-    data = await state.get_data()
-    product_photos = data.get("product_photos", [])
-    reference_photos = data.get("reference_photos", [])
-    aspect_ratio = data.get("aspect_ratio", "3:4")
-    card_text = data.get("card_text")
-    
     await state.set_state(ImageGenerationStates.generating)
-    
-    # Список ID сообщений для удаления
-    temp_messages = []
-    
     try:
-        tg_id = user_id or message.chat.id
-        charge = await charge_image_generation(message, state, tg_id)
-        if not charge:
-            return
-
-        # Если указан текст на карточке, добавляем его в промпт
-        if card_text:
-            prompt = f"{prompt}. Add text on the card: '{card_text}'"
-
-        data = await state.get_data()
-        model_name = data.get("model_name", "Nano Banana")
-        model_id = data.get("model_id")
-        
-        msg1 = await message.answer(
-            f"🎨 Генерирую изображение через {model_name}...\n\n"
-            f"💰 Списано: <b>{charge['cost']} токенов</b>\n"
-            f"💼 Остаток: <b>{charge['balance']} токенов</b>"
-        )
-        temp_messages.append(msg1.message_id)
-        
-        image_urls = await FALService.generate_product_image(
-            prompt=prompt,
-            product_images=product_photos,
-            reference_images=reference_photos,
-            num_images=1,
-            aspect_ratio=aspect_ratio,
-            model_id=model_id
-        )
-        
-        if not image_urls:
-            # Удаляем временные сообщения
-            await delete_messages(message.chat.id, temp_messages)
-            
-            await message.answer(
-                "❌ Не удалось сгенерировать изображение. Попробуйте ещё раз."
-            )
-            await state.clear()
-            return
-        
-        # Сохраняем результат
-        await state.update_data(last_generated_image=image_urls[0], generated_prompt=prompt)
-        
-        # Удаляем все временные сообщения
-        await delete_messages(message.chat.id, temp_messages)
-        
-        # Отправляем результат с кнопками
-        await message.answer_photo(
-            photo=image_urls[0],
-            caption=(
-                "✨ <b>Готово!</b>\n\n"
-                "Ваша карточка товара успешно сгенерирована!\n\n"
-                "Выберите действие:"
-            ),
-            reply_markup=result_keyboard()
-        )
-        
-        logger.info(f"Пользователь успешно сгенерировал изображение")
-        
-    except Exception as e:
-        logger.error(f"Ошибка при генерации изображения: {e}")
-        
-        # Удаляем временные сообщения даже при ошибке
-        await delete_messages(message.chat.id, temp_messages)
-        
-        await message.answer(
-            f"❌ <b>Ошибка при генерации:</b>\n\n"
-            f"<code>{str(e)}</code>\n\n"
-            f"Попробуйте ещё раз позже."
-        )
-    
+        await enqueue_generation(message, state, user_id or message.chat.id, prompt, "🎨 Генерирую изображение")
     finally:
         await state.set_state(None)
 
@@ -787,220 +854,23 @@ async def reenter_custom_prompt(callback: CallbackQuery, state: FSMContext):
 
 
 async def generate_with_ai_prompt(message: Message, state: FSMContext):
-    """Генерация с AI промптом"""
-    data = await state.get_data()
-    product_photos = data.get("product_photos", [])
-    reference_photos = data.get("reference_photos", [])
-    aspect_ratio = data.get("aspect_ratio", "3:4")
-    card_text = data.get("card_text")
-
+    """Генерация с AI промптом: промпт по фото создаётся уже в очереди"""
     await state.set_state(ImageGenerationStates.generating)
-
-    # Список ID сообщений для удаления
-    temp_messages = []
-
-    msg1 = await message.answer(
-        "⏳ <b>Начинаю генерацию...</b>\n\n"
-        f"📦 Фото товара: {len(product_photos)} шт.\n"
-        f"🎨 Референсов: {len(reference_photos)} шт.\n"
-        f"📐 Формат: {aspect_ratio}\n\n"
-        "Это может занять 1-2 минуты. Пожалуйста, подождите..."
-    )
-    temp_messages.append(msg1.message_id)
-
     try:
-        # Шаг 1: Генерация промпта через GPT-4o
-        msg2 = await message.answer("🤖 Анализирую товар и создаю промпт...")
-        temp_messages.append(msg2.message_id)
-
-        prompt_data = await PromptGeneratorService.generate_prompt_from_images(
-            product_image_urls=product_photos,
-            reference_image_urls=reference_photos
-        )
-
-        generated_prompt = prompt_data["generated_text_prompt"]
-        analysis = prompt_data["deconstruction_analysis"]
-
-        # Если указан текст на карточке, добавляем его в промпт
-        if card_text:
-            generated_prompt = f"{generated_prompt}. Add text on the card: '{card_text}'"
-
-        # Сохраняем промпт и анализ
-        await state.update_data(generated_prompt=generated_prompt, analysis=analysis)
-
-        # Показываем пользователю анализ (временно)
-        msg3 = await message.answer(
-            f"✅ <b>Анализ завершён!</b>\n\n"
-            f"📝 <b>Товар:</b> {analysis['product_identified']}\n"
-            f"🎨 <b>Стиль:</b> {analysis['style_source']}\n"
-            f"📐 <b>Композиция:</b> {analysis['layout_source']}\n"
-            f"🎨 <b>Палитра:</b> {analysis['palette_source']}\n\n"
-            f"<b>Промпт:</b>\n<code>{generated_prompt}</code>"
-        )
-        temp_messages.append(msg3.message_id)
-
-        tg_id = message.chat.id
-        charge = await charge_image_generation(message, state, tg_id)
-        if not charge:
-            return
-
-        data = await state.get_data()
-        model_name = data.get("model_name", "Nano Banana")
-        model_id = data.get("model_id")
-        
-        # Шаг 2: Генерация изображения через FAL
-        msg4 = await message.answer(
-            f"🎨 Генерирую изображение через {model_name}...\n\n"
-            f"💰 Списано: <b>{charge['cost']} токенов</b>\n"
-            f"💼 Остаток: <b>{charge['balance']} токенов</b>"
-        )
-        temp_messages.append(msg4.message_id)
-        
-        image_urls = await FALService.generate_product_image(
-            prompt=generated_prompt,
-            product_images=product_photos,
-            reference_images=reference_photos,
-            num_images=1,
-            aspect_ratio=aspect_ratio,
-            model_id=model_id
-        )
-
-        if not image_urls:
-            # Удаляем временные сообщения
-            await delete_messages(message.chat.id, temp_messages)
-
-            await message.answer(
-                "❌ Не удалось сгенерировать изображение. Попробуйте ещё раз."
-            )
-            await state.clear()
-            return
-
-        # Сохраняем результат
-        await state.update_data(last_generated_image=image_urls[0])
-
-        # Удаляем все временные сообщения
-        await delete_messages(message.chat.id, temp_messages)
-
-        # Отправляем результат с кнопками
-        await message.answer_photo(
-            photo=image_urls[0],
-            caption=(
-                "✨ <b>Готово!</b>\n\n"
-                "Ваша карточка товара успешно сгенерирована!\n\n"
-                "Выберите действие:"
-            ),
-            reply_markup=result_keyboard()
-        )
-
-        logger.info(f"Пользователь успешно сгенерировал изображение")
-
-    except Exception as e:
-        logger.error(f"Ошибка при генерации изображения: {e}")
-
-        # Удаляем временные сообщения даже при ошибке
-        await delete_messages(message.chat.id, temp_messages)
-
-        await message.answer(
-            f"❌ <b>Ошибка при генерации:</b>\n\n"
-            f"<code>{str(e)}</code>\n\n"
-            f"Попробуйте ещё раз позже."
+        await enqueue_generation(
+            message, state, message.chat.id, None, "🤖 Анализирую товар и генерирую изображение"
         )
-
     finally:
         await state.set_state(None)
 
 
 async def generate_with_custom_prompt(message: Message, state: FSMContext, custom_prompt: str):
     """Генерация с кастомным промптом"""
-    data = await state.get_data()
-    product_photos = data.get("product_photos", [])
-    reference_photos = data.get("reference_photos", [])
-    aspect_ratio = data.get("aspect_ratio", "3:4")
-    card_text = data.get("card_text")
-
     await state.set_state(ImageGenerationStates.generating)
-
-    # Список ID сообщений для удаления
-    temp_messages = []
-
     try:
-        tg_id = message.chat.id
-        charge = await charge_image_generation(message, state, tg_id)
-        if not charge:
-            return
-
-        # Если указан текст на карточке, добавляем его в промпт
-        if card_text:
-            custom_prompt = f"{custom_prompt}. Add text on the card: '{card_text}'"
-
-        data = await state.get_data()
-        model_name = data.get("model_name", "Nano Banana")
-        model_id = data.get("model_id")
-        
-        msg1 = await message.answer(
-            f"🎨 Генерирую изображение с вашим промптом через {model_name}...\n\n"
-            f"💰 Списано: <b>{charge['cost']} токенов</b>\n"
-            f"💼 Остаток: <b>{charge['balance']} токенов</b>"
-        )
-        temp_messages.append(msg1.message_id)
-        
-        msg1 = await message.answer(
-            f"🎨 Генерирую изображение с вашим промптом через {model_name}...\n\n"
-            f"💰 Списано: <b>{charge['cost']} токенов</b>\n"
-            f"💼 Остаток: <b>{charge['balance']} токенов</b>"
+        await enqueue_generation(
+            message, state, message.chat.id, custom_prompt, "🎨 Генерирую изображение с вашим промптом"
         )
-        temp_messages.append(msg1.message_id)
-        
-        image_urls = await FALService.generate_product_image(
-            prompt=custom_prompt,
-            product_images=product_photos,
-            reference_images=reference_photos,
-            num_images=1,
-            aspect_ratio=aspect_ratio,
-            model_id=model_id
-        )
-
-        if not image_urls:
-            # Удаляем временные сообщения
-            await delete_messages(message.chat.id, temp_messages)
-
-            await message.answer(
-                "❌ Не удалось сгенерировать изображение. Попробуйте ещё раз."
-            )
-            await state.clear()
-            return
-
-        # Сохраняем результат
-        await state.update_data(last_generated_image=image_urls[0], generated_prompt=custom_prompt)
-
-        # Удаляем все временные сообщения
-        await delete_messages(message.chat.id, temp_messages)
-
-        # Отправляем результат с кнопками
-        await message.answer_photo(
-            photo=image_urls[0],
-            caption=(
-                "✨ <b>Готово!</b>\n\n"
-                "Ваша карточка товара успешно сгенерирована!\n\n"
-                "Выберите действие:"
-            ),
-            reply_markup=result_keyboard()
-        )
-
-        logger.info(f"Пользователь успешно сгенерировал изображение с кастомным промптом")
-
-    except Exception as e:
-        logger.error(f"Ошибка при генерации изображения: {e}")
-
-        # Удаляем временные сообщения даже при ошибке
-        await delete_messages(message.chat.id, temp_messages)
-
-        await message.answer(
-            f"❌ <b>Ошибка при генерации:</b>\n\n"
-            f"<code>{str(e)}</code>\n\n"
-            f"Попробуйте ещё раз позже."
-        )
-
     finally:
         # Сбрасываем только состояние, чтобы сохранить данные для дальнейшего редактирования
         await state.set_state(None)
@@ -1017,6 +887,7 @@ async def back_to_menu(callback: CallbackQuery, state: FSMContext):
             callback.from_user.id,
             username=callback.from_user.username,
             full_name=get_full_name(callback.from_user),
+            fresh=True,
         )
     except Exception:
         profile = {}
@@ -32,7 +32,7 @@ async def show_profile(message: types.Message):
     from bot.keyboards.main_menu import main_menu_kb
     
     tg = message.from_user
-    data = await api.get_profile(tg.id, username=tg.username, full_name=get_full_name(tg))
+    data = await api.get_profile(tg.id, username=tg.username, full_name=get_full_name(tg), fresh=True)
 
     active_until = data.get("active_until") if data else None
     has_active_sub = active_until is not None
@@ -132,6 +132,7 @@ async def generate_handler(callback: types.CallbackQuery, state: FSMContext):
             callback.from_user.id,
             username=callback.from_user.username,
             full_name=get_full_name(callback.from_user),
+            fresh=True,
         )
     except Exception:
         profile = {}
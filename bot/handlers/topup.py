@@ -38,7 +38,7 @@ async def show_topup_menu(message: Message):
     tg = message.from_user
     
     try:
-        profile = await api.get_profile(tg.id, username=tg.username, full_name=get_full_name(tg))
+        profile = await api.get_profile(tg.id, username=tg.username, full_name=get_full_name(tg), fresh=True)
         balance = profile.get("bonus_balance", 0) if profile else 0
     except Exception as e:
         logger.error(f"Ошибка получения профиля: {e}")
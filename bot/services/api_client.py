@@ -1,8 +1,33 @@
+import asyncio
 import aiohttp
 import json
-from typing import Optional
+import os
+import time
+import uuid
+from collections import deque
+from typing import Iterable, Optional
+from backend.core.cache import TTLCache
 from bot.config import BACKEND_URL
 
+# Сколько раз повторять списание токенов при сетевых ошибках
+CHARGE_RETRIES = 3
+
+# Пул соединений с backend (одна сессия на процесс)
+API_POOL_LIMIT = int(os.getenv("API_POOL_LIMIT", "100"))
+API_POOL_LIMIT_PER_HOST = int(os.getenv("API_POOL_LIMIT_PER_HOST", "50"))
+API_KEEPALIVE_TIMEOUT = float(os.getenv("API_KEEPALIVE_TIMEOUT", "30"))
+
+# Таймауты запросов, секунды
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "15"))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_LONG_TIMEOUT = float(os.getenv("API_LONG_TIMEOUT", "120"))  # AI-ответы, перегенерация файлов
+
+# Кэш профилей в боте. Backend сбрасывает записи через /cache/invalidate при
+# изменении баланса, подписки и т.п.; TTL страхует от потерянной инвалидации.
+# Экраны с балансом запрашивают профиль мимо кэша (get_profile(fresh=True)).
+BOT_PROFILE_CACHE_TTL = float(os.getenv("BOT_PROFILE_CACHE_TTL", "120"))
+BOT_PROFILE_CACHE_SIZE = int(os.getenv("BOT_PROFILE_CACHE_SIZE", "10000"))
+
 
 class APIClientError(Exception):
     """Базовая ошибка API клиента"""
@@ -12,10 +37,143 @@ class InsufficientTokensError(APIClientError):
     """Недостаточно токенов"""
 
 
+class LatencyStats:
+    """Задержки запросов к backend по эндпоинтам (последние window замеров)"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._samples: dict[str, deque] = {}
+        self._counts: dict[str, list] = {}  # endpoint -> [запросов, ошибок]
+
+    def observe(self, endpoint: str, seconds: float, ok: bool):
+        self._samples.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+        counts = self._counts.setdefault(endpoint, [0, 0])
+        counts[0] += 1
+        if not ok:
+            counts[1] += 1
+
+    def snapshot(self) -> dict:
+        result = {}
+        for endpoint, samples in self._samples.items():
+            ordered = sorted(samples)
+            count, errors = self._counts[endpoint]
+            result[endpoint] = {
+                "count": count,
+                "errors": errors,
+                "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1 if len(ordered) > 1 else 0] * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        return result
+
+    def reset(self):
+        self._samples.clear()
+        self._counts.clear()
+
+
 class APIClient:
+    """
+    Клиент backend API.
+
+    Все экземпляры используют одну aiohttp-сессию процесса с пулом keep-alive
+    соединений: start()/close() привязаны к startup/shutdown диспетчера,
+    а при обращении до start() сессия создаётся лениво.
+
+    Профили кэшируются по tg_id (profiles); запись сбрасывается, когда бот
+    сам меняет пользователя (списание, резерв, бонус) и по сигналу backend.
+    """
+
+    _session: Optional[aiohttp.ClientSession] = None
+    latency = LatencyStats()
+    profiles = TTLCache(BOT_PROFILE_CACHE_SIZE, BOT_PROFILE_CACHE_TTL)
+    # Растёт при каждой инвалидации: ответ, запрошенный до неё, не кладётся в кэш
+    _profiles_generation = 0
+    # Условные GET: path -> (ETag, разобранный ответ); на 304 отдаётся сохранённый ответ
+    _validators: dict = {}
+
     def __init__(self):
         self.base_url = BACKEND_URL
 
+    @classmethod
+    async def start(cls):
+        cls._get_session()
+
+    @staticmethod
+    async def close():
+        session = APIClient._session
+        APIClient._session = None
+        if session and not session.closed:
+            await session.close()
+
+    @staticmethod
+    def invalidate_profiles(tg_ids: Optional[Iterable[int]] = None):
+        """Сбросить профили tg_ids (None - все)"""
+        APIClient._profiles_generation += 1
+        if tg_ids is None:
+            APIClient.profiles.clear()
+            return
+        for tg_id in tg_ids:
+            APIClient.profiles.pop(int(tg_id))
+
+    @staticmethod
+    def _get_session() -> aiohttp.ClientSession:
+        # Сессия хранится на APIClient, а не на cls: одна на процесс и для подклассов
+        if APIClient._session is None or APIClient._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=API_POOL_LIMIT,
+                limit_per_host=API_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=API_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+            )
+            APIClient._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=API_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+            )
+        return APIClient._session
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        endpoint: str,
+        *,
+        timeout: Optional[float] = None,
+        handler=None,
+        invalidates: Optional[Iterable[int]] = None,
+        conditional: bool = False,
+        **kwargs,
+    ):
+        """
+        Запрос к backend через общую сессию.
+        endpoint - имя для метрик задержки, handler(resp) - разбор ответа
+        (по умолчанию _handle_response), invalidates - tg_id, чьи профили
+        меняет запрос: они сбрасываются после ответа (и при ошибке).
+        conditional - GET с If-None-Match: неизменившийся ответ приходит как 304 без тела.
+        """
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout, connect=API_CONNECT_TIMEOUT)
+        handler = handler or self._handle_response
+        validator = self._validators.get(path) if conditional else None
+        if validator:
+            kwargs["headers"] = {**kwargs.get("headers", {}), "If-None-Match": validator[0]}
+
+        started = time.perf_counter()
+        ok = False
+        try:
+            async with self._get_session().request(method, f"{self.base_url}{path}", **kwargs) as resp:
+                if validator and resp.status == 304:
+                    ok = True
+                    return validator[1]
+                result = await handler(resp)
+                ok = True
+                if conditional and resp.headers.get("ETag"):
+                    self._validators[path] = (resp.headers["ETag"], result)
+                return result
+        finally:
+            self.latency.observe(endpoint, time.perf_counter() - started, ok)
+            if invalidates:
+                self.invalidate_profiles(invalidates)
+
     async def _handle_response(self, resp: aiohttp.ClientResponse):
         text = await resp.text()
         if resp.status >= 400:
@@ -34,20 +192,18 @@ class APIClient:
             return {}
 
     async def create_user(self, tg_id: int, username: str | None, full_name: str | None):
-        url = f"{self.base_url}/api/admin/users/"
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={
-                "tg_id": tg_id,
-                "username": username,
-                "full_name": full_name,
-            }) as resp:
-                return await self._handle_response(resp)
+        return await self._request("POST", "/api/admin/users/", "create_user", json={
+            "tg_id": tg_id,
+            "username": username,
+            "full_name": full_name,
+        }, invalidates=[tg_id])
+
+    async def report_undeliverable(self, reports: list):
+        """Получатели, которым бот не может писать: [{"tg_id", "reason"}]"""
+        return await self._request("POST", "/api/admin/users/undeliverable", "report_undeliverable", json=reports)
 
     async def get_user(self, tg_id: int):
-        url = f"{self.base_url}/api/admin/users/by_tg/{tg_id}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                return await self._handle_response(resp)
+        return await self._request("GET", f"/api/admin/users/by_tg/{tg_id}", "get_user")
 
     async def create_request(
         self, 
@@ -58,7 +214,6 @@ class APIClient:
         group_id: Optional[int] = None,
         user_email: Optional[str] = None
     ):
-        url = f"{self.base_url}/api/admin/requests/"
         payload = {
             "tg_id": tg_id,
             "tariff_code": tariff_code,
@@ -70,16 +225,11 @@ class APIClient:
         if user_email:
             payload["user_email"] = user_email
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload) as resp:
-                return await self._handle_response(resp)
+        return await self._request("POST", "/api/admin/requests/", "create_request", json=payload)
     
     async def get_groups(self):
         """Получить список групп доступа"""
-        url = f"{self.base_url}/api/admin/groups/"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                return await self._handle_response(resp)
+        return await self._request("GET", "/api/admin/groups/", "get_groups")
 
     async def get_profile(
         self,
@@ -87,14 +237,23 @@ class APIClient:
         *,
         username: str | None = None,
         full_name: str | None = None,
+        fresh: bool = False,
     ):
-        """Возвращает профиль, создавая пользователя при его отсутствии."""
-        url = f"{self.base_url}/api/profile/{tg_id}"
+        """
+        Возвращает профиль (из кэша, если он свежий), создавая пользователя при его отсутствии.
+        fresh - запросить backend мимо кэша: для показа баланса, который не должен
+        отставать, если сигнал сброса от backend потерялся. Ответ обновляет кэш.
+        """
+        cached = None if fresh else self.profiles.get(tg_id)
+        if cached is not None:
+            return cached
 
         async def _request():
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as resp:
-                    return await self._handle_response(resp)
+            generation = APIClient._profiles_generation
+            profile = await self._request("GET", f"/api/profile/{tg_id}", "get_profile")
+            if generation == APIClient._profiles_generation:
+                self.profiles.set(tg_id, profile)
+            return profile
 
         try:
             return await _request()
@@ -111,98 +270,154 @@ class APIClient:
             return await _request()
 
     async def get_referral_info(self, tg_id: int):
-        import httpx
-        async with httpx.AsyncClient() as client:
-            r = await client.get(f"{self.base_url}/api/referrals/{tg_id}/info")
-            r.raise_for_status()
-            return r.json()
+        return await self._request("GET", f"/api/referrals/{tg_id}/info", "get_referral_info")
     
     async def bind_referral(self, referred_tg: int, referrer_tg: int):
-        url = f"{self.base_url}/api/referrals/bind"
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, params={
-                "referred_tg": referred_tg,
-                "referrer_tg": referrer_tg
-            }) as resp:
-                return await resp.json()
+        async def _json(resp: aiohttp.ClientResponse):
+            return await resp.json()
+
+        return await self._request("POST", "/api/referrals/bind", "bind_referral", params={
+            "referred_tg": referred_tg,
+            "referrer_tg": referrer_tg
+        }, handler=_json, invalidates=[referred_tg, referrer_tg])
             
     async def query_ai(self, question: str, tg_id: int | None = None) -> str:
-        url = f"{self.base_url}/api/ai/query"
         payload = {"question": question}
         if tg_id:
             payload["tg_id"] = tg_id
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload) as resp:
-                data = await self._handle_response(resp)
-                return data.get("answer", "❌ Ошибка ответа от AI")
+        data = await self._request("POST", "/api/ai/query", "query_ai", json=payload, timeout=API_LONG_TIMEOUT)
+        return data.get("answer", "❌ Ошибка ответа от AI")
             
     async def get_user_file(self, tg_id: int):
-        url = f"{self.base_url}/api/files/user/{tg_id}/get"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                text = await resp.text()
-                if resp.status != 200:
-                    raise Exception(f"Failed to get user file: {resp.status}, {text}")
-                return await resp.json()
+        async def _handle(resp: aiohttp.ClientResponse):
+            text = await resp.text()
+            if resp.status != 200:
+                raise Exception(f"Failed to get user file: {resp.status}, {text}")
+            return await resp.json()
+
+        return await self._request("GET", f"/api/files/user/{tg_id}/get", "get_user_file", handler=_handle)
 
     async def regen_user_file(self, tg_id: int, filename: str | None = None):
-        url = f"{self.base_url}/api/files/user/{tg_id}/regen"
         payload = {}
         if filename:
             payload["filename"] = filename
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload if payload else None) as resp:
-                text = await resp.text()
-                if resp.status not in (200, 201):
-                    raise Exception(f"Failed to regen user file: {resp.status}, {text}")
-                return await resp.json()
+
+        async def _handle(resp: aiohttp.ClientResponse):
+            text = await resp.text()
+            if resp.status not in (200, 201):
+                raise Exception(f"Failed to regen user file: {resp.status}, {text}")
+            return await resp.json()
+
+        return await self._request(
+            "POST", f"/api/files/user/{tg_id}/regen", "regen_user_file",
+            json=payload if payload else None, handler=_handle, timeout=API_LONG_TIMEOUT,
+            invalidates=[tg_id],
+        )
 
     async def get_admin_settings(self):
-        url = f"{self.base_url}/api/admin/settings"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                return await self._handle_response(resp)
+        return await self._request("GET", "/api/admin/settings", "get_admin_settings", conditional=True)
     
     async def get_channel_settings(self):
         """Получить настройки канала"""
-        url = f"{self.base_url}/api/admin/settings/channel"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                return await self._handle_response(resp)
+        return await self._request("GET", "/api/admin/settings/channel", "get_channel_settings")
+
+    async def _post_with_retry(
+        self, path: str, endpoint: str, payload: dict | None = None, invalidates: Iterable[int] | None = None
+    ):
+        """
+        POST для идемпотентных операций с токенами: при сетевой ошибке
+        запрос повторяется с тем же телом (и тем же ключом идемпотентности).
+        """
+        for attempt in range(1, CHARGE_RETRIES + 1):
+            try:
+                return await self._request("POST", path, endpoint, json=payload, invalidates=invalidates)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= CHARGE_RETRIES:
+                    raise
+                await asyncio.sleep(0.5 * attempt)
+
+    async def charge_tokens(self, tg_id: int, action: str, idempotency_key: str | None = None):
+        """
+        Списание токенов. Повтор после сетевой ошибки идёт с тем же ключом
+        идемпотентности, поэтому backend не спишет токены дважды.
+        """
+        return await self._post_with_retry("/api/tokens/charge", "charge_tokens", {
+            "tg_id": tg_id,
+            "action": action,
+            "idempotency_key": idempotency_key or uuid.uuid4().hex,
+        }, invalidates=[tg_id])
+
+    async def reserve_tokens(self, tg_id: int, action: str, idempotency_key: str | None = None):
+        """Зарезервировать токены под действие (возвращаются при release или по TTL)"""
+        return await self._post_with_retry("/api/tokens/reserve", "reserve_tokens", {
+            "tg_id": tg_id,
+            "action": action,
+            "idempotency_key": idempotency_key or uuid.uuid4().hex,
+        }, invalidates=[tg_id])
+
+    async def commit_reservation(self, reservation_id: int):
+        """Подтвердить резерв токенов после успешной выдачи результата"""
+        return await self._post_with_retry(f"/api/tokens/reservations/{reservation_id}/commit", "commit_reservation")
+
+    async def release_reservation(self, reservation_id: int):
+        """Вернуть зарезервированные токены на баланс"""
+        return await self._post_with_retry(f"/api/tokens/reservations/{reservation_id}/release", "release_reservation")
+
+    async def create_generation_job(self, job: dict):
+        """
+        Поставить задание генерации (токены резервируются сразу, 402 - не хватает).
+        Повтор после сетевой ошибки идёт с тем же ключом и не ставит задание дважды;
+        ключ от вызывающего (сообщение, из которого запущена генерация) защищает
+        и от двойного нажатия. Без ключа - случайный на этот вызов.
+        """
+        payload = {**job, "idempotency_key": job.get("idempotency_key") or uuid.uuid4().hex}
+        return await self._post_with_retry(
+            "/api/generation/jobs/", "create_generation_job", payload, invalidates=[job["tg_id"]]
+        )
 
-    async def charge_tokens(self, tg_id: int, action: str):
-        url = f"{self.base_url}/api/tokens/charge"
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={"tg_id": tg_id, "action": action}) as resp:
-                return await self._handle_response(resp)
+    async def update_generation_job(self, job_id: int, status_message_id: int | None):
+        return await self._request("PATCH", f"/api/generation/jobs/{job_id}", "update_generation_job", json={
+            "status_message_id": status_message_id,
+        })
+
+    async def start_generation_job(self, job_id: int):
+        return await self._post_with_retry(f"/api/generation/jobs/{job_id}/start", "start_generation_job")
+
+    async def complete_generation_job(self, job: dict, result_url: str, prompt: str | None = None, cached: bool = False):
+        """Результат выдан: резерв токенов подтверждается, а для результата из кэша - возвращается"""
+        return await self._post_with_retry(f"/api/generation/jobs/{job['id']}/complete", "complete_generation_job", {
+            "result_url": result_url,
+            "prompt": prompt,
+            "cached": cached,
+        }, invalidates=[job["tg_id"]])
+
+    async def fail_generation_job(self, job: dict, error: str):
+        """Генерация не удалась: токены возвращаются (в ответе refunded)"""
+        return await self._post_with_retry(f"/api/generation/jobs/{job['id']}/fail", "fail_generation_job", {
+            "error": error[:2000],
+        }, invalidates=[job["tg_id"]])
+
+    async def list_unfinished_generation_jobs(self):
+        """Задания, прерванные перезапуском бота"""
+        return await self._request("GET", "/api/generation/jobs/unfinished", "list_unfinished_generation_jobs")
 
     async def get_token_pricing(self):
-        url = f"{self.base_url}/api/tokens/pricing"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                return await self._handle_response(resp)
+        return await self._request("GET", "/api/tokens/pricing", "get_token_pricing", conditional=True)
     
     async def get_image_models(self):
         """Получить список доступных моделей генерации изображений"""
-        url = f"{self.base_url}/api/tokens/models"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                return await self._handle_response(resp)
+        return await self._request("GET", "/api/tokens/models", "get_image_models", conditional=True)
     
     async def check_channel_subscription(self, tg_id: int):
         """Проверить подписку на канал и начислить бонус при необходимости"""
-        url = f"{self.base_url}/api/channel/check-subscription/{tg_id}"
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url) as resp:
-                return await self._handle_response(resp)
+        return await self._request(
+            "POST", f"/api/channel/check-subscription/{tg_id}", "check_channel_subscription", invalidates=[tg_id]
+        )
     
     async def create_token_purchase_request(self, tg_id: int, amount: int, cost: float):
         """Создать заявку на пополнение токенов"""
-        url = f"{self.base_url}/api/tokens/purchase"
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={
-                "tg_id": tg_id,
-                "amount": amount,
-                "cost": float(cost)
-            }) as resp:
-                return await self._handle_response(resp)
+        return await self._request("POST", "/api/tokens/purchase", "create_token_purchase_request", json={
+            "tg_id": tg_id,
+            "amount": amount,
+            "cost": float(cost)
+        })
@@ -0,0 +1,125 @@
+"""
+Замер времени сценария /start (запросы бота к backend) на локальной заглушке backend.
+
+Сравниваются два режима:
+  per-call - новая сессия и соединение на каждый запрос (как было раньше);
+  pooled   - общая сессия APIClient с keep-alive пулом.
+
+Запуск: python -m bot.services.api_client_benchmark --iterations 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiohttp import web
+
+from bot.services.api_client import APIClient
+
+
+class PerCallAPIClient(APIClient):
+    """Прежнее поведение: сессия закрывается после каждого запроса"""
+
+    async def _request(self, *args, **kwargs):
+        try:
+            return await super()._request(*args, **kwargs)
+        finally:
+            await APIClient.close()
+
+
+def stub_backend(latency: float, peers: set) -> web.Application:
+    async def respond(request: web.Request, body: dict):
+        peers.add(request.transport.get_extra_info("peername"))
+        if latency:
+            await asyncio.sleep(latency)
+        return web.json_response(body)
+
+    async def create_user(request):
+        return await respond(request, {"id": 1, "tg_id": 1})
+
+    async def bind_referral(request):
+        return await respond(request, {"ok": True})
+
+    async def channel_settings(request):
+        return await respond(request, {"channel_username": "channel", "bonus_amount": 10})
+
+    async def check_subscription(request):
+        return await respond(request, {"bonus_given": False})
+
+    async def profile(request):
+        return await respond(request, {
+            "tg_id": int(request.match_info["tg_id"]), "token_balance": 100,
+            "subscription": None, "has_file_access": False,
+        })
+
+    app = web.Application()
+    app.router.add_post("/api/admin/users/", create_user)
+    app.router.add_post("/api/referrals/bind", bind_referral)
+    app.router.add_get("/api/admin/settings/channel", channel_settings)
+    app.router.add_post("/api/channel/check-subscription/{tg_id}", check_subscription)
+    app.router.add_get("/api/profile/{tg_id}", profile)
+    return app
+
+
+async def start_flow(api: APIClient, tg_id: int):
+    """Запросы к backend в том же порядке, что и в обработчике /start"""
+    await api.create_user(tg_id, "user", "User")
+    await api.bind_referral(referred_tg=tg_id, referrer_tg=tg_id + 1)
+    await api.get_channel_settings()
+    await api.check_channel_subscription(tg_id)
+    await api.get_profile(tg_id, username="user", full_name="User")
+
+
+async def measure(api: APIClient, iterations: int) -> list:
+    timings = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        await start_flow(api, 1000 + i)
+        timings.append(time.perf_counter() - started)
+    await APIClient.close()
+    return timings
+
+
+def report(mode: str, timings: list, connections: int):
+    ordered = sorted(timings)
+    print(
+        f"{mode:9} avg {statistics.mean(ordered) * 1000:7.2f} ms"
+        f"   p95 {ordered[int(len(ordered) * 0.95) - 1] * 1000:7.2f} ms"
+        f"   соединений {connections}"
+    )
+
+
+async def run_benchmark(args):
+    peers: set = set()
+    runner = web.AppRunner(stub_backend(args.latency, peers))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        for mode, client_cls in (("per-call", PerCallAPIClient), ("pooled", APIClient)):
+            api = client_cls()
+            api.base_url = base_url
+            peers.clear()
+            await measure(api, 5)  # прогрев
+            peers.clear()
+            timings = await measure(api, args.iterations)
+            report(mode, timings, len(peers))
+    finally:
+        await runner.cleanup()
+
+    print()
+    for endpoint, stats in APIClient.latency.snapshot().items():
+        print(f"{endpoint:28} {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа заглушки, с")
+    parser.add_argument("--port", type=int, default=8098)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.types import FSInputFile, InputMediaDocument, InputMediaPhoto, Message
+
+logger = logging.getLogger(__name__)
+
+# Telegram: не более ~30 сообщений в секунду на бота и ~1 в секунду в один чат.
+# Значения по умолчанию оставляют запас, чтобы не ловить flood-лимиты.
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "25"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1.0"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "16"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+
+# Сколько текстов ошибок хранить в результате
+MAX_ERRORS_KEPT = 100
+
+# Файлы рассылок, которые сохраняет backend (общий том /app/data)
+BROADCAST_MEDIA_DIR = os.getenv("BROADCAST_MEDIA_DIR", "/app/data/broadcast_media")
+
+# sha256 -> file_id загруженных в Telegram файлов (на время жизни процесса;
+# постоянное хранилище - таблица telegram_files в backend)
+_file_ids: dict = {}
+
+
+def classify_undeliverable(error: Exception) -> Optional[str]:
+    """
+    Причина, по которой писать получателю бессмысленно, или None для временных ошибок.
+    Такие получатели исключаются из следующих рассылок до их /start.
+    """
+    text = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        if "blocked" in text:
+            return "blocked"
+        if "deactivated" in text:
+            return "deactivated"
+        return "forbidden"
+    if isinstance(error, TelegramBadRequest) and "chat not found" in text:
+        return "chat_not_found"
+    return None
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости "ведро токенов": rate токенов в секунду,
+    не более capacity подряд. pause() останавливает выдачу (RetryAfter от Telegram).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate / 5)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def pause(self, seconds: float):
+        """Не выдавать токены ближайшие seconds секунд"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated_at = max(self._updated_at, self._paused_until)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class MediaBroadcast:
+    """
+    Отправка фото, документа или альбома.
+
+    Файл загружается в Telegram один раз: первая отправка идёт под блокировкой,
+    из ответа берётся file_id, остальные получатели получают файл по file_id.
+    """
+
+    def __init__(self, bot: Bot, media: list, caption: Optional[str] = None):
+        self.bot = bot
+        self.media = media
+        self.caption = caption or None
+        self._upload_lock = asyncio.Lock()
+        for item in media:
+            if item.get("file_id"):
+                _file_ids.setdefault(item["sha256"], item["file_id"])
+
+    @property
+    def file_ids(self) -> dict:
+        return {item["sha256"]: _file_ids[item["sha256"]] for item in self.media if item["sha256"] in _file_ids}
+
+    def _uploaded(self) -> bool:
+        return all(item["sha256"] in _file_ids for item in self.media)
+
+    @staticmethod
+    def _input(item: dict):
+        file_id = _file_ids.get(item["sha256"])
+        if file_id:
+            return file_id
+        # Только имя файла: путь за пределами каталога медиа не принимается
+        return FSInputFile(os.path.join(BROADCAST_MEDIA_DIR, os.path.basename(item["filename"])))
+
+    @staticmethod
+    def _file_id(message: Message) -> Optional[str]:
+        if message.photo:
+            return message.photo[-1].file_id
+        if message.document:
+            return message.document.file_id
+        return None
+
+    async def _send(self, chat_id: int) -> list:
+        if len(self.media) > 1:
+            media_cls = InputMediaPhoto if self.media[0]["type"] == "photo" else InputMediaDocument
+            group = [
+                media_cls(media=self._input(item), caption=self.caption if i == 0 else None)
+                for i, item in enumerate(self.media)
+            ]
+            return await self.bot.send_media_group(chat_id=chat_id, media=group)
+
+        item = self.media[0]
+        if item["type"] == "photo":
+            message = await self.bot.send_photo(chat_id=chat_id, photo=self._input(item), caption=self.caption)
+        else:
+            message = await self.bot.send_document(chat_id=chat_id, document=self._input(item), caption=self.caption)
+        return [message]
+
+    async def send(self, chat_id: int):
+        if self._uploaded():
+            await self._send(chat_id)
+            return
+
+        async with self._upload_lock:
+            messages = await self._send(chat_id)
+            for item, message in zip(self.media, messages):
+                file_id = self._file_id(message)
+                if file_id and item["sha256"] not in _file_ids:
+                    _file_ids[item["sha256"]] = file_id
+                    logger.info(f"[BROADCAST] Файл {item['sha256'][:12]} загружен, file_id сохранён")
+
+
+@dataclass
+class BroadcastResult:
+    """Итог рассылки"""
+    success_count: int = 0
+    failed_count: int = 0
+    retried_count: int = 0
+    elapsed: float = 0.0
+    failed_ids: list = field(default_factory=list)
+    # По элементу на каждый из failed_ids, в том же порядке: {"error", "reason"}
+    failures: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    undeliverable: list = field(default_factory=list)  # [{"tg_id", "reason"}]
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.success_count / self.elapsed if self.elapsed else 0.0
+
+
+class BroadcastEngine:
+    """
+    Рассылка сообщений пулом отправителей с ограничением скорости.
+
+    - общий лимит бота - TokenBucket;
+    - лимит на чат - минимальный интервал между сообщениями в один чат;
+    - TelegramRetryAfter приостанавливает всех отправителей на retry_after
+      и возвращает сообщение в очередь без счёта попыток: Telegram просит
+      подождать, а не сообщает об ошибке;
+    - сетевые/серверные ошибки повторяются, не более max_retries раз.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = BROADCAST_GLOBAL_RATE,
+        workers: int = BROADCAST_WORKERS,
+        per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._chat_next_at: dict = {}
+
+    async def _wait_for_chat(self, chat_id: int):
+        now = time.monotonic()
+        next_at = self._chat_next_at.get(chat_id, 0.0)
+        self._chat_next_at[chat_id] = max(now, next_at) + self.per_chat_interval
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+    def _forget_idle_chats(self):
+        """Убрать чаты, для которых интервал уже истёк (словарь не растёт между рассылками)"""
+        now = time.monotonic()
+        self._chat_next_at = {chat_id: at for chat_id, at in self._chat_next_at.items() if at > now}
+
+    async def _worker(self, queue: asyncio.Queue, send: Callable, chat_of: Callable, result: BroadcastResult):
+        while True:
+            item, attempt = await queue.get()
+            chat_id = chat_of(item)
+            try:
+                await self._wait_for_chat(chat_id)
+                await self.bucket.acquire()
+                await send(item)
+                result.success_count += 1
+            except TelegramRetryAfter as e:
+                logger.warning(f"[BROADCAST] Flood control: пауза {e.retry_after} с")
+                self.bucket.pause(e.retry_after)
+                result.retried_count += 1
+                queue.put_nowait((item, attempt))
+            except (TelegramNetworkError, TelegramServerError) as e:
+                self._requeue(queue, item, chat_id, attempt, e, result)
+            except Exception as e:
+                self._fail(item, chat_id, e, result)
+            finally:
+                queue.task_done()
+
+    def _requeue(self, queue: asyncio.Queue, item, chat_id: int, attempt: int, error: Exception, result: BroadcastResult):
+        if attempt >= self.max_retries:
+            self._fail(item, chat_id, error, result)
+            return
+        result.retried_count += 1
+        queue.put_nowait((item, attempt + 1))
+
+    @staticmethod
+    def _fail(item, chat_id: int, error: Exception, result: BroadcastResult):
+        result.failed_count += 1
+        result.failed_ids.append(item)
+        reason = classify_undeliverable(error)
+        result.failures.append({"error": str(error), "reason": reason})
+        if reason:
+            result.undeliverable.append({"tg_id": chat_id, "reason": reason})
+        if len(result.errors) < MAX_ERRORS_KEPT:
+            result.errors.append({"user_id": chat_id, "error": str(error)})
+
+    async def run(
+        self,
+        chat_ids: Iterable,
+        send: Optional[Callable[..., Awaitable]] = None,
+        text: Optional[str] = None,
+        chat_of: Optional[Callable] = None,
+    ) -> BroadcastResult:
+        """
+        Разослать сообщение всем chat_ids.
+        send(chat_id) - произвольная отправка; по умолчанию send_message(text).
+
+        Вместо chat_id элементами могут быть произвольные задания (например,
+        уведомления с разным текстом): тогда chat_of(item) возвращает чат
+        для лимитов, send(item) отправляет, а в failed_ids попадают задания.
+        """
+        if send is None:
+            async def send(chat_id: int):
+                await self.bot.send_message(chat_id=chat_id, text=text)
+        if chat_of is None:
+            def chat_of(item):
+                return item
+
+        result = BroadcastResult()
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in chat_ids:
+            queue.put_nowait((item, 0))
+
+        started = time.monotonic()
+        workers = [
+            asyncio.create_task(self._worker(queue, send, chat_of, result))
+            for _ in range(min(self.workers, queue.qsize()) or 1)
+        ]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        result.elapsed = time.monotonic() - started
+        self._forget_idle_chats()
+        logger.info(
+            f"[BROADCAST] Отправлено {result.success_count}, ошибок {result.failed_count}, "
+            f"повторов {result.retried_count}, {result.messages_per_second:.1f} msg/s"
+        )
+        return result
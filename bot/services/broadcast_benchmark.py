@@ -0,0 +1,122 @@
+"""
+Замер пропускной способности BroadcastEngine на локальном фейковом Bot API.
+
+Фейковый сервер ведёт себя как Telegram: отвечает 429 с retry_after,
+если бот превышает общий лимит (в секунду) или пишет в один чат чаще раза
+в секунду, и 403 для "заблокировавших бота" пользователей.
+
+Запуск: python -m bot.services.broadcast_benchmark --users 1000 --workers 16
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import deque
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from bot.services.broadcast import BroadcastEngine
+
+FAKE_TOKEN = "123456:benchmark"
+
+
+class FakeBotAPI:
+    """Минимальный sendMessage с лимитами Telegram"""
+
+    def __init__(self, global_limit: int, blocked: set, latency: float):
+        self.global_limit = global_limit
+        self.blocked = blocked
+        self.latency = latency
+        self.sent = deque()
+        self.chat_last = {}
+        self.stats = {"ok": 0, "429": 0, "403": 0}
+
+    def _too_many(self, retry_after: int):
+        self.stats["429"] += 1
+        return web.json_response({
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        })
+
+    async def send_message(self, request: web.Request):
+        data = await request.post() if request.content_type != "application/json" else await request.json()
+        chat_id = int(data["chat_id"])
+        await asyncio.sleep(random.uniform(0, self.latency * 2))
+
+        if chat_id in self.blocked:
+            self.stats["403"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user",
+            })
+
+        now = time.monotonic()
+        while self.sent and now - self.sent[0] > 1:
+            self.sent.popleft()
+        if len(self.sent) >= self.global_limit:
+            return self._too_many(1)
+        if now - self.chat_last.get(chat_id, -10) < 1:
+            return self._too_many(1)
+
+        self.sent.append(now)
+        self.chat_last[chat_id] = now
+        self.stats["ok"] += 1
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": self.stats["ok"],
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            },
+        })
+
+
+async def run_benchmark(args):
+    chat_ids = list(range(1, args.users + 1))
+    blocked = set(random.sample(chat_ids, int(len(chat_ids) * args.blocked)))
+    fake = FakeBotAPI(args.server_limit, blocked, args.latency)
+
+    app = web.Application()
+    app.router.add_post(f"/bot{FAKE_TOKEN}/sendMessage", fake.send_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}"))
+    bot = Bot(token=FAKE_TOKEN, session=session)
+    try:
+        engine = BroadcastEngine(bot, rate=args.rate, workers=args.workers)
+        result = await engine.run(chat_ids, text="benchmark")
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+    print(f"Получателей:      {args.users} (заблокировали бота: {len(blocked)})")
+    print(f"Отправлено:       {result.success_count}")
+    print(f"Ошибок:           {result.failed_count}")
+    print(f"Повторов:         {result.retried_count}")
+    print(f"Ответов 429:      {fake.stats['429']}")
+    print(f"Время:            {result.elapsed:.2f} с")
+    print(f"Скорость:         {result.messages_per_second:.1f} msg/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=25, help="лимит движка, msg/s")
+    parser.add_argument("--server-limit", type=int, default=30, help="лимит фейкового API, msg/s")
+    parser.add_argument("--blocked", type=float, default=0.02, help="доля заблокировавших бота")
+    parser.add_argument("--latency", type=float, default=0.05, help="средняя задержка ответа, с")
+    parser.add_argument("--port", type=int, default=8099)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Нагрузочный тест генераций бота на локальной заглушке очереди FAL.
+
+Заглушка ведёт себя как queue.fal.run: POST модели ставит задание,
+status_url отдаёт IN_QUEUE/IN_PROGRESS, пока задание "генерируется"
+(--job-seconds), затем COMPLETED. Сравниваются:
+  to-thread - блокирующий subscribe в asyncio.to_thread (как было раньше):
+              одновременно идёт не больше генераций, чем потоков executor'а;
+  queue     - FALService.generate_product_image через FalAIClient.run_queued.
+
+Запуск: python -m bot.services.fal_benchmark --jobs 200 --job-seconds 3
+"""
+import argparse
+import asyncio
+import itertools
+import threading
+import time
+
+import httpx
+from aiohttp import web
+
+from bot.services.fal_service import FALService, fal_queue
+
+MODEL = "fal-ai/nano-banana"
+
+
+class StubQueue:
+    """Очередь FAL: задание готово через job_seconds после постановки"""
+
+    def __init__(self, job_seconds: float):
+        self.job_seconds = job_seconds
+        self.ids = itertools.count(1)
+        self.submitted: dict = {}
+        self.running = 0
+        self.peak_running = 0
+
+    async def submit(self, request: web.Request):
+        request_id = str(next(self.ids))
+        self.submitted[request_id] = time.monotonic()
+        self.running += 1
+        self.peak_running = max(self.peak_running, self.running)
+        base = f"{request.scheme}://{request.host}/{MODEL}/requests/{request_id}"
+        return web.json_response({
+            "request_id": request_id,
+            "status_url": f"{base}/status",
+            "response_url": base,
+            "cancel_url": f"{base}/cancel",
+        })
+
+    def _done(self, request_id: str) -> bool:
+        return time.monotonic() - self.submitted[request_id] >= self.job_seconds
+
+    async def status(self, request: web.Request):
+        request_id = request.match_info["request_id"]
+        return web.json_response({"status": "COMPLETED" if self._done(request_id) else "IN_PROGRESS"})
+
+    async def result(self, request: web.Request):
+        request_id = request.match_info["request_id"]
+        self.running -= 1
+        return web.json_response({"images": [{"url": f"https://cdn.local/{request_id}.jpg"}]})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(f"/{MODEL}", self.submit)
+        app.router.add_get(f"/{MODEL}/requests/{{request_id}}/status", self.status)
+        app.router.add_get(f"/{MODEL}/requests/{{request_id}}", self.result)
+        return app
+
+
+def blocking_subscribe(base_url: str, poll_interval: float) -> dict:
+    """Как fal_client.subscribe: синхронные submit и опросы с time.sleep"""
+    with httpx.Client() as client:
+        handle = client.post(f"{base_url}/{MODEL}", json={"prompt": "x"}).json()
+        while client.get(handle["status_url"]).json()["status"] != "COMPLETED":
+            time.sleep(poll_interval)
+        return client.get(handle["response_url"]).json()
+
+
+async def watch(stats: dict, stop: asyncio.Event):
+    """Пиковое число потоков и задержка event loop"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.05)
+        stats["loop_lag"] = max(stats["loop_lag"], time.perf_counter() - started - 0.05)
+        stats["threads"] = max(stats["threads"], threading.active_count())
+
+
+async def run_mode(mode: str, args, base_url: str):
+    stats = {"loop_lag": 0.0, "threads": threading.active_count()}
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch(stats, stop))
+
+    async def one(i: int):
+        if mode == "to-thread":
+            result = await asyncio.to_thread(blocking_subscribe, base_url, args.poll_interval)
+            return [image["url"] for image in result["images"]]
+        urls, _ = await FALService.generate_product_image(
+            f"prompt {i}", [f"https://cdn.local/product_{i}.jpg"], ["https://cdn.local/reference.jpg"],
+        )
+        return urls
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.jobs)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await watcher
+    assert all(results)
+    return elapsed, stats
+
+
+async def run_benchmark(args):
+    import logging
+    logging.getLogger("bot.services.fal_service").setLevel(logging.WARNING)
+    logging.getLogger("fal_service").setLevel(logging.WARNING)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    fal_queue.api_key = "stub"
+    fal_queue.queue_base_url = base_url
+    fal_queue.poll_interval = args.poll_interval
+
+    for mode in ("to-thread", "queue"):
+        stub = StubQueue(args.job_seconds)
+        runner = web.AppRunner(stub.app())
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.port).start()
+        try:
+            elapsed, stats = await run_mode(mode, args, base_url)
+        finally:
+            await fal_queue.aclose()
+            await runner.cleanup()
+        print(
+            f"{mode:9} генераций {args.jobs}: {elapsed:6.2f} с, одновременно в FAL до {stub.peak_running}, "
+            f"потоков до {stats['threads']}, задержка event loop до {stats['loop_lag'] * 1000:.0f} мс"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--job-seconds", type=float, default=3.0, help="длительность генерации в заглушке")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=8096)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
 import os
 import asyncio
+import hashlib
 import logging
-from typing import List
+from io import BytesIO
+from typing import List, Optional, Tuple
 import fal_client
+from aiogram import Bot
+from aiogram.types import PhotoSize
+
+from backend.services.fal_service import fal_client as fal_queue
+from backend.services.result_cache import fal_result_cache
+from bot.services.upload_cache import upload_cache, FAL_UPLOAD_TTL_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -14,9 +22,27 @@ if FAL_API_KEY:
 else:
     logger.warning("FAL API key not found in environment variables")
 
+# Сколько фото альбома одновременно скачивается из Telegram и загружается в FAL
+FAL_UPLOAD_CONCURRENCY = int(os.getenv("FAL_UPLOAD_CONCURRENCY", "5"))
+_upload_slots = asyncio.Semaphore(FAL_UPLOAD_CONCURRENCY)
+
 
 class FALService:
-    """Сервис для работы с FAL API и моделью Nano Banana"""
+    """
+    Сервис для работы с FAL API и моделью Nano Banana.
+
+    Генерации идут через очередь FAL (FalAIClient.run_queued): ожидание
+    результата - асинхронные опросы статуса, без потоков executor'а;
+    число одновременных заданий ограничено FAL_MAX_CONCURRENT_JOBS.
+    """
+
+    NANO_BANANA_MODEL = "fal-ai/nano-banana"
+    FLUX_ULTRA_MODEL = "fal-ai/flux-pro/v1.1-ultra"
+
+    @staticmethod
+    def model_for(reference_images: List[str]) -> str:
+        """Модель FAL для генерации: с референсом - Nano Banana, без - FLUX Pro Ultra"""
+        return FALService.NANO_BANANA_MODEL if reference_images else FALService.FLUX_ULTRA_MODEL
 
     @staticmethod
     async def generate_product_image(
@@ -25,8 +51,10 @@ class FALService:
         reference_images: List[str],
         num_images: int = 1,
         aspect_ratio: str = "3:4",
-        model_id: str = None
-    ) -> List[str]:
+        model_id: str = None,
+        seed: Optional[int] = None,
+        use_cache: bool = False,
+    ) -> Tuple[List[str], bool]:
         """
         Генерация изображения товара с применением стиля референсов
 
@@ -39,9 +67,12 @@ class FALService:
             product_images: Список URL изображений товара
             reference_images: Список URL референсных изображений
             num_images: Количество изображений для генерации
+            seed: Фиксированный seed - одинаковый запрос даёт одинаковый результат
+            use_cache: Брать результат из кэша по содержимому запроса; только когда
+                seed фиксирован явно, иначе повтор должен давать новое изображение
 
         Returns:
-            Список URL сгенерированных изображений
+            Список URL сгенерированных изображений и признак, что он взят из кэша
         """
         try:
             logger.info(f"Начало генерации с промптом: {prompt[:100]}...")
@@ -77,7 +108,7 @@ class FALService:
                     "output_format": "jpeg",
                 }
 
-                model = "fal-ai/nano-banana"
+                model = FALService.model_for(reference_images)
             else:
                 # Без референса - обычная генерация
                 logger.info("Генерация без референса - используется FLUX Pro Ultra")
@@ -91,32 +122,70 @@ class FALService:
                     "enable_safety_checker": True,
                 }
 
-                model = "fal-ai/flux-pro/v1.1-ultra"
+                model = FALService.model_for(reference_images)
+
+            if seed is not None:
+                arguments["seed"] = seed
 
             logger.info(f"Используется модель: {model}")
             logger.info(f"Параметры: {arguments}")
 
-            # Асинхронный вызов FAL API
-            result = await asyncio.to_thread(
-                fal_client.subscribe,
-                model,
-                arguments=arguments,
-                with_logs=True
-            )
+            # Ключ - модель и аргументы запроса к FAL (они полностью определяют
+            # результат) в текущем поколении кэша, как в backend
+            cache_key = None
+            if use_cache:
+                cache_key = fal_result_cache.key(model, arguments)
+                cached = fal_result_cache.get(cache_key)
+                if cached:
+                    logger.info(f"Результат генерации взят из кэша: {cache_key[:16]}")
+                    return cached, True
+
+            # Очередь FAL: submit -> status -> result
+            result = await fal_queue.run_queued(model, arguments)
 
             # Извлекаем URL сгенерированных изображений
             if result and "images" in result:
                 image_urls = [img["url"] for img in result["images"]]
                 logger.info(f"Успешно сгенерировано {len(image_urls)} изображений")
-                return image_urls
+                if cache_key and image_urls:
+                    fal_result_cache.set(cache_key, image_urls)
+                return image_urls, False
             else:
                 logger.error("Не удалось получить изображения из ответа FAL API")
-                return []
+                return [], False
 
         except Exception as e:
             logger.error(f"Ошибка при генерации изображения: {e}")
             raise
 
+    @staticmethod
+    async def upload_bytes_to_fal(file_bytes: bytes, content_type: str = "image/jpeg", *cache_keys: str) -> str:
+        """
+        Загрузка изображения из памяти в FAL storage, возвращает URL.
+        Уже загруженное содержимое (по sha256) берётся из кэша загрузок;
+        cache_keys - дополнительные ключи кэша для этого файла (file_unique_id).
+        """
+        hash_key = upload_cache.hash_key(hashlib.sha256(file_bytes).hexdigest())
+        url = upload_cache.get(hash_key)
+        if url:
+            upload_cache.alias(hash_key, *cache_keys)
+            logger.info(f"Изображение уже загружено: {url}")
+            return url
+
+        try:
+            # Асинхронный клиент, без потока; срок хранения задаём явно, кэш истекает раньше
+            url = await fal_client.upload_async(
+                file_bytes,
+                content_type,
+                lifecycle=fal_client.StorageSettings(expires_in=FAL_UPLOAD_TTL_SECONDS),
+            )
+            logger.info(f"Изображение загружено: {url}")
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке изображения в FAL: {e}")
+            raise
+        upload_cache.set(url, hash_key, *cache_keys)
+        return url
+
     @staticmethod
     async def upload_image_to_fal(image_path: str) -> str:
         """
@@ -128,19 +197,39 @@ class FALService:
         Returns:
             URL загруженного изображения
         """
-        try:
-            # Читаем файл как bytes
-            with open(image_path, "rb") as f:
-                file_bytes = f.read()
+        with open(image_path, "rb") as f:
+            file_bytes = f.read()
+        return await FALService.upload_bytes_to_fal(file_bytes)
 
-            # Загружаем bytes в FAL
-            url = await asyncio.to_thread(
-                fal_client.upload,
-                file_bytes,
-                "image/jpeg"
-            )
-            logger.info(f"Изображение загружено: {url}")
+    @staticmethod
+    async def upload_telegram_photo(bot: Bot, photo: PhotoSize) -> str:
+        """
+        Скачать фото из Telegram в буфер в памяти и загрузить в FAL storage.
+        Фото, присланное повторно (тот же file_unique_id), берётся из кэша без обращения к сети.
+        """
+        file_key = upload_cache.file_key(photo.file_unique_id)
+        url = upload_cache.get(file_key)
+        if url:
             return url
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке изображения в FAL: {e}")
-            raise
+        async with _upload_slots:
+            buffer = await bot.download(photo, destination=BytesIO())
+            return await FALService.upload_bytes_to_fal(buffer.getvalue(), "image/jpeg", file_key)
+
+    @staticmethod
+    async def upload_telegram_photos(bot: Bot, photos: List[PhotoSize]) -> List[str]:
+        """
+        Загрузить фото (например, альбом) параллельно, не больше
+        FAL_UPLOAD_CONCURRENCY одновременно. URL возвращаются в порядке фото;
+        не загрузившиеся фото пропускаются, если не загрузилось ни одно - ошибка.
+        """
+        results = await asyncio.gather(
+            *(FALService.upload_telegram_photo(bot, photo) for photo in photos),
+            return_exceptions=True,
+        )
+        urls = [r for r in results if isinstance(r, str)]
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors and not urls:
+            raise errors[0]
+        for error in errors:
+            logger.error(f"Фото не загружено в FAL: {error}")
+        return urls
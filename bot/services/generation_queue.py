@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+from collections import Counter, deque
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько генераций бот ведёт одновременно (все модели вместе)
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "50"))
+# Сколько заданий одного пользователя выполняется одновременно: остальные ждут своей очереди
+GENERATION_PER_USER_LIMIT = int(os.getenv("GENERATION_PER_USER_LIMIT", "2"))
+# Лимиты одновременных заданий по моделям FAL: "fal-ai/nano-banana=30,fal-ai/flux-pro/v1.1-ultra=10"
+GENERATION_MODEL_LIMITS = os.getenv("GENERATION_MODEL_LIMITS", "")
+GENERATION_DEFAULT_MODEL_LIMIT = int(os.getenv("GENERATION_DEFAULT_MODEL_LIMIT", "20"))
+
+
+def parse_model_limits(value: str) -> dict:
+    """'model=N,model2=M' -> {"model": N, "model2": M}; некорректные пары пропускаются"""
+    limits = {}
+    for item in value.split(","):
+        model, _, limit = item.strip().rpartition("=")
+        if model and limit.strip().isdigit():
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+class GenerationQueue:
+    """
+    Пул воркеров для заданий генерации.
+
+    Задания каждого пользователя идут по порядку, а пользователи обслуживаются
+    по кругу: один пользователь с десятком заданий не занимает все воркеры.
+    Кроме общего числа воркеров ограничено число одновременных заданий на модель.
+    Сами задания хранит backend: при старте незавершённые задания загружаются
+    через resume() и выполняются заново.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[dict], Awaitable[None]],
+        resume: Optional[Callable[[], Awaitable[list]]] = None,
+        workers: int = GENERATION_WORKERS,
+        per_user_limit: int = GENERATION_PER_USER_LIMIT,
+        model_limits: Optional[dict] = None,
+        default_model_limit: int = GENERATION_DEFAULT_MODEL_LIMIT,
+        model_of: Optional[Callable[[dict], Optional[str]]] = None,
+    ):
+        self.run = run
+        # Модель задания для лимита; по умолчанию - выбранная пользователем model_id
+        self.model_of = model_of or (lambda job: job.get("model_id"))
+        self.resume = resume
+        self.workers = max(1, workers)
+        self.per_user_limit = max(1, per_user_limit)
+        self.model_limits = parse_model_limits(GENERATION_MODEL_LIMITS) if model_limits is None else model_limits
+        self.default_model_limit = max(1, default_model_limit)
+
+        self._pending: dict = {}  # tg_id -> deque заданий
+        self._rotation: deque = deque()  # tg_id с ожидающими заданиями, порядок обхода
+        self._running_users: Counter = Counter()
+        self._running_models: Counter = Counter()
+        self._job_ids: set = set()  # в очереди или в работе: повторный submit игнорируется
+        self._tasks: set = set()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def model_limit(self, model_id: Optional[str]) -> int:
+        return self.model_limits.get(model_id, self.default_model_limit)
+
+    def submit(self, job: dict) -> bool:
+        """Поставить задание в очередь; False, если оно уже в очереди или выполняется"""
+        if job["id"] in self._job_ids:
+            return False
+        self._job_ids.add(job["id"])
+
+        tg_id = job["tg_id"]
+        if tg_id not in self._pending:
+            self._pending[tg_id] = deque()
+            self._rotation.append(tg_id)
+        self._pending[tg_id].append(job)
+        self._wakeup.set()
+        return True
+
+    def _next_job(self) -> Optional[dict]:
+        """Следующее задание по кругу пользователей с учётом лимитов, или None"""
+        if len(self._tasks) >= self.workers:
+            return None
+        for _ in range(len(self._rotation)):
+            tg_id = self._rotation[0]
+            # Пользователь уходит в конец круга, даже если его задание пока ждёт
+            self._rotation.rotate(-1)
+            jobs = self._pending[tg_id]
+            model_id = self.model_of(jobs[0])
+            if self._running_users[tg_id] >= self.per_user_limit:
+                continue
+            if self._running_models[model_id] >= self.model_limit(model_id):
+                continue
+
+            job = jobs.popleft()
+            if not jobs:
+                del self._pending[tg_id]
+                self._rotation.pop()
+            return job
+        return None
+
+    async def _dispatch(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                # Ждём нового задания или освобождения воркера
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            self._running_users[job["tg_id"]] += 1
+            self._running_models[self.model_of(job)] += 1
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+
+    async def _execute(self, job: dict):
+        try:
+            await self.run(job)
+        except Exception as e:
+            logger.exception(f"Задание генерации {job['id']} завершилось с ошибкой: {e}")
+        finally:
+            for counter, key in ((self._running_users, job["tg_id"]), (self._running_models, self.model_of(job))):
+                counter[key] -= 1
+                if counter[key] <= 0:
+                    del counter[key]
+            self._job_ids.discard(job["id"])
+            self._tasks.discard(asyncio.current_task())
+            self._wakeup.set()
+
+    async def start(self):
+        """Запустить диспетчер и вернуть в очередь задания, прерванные перезапуском"""
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        if not self.resume:
+            return
+        try:
+            jobs = await self.resume()
+        except Exception as e:
+            logger.error(f"Не удалось загрузить незавершённые задания генерации: {e}")
+            return
+        resumed = sum(self.submit(job) for job in jobs)
+        if resumed:
+            logger.info(f"Продолжено заданий генерации после перезапуска: {resumed}")
+
+    async def stop(self):
+        """
+        Остановить диспетчер и прервать выполняющиеся задания: в backend они
+        остаются незавершёнными и будут выполнены после следующего запуска.
+        """
+        tasks = [t for t in (self._dispatcher, *self._tasks) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+
+    def snapshot(self) -> dict:
+        """Состояние очереди для метрик"""
+        return {
+            "queued": sum(len(jobs) for jobs in self._pending.values()),
+            "running": len(self._tasks),
+            "users_waiting": len(self._rotation),
+            "running_by_model": dict(self._running_models),
+        }
@@ -71,9 +71,8 @@ class PromptGeneratorService:
 
     @classmethod
     async def _get_system_prompt(cls) -> str:
-        if cls._system_prompt_cache:
-            return cls._system_prompt_cache
-
+        # Настройки запрашиваются с If-None-Match: пока промпт не менялся,
+        # backend отвечает 304 без тела, а правки из админки видны сразу
         try:
             data = await settings_api.get_admin_settings()
             prompt = data.get("prompt_generator_prompt")
@@ -83,8 +82,8 @@ class PromptGeneratorService:
         except Exception as exc:
             logger.warning(f"Не удалось получить промпт генератора из админки: {exc}")
 
-        cls._system_prompt_cache = SYSTEM_PROMPT
-        return SYSTEM_PROMPT
+        # Backend недоступен - последний полученный промпт или встроенный
+        return cls._system_prompt_cache or SYSTEM_PROMPT
 
     @classmethod
     async def generate_prompt_from_images(
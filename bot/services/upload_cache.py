@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Файл кэша на общем томе /app/data: переживает перезапуск бота
+FAL_UPLOAD_CACHE_PATH = os.getenv("FAL_UPLOAD_CACHE_PATH", "/app/data/fal_upload_cache.json")
+FAL_UPLOAD_CACHE_SIZE = int(os.getenv("FAL_UPLOAD_CACHE_SIZE", "5000"))
+# Сколько FAL хранит загруженные файлы (передаётся в lifecycle при загрузке)
+FAL_UPLOAD_TTL_SECONDS = int(os.getenv("FAL_UPLOAD_TTL_SECONDS", str(7 * 24 * 3600)))
+# Запись кэша истекает раньше файла: выданный из кэша URL должен дожить
+# до конца генерации и правок
+FAL_UPLOAD_CACHE_MARGIN = int(os.getenv("FAL_UPLOAD_CACHE_MARGIN", str(24 * 3600)))
+# Изменения пишутся на диск пачкой, не чаще раза в столько секунд
+FAL_UPLOAD_CACHE_SAVE_DELAY = float(os.getenv("FAL_UPLOAD_CACHE_SAVE_DELAY", "5"))
+
+
+class UploadCache:
+    """
+    Кэш загрузок в FAL storage: file_unique_id Telegram или sha256 содержимого -> URL.
+
+    Повторно присланное фото (тот же file_unique_id) берётся из кэша без
+    скачивания из Telegram и загрузки в FAL; то же содержимое под другим
+    file_unique_id - после скачивания, но без повторной загрузки.
+    Записи истекают раньше файлов в FAL, при переполнении вытесняются
+    давно не использованные (LRU). Кэш хранится в JSON-файле.
+    """
+
+    def __init__(
+        self,
+        path: str = FAL_UPLOAD_CACHE_PATH,
+        maxsize: int = FAL_UPLOAD_CACHE_SIZE,
+        ttl: float = FAL_UPLOAD_TTL_SECONDS - FAL_UPLOAD_CACHE_MARGIN,
+        save_delay: float = FAL_UPLOAD_CACHE_SAVE_DELAY,
+    ):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = max(0.0, ttl)
+        self.save_delay = save_delay
+        self._data: OrderedDict = OrderedDict()  # ключ -> (expires_at, url), от старых к новым
+        self._loaded = False
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def file_key(file_unique_id: str) -> str:
+        return f"tg:{file_unique_id}"
+
+    @staticmethod
+    def hash_key(digest: str) -> str:
+        return f"sha256:{digest}"
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Кэш загрузок FAL не прочитан ({self.path}): {e}")
+            return
+
+        now = time.time()
+        for key, expires_at, url in entries:
+            if expires_at > now:
+                self._data[key] = (expires_at, url)
+        self._trim()
+
+    def _trim(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """URL по ключу или None, если записи нет или она истекла"""
+        self._load()
+        item = self._data.get(key)
+        if item and item[0] > time.time():
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+        if item:
+            del self._data[key]
+            self._schedule_save()
+        self.misses += 1
+        return None
+
+    def set(self, url: str, *keys: Optional[str]):
+        """Запомнить свежезагруженный URL под всеми ключами"""
+        self._load()
+        expires_at = time.time() + self.ttl
+        for key in filter(None, keys):
+            self._data[key] = (expires_at, url)
+            self._data.move_to_end(key)
+        self._trim()
+        self._schedule_save()
+
+    def alias(self, source_key: str, *keys: Optional[str]):
+        """Добавить ключи к существующей записи, сохранив её срок жизни"""
+        item = self._data.get(source_key)
+        if not item:
+            return
+        for key in filter(None, keys):
+            self._data[key] = item
+            self._data.move_to_end(key)
+        self._trim()
+        self._schedule_save()
+
+    def _schedule_save(self):
+        self._dirty = True
+        if self._save_task and not self._save_task.done():
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+        except RuntimeError:
+            # Вне event loop (скрипты) - сохраняем сразу
+            self._write(self._snapshot())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        await self._save()
+
+    def _snapshot(self) -> list:
+        self._dirty = False
+        return [[key, expires_at, url] for key, (expires_at, url) in self._data.items()]
+
+    async def _save(self):
+        try:
+            await asyncio.to_thread(self._write, self._snapshot())
+        except OSError as e:
+            self._dirty = True
+            logger.warning(f"Кэш загрузок FAL не сохранён ({self.path}): {e}")
+
+    def _write(self, entries: list):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    async def flush(self):
+        """Записать несохранённые изменения (при остановке бота)"""
+        if self._save_task and not self._save_task.done():
+            self._save_task.cancel()
+        self._save_task = None
+        if self._dirty:
+            await self._save()
+
+    def __len__(self):
+        self._load()
+        return len(self._data)
+
+
+upload_cache = UploadCache()
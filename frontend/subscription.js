@@ -12,16 +12,43 @@ document.addEventListener('DOMContentLoaded', () => {
   loadSubscriptions();
 });
 
-// 📡 Загрузка всех активных подписок
+// 📡 Загрузка всех подписок потоком (NDJSON): строки таблицы появляются по мере получения
 async function loadSubscriptions() {
+  const tbody = document.querySelector("#subsTable tbody");
+  allSubs = [];
+  tbody.innerHTML = "";
+
   try {
-    const res = await authFetch(API_SUBS);
+    const res = await authFetch(`${API_SUBS}?format=ndjson`);
     if (!res.ok) throw new Error(`Ошибка: ${res.status}`);
-    allSubs = await res.json();
-    renderTable(allSubs);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split("\n");
+      buffer = lines.pop();
+
+      const batch = lines.filter(line => line.trim()).map(line => JSON.parse(line));
+      allSubs.push(...batch);
+      appendRows(tbody, batch);
+    }
+
+    if (buffer.trim()) {
+      const last = JSON.parse(buffer);
+      allSubs.push(last);
+      appendRows(tbody, [last]);
+    }
+
+    if (allSubs.length === 0) renderTable(allSubs);
   } catch (err) {
     console.error("Ошибка загрузки подписок:", err);
-    document.querySelector("#subsTable tbody").innerHTML = `
+    tbody.innerHTML = `
       <tr><td colspan="8">❌ Ошибка загрузки подписок</td></tr>
     `;
   }
@@ -37,6 +64,13 @@ function renderTable(data) {
     return;
   }
 
+  appendRows(tbody, data);
+}
+
+// ➕ Добавление строк в таблицу (одной вставкой на пачку)
+function appendRows(tbody, data) {
+  const fragment = document.createDocumentFragment();
+
   data.forEach(item => {
     const row = document.createElement("tr");
 
@@ -63,8 +97,10 @@ function renderTable(data) {
       </td>
     `;
 
-    tbody.appendChild(row);
+    fragment.appendChild(row);
   });
+
+  tbody.appendChild(fragment);
 }
 
 // 🔍 Поиск по названию файла
@@ -77,11 +113,27 @@ document.getElementById("searchFile").addEventListener("input", e => {
 });
 
 // 📢 Рассылка сообщений
+async function uploadBroadcastMedia(file) {
+  const form = new FormData();
+  form.append('file', file);
+  // Без authFetch: Content-Type с boundary для FormData выставляет браузер
+  const response = await fetch(`${API_ADMIN}/broadcast/media`, {
+    method: 'POST',
+    headers: { 'Authorization': `Bearer ${getToken()}` },
+    body: form
+  });
+  if (!response.ok) {
+    throw new Error('Ошибка загрузки файла: ' + await response.text());
+  }
+  return response.json();
+}
+
 async function sendBroadcast() {
   const message = document.getElementById('broadcastMessage').value;
   const audience = document.getElementById('broadcastAudience').value;
+  const files = Array.from(document.getElementById('broadcastMedia').files);
 
-  if (!message.trim()) {
+  if (!message.trim() && !files.length) {
     showMessage('Введите текст сообщения', 'error');
     return;
   }
@@ -91,6 +143,11 @@ async function sendBroadcast() {
   }
 
   try {
+    const media = [];
+    for (const file of files) {
+      media.push(await uploadBroadcastMedia(file));
+    }
+
     const response = await authFetch(`${API_ADMIN}/broadcast/send`, {
       method: 'POST',
       headers: {
@@ -98,7 +155,8 @@ async function sendBroadcast() {
       },
       body: JSON.stringify({
         message: message,
-        target: audience  // Используем target вместо audience
+        target: audience,  // Используем target вместо audience
+        media: media.length ? media : null
       })
     });
 
@@ -109,14 +167,40 @@ async function sendBroadcast() {
     }
 
     const result = await response.json();
-    const sentCount = result.sent_count || result.total_users || 0;
-    showMessage(`Рассылка отправлена! Получатели: ${sentCount}`, 'success');
+    showMessage(`Рассылка запущена. Получатели: ${result.total_users || 0}`, 'success');
     document.getElementById('broadcastMessage').value = '';
+    document.getElementById('broadcastMedia').value = '';
+    if (result.job_id) {
+      pollBroadcastProgress(result.job_id);
+    }
   } catch (error) {
     showMessage('Ошибка: ' + error.message, 'error');
   }
 }
 
+// 📊 Прогресс рассылки (опрос, пока задание не завершится)
+async function pollBroadcastProgress(jobId) {
+  try {
+    const response = await authFetch(`${API_ADMIN}/broadcast/jobs/${jobId}`);
+    if (!response.ok) return;
+    const job = await response.json();
+
+    if (job.status === 'completed') {
+      showMessage(`Рассылка завершена: отправлено ${job.sent}, ошибок ${job.failed}`, 'success');
+      return;
+    }
+    if (job.status === 'failed') {
+      showMessage(`Рассылка прервана: ${job.error || 'ошибка'} (отправлено ${job.sent})`, 'error');
+      return;
+    }
+
+    showMessage(`Рассылка: отправлено ${job.sent}, ошибок ${job.failed}, осталось ${job.remaining}`, 'success');
+    setTimeout(() => pollBroadcastProgress(jobId), 2000);
+  } catch (error) {
+    console.error('Ошибка получения прогресса рассылки:', error);
+  }
+}
+
 // 🔧 Открыть модальное окно продления
 function openExtendModal(subId) {
   currentSubId = subId;